@@ -1,118 +1,60 @@
-from yaml import load, dump, SafeLoader, SafeDumper
-import numpy as np
 from pathlib import Path
 import pandas as pd
-import imageio.v2 as iio
+from results_store import read_index, rebuild_index, link_or_copy
 
-def construct_info_dict():
+def construct_info_dict(index_path=Path("circular_data_exper/analysis/outputs/results_index.sqlite")):
     """
-    This function reads results from output folders and constructs a dictionary containing all the information in a canonical format.
-    This is saved as a CSV and the regression images are saved to the regression_pics folder.
-    
-    Args:
-
-        None
-    
-    Returns:
-    
-        a CSV file containing the results of the experiment
-        
-    """
-    input_path = Path("circular_data_exper/analysis/outputs")
-
-    # Creating the skeleton of the dataframes
-    column_list = ["Partial Circle and its Regression Line", "$0^{\circ}$ Rotation", "$5^{\circ}$ Rotation", "$15^{\circ}$ Rotation", "$30^{\circ}$ Rotation", "$60^{\circ}$ Rotation", "$90^{\circ}$ Rotation"]
-    df_3_subsets = pd.DataFrame(columns=column_list)
-    df_4_subsets = pd.DataFrame(columns=column_list)
-    df_5_subsets = pd.DataFrame(columns=column_list)
-    df_0_subsets = pd.DataFrame(columns=column_list)
-
-    # Iterating over the output folders
-    for i, output_folder in enumerate([p for p in input_path.glob("*")]):
-        results_path = output_folder / "results.yaml"
-        metadata_path = output_folder / "metadata.yaml"
-        image_path = output_folder / "regression.png"
-        with open(results_path, "r") as f:
-            results = load(f, SafeLoader)
-            
-        with open(metadata_path, "r") as f:
-            metadata = load(f, SafeLoader)
-        
-        regression_pic = iio.imread(image_path)
-
-        # Extracting the relevant information from the metadata
-        input_data_str = metadata["input_data"]
-        splitted = input_data_str.split("_")
-        n_subsets = splitted[1].split("-")[0]
-        combo = splitted[2].split("-")[0]
-        rot = splitted[3].split("-")[0]
-        
-        # Examining if the results of all the OLS implementations are the same
-        MAE = []
-        for key in results.keys():
-            MAE.append(results[key]["MAE"])
-        MAE_av = round(np.mean(np.array(MAE)),3)
-        MAE_std = np.std(np.array(MAE))
-        if MAE_std > 0.0001:
-            print("std too high")
-        
-        # Creating the path to store the images of the data and regression lines
-        p = Path("circular_data_exper/analysis/regression_pics")
-        p.mkdir(exist_ok=True, parents=True)
+    This function reads results from the results index written by run_lin_reg.py and constructs a table per number of subsets
+    containing all the information in a canonical format. These are saved as CSVs and the regression images are linked into
+    the regression_pics folder.
 
-        # Adding the results to the relevant dataframe
-        if n_subsets == '3':
-            if combo in list(df_3_subsets.index):
-                df_3_subsets.loc[combo, f"${rot}^{{\circ}}$ Rotation"] = MAE_av
-            else:
-                row = {f"${rot}^{{\circ}}$ Rotation": MAE_av}
-                df_3_subsets = pd.concat([df_3_subsets, pd.DataFrame(row,index=[combo])])
-            
-            # Saving the regression image for every set of data with 0 degree rotation
-            if rot == '0':
-                iio.imwrite(f"circular_data_exper/analysis/regression_pics/{n_subsets}-subsets_{combo}-combo.png", regression_pic)
-                df_3_subsets.loc[combo, "Partial Circle and its Regression Line"] = f"{n_subsets}-subsets_{combo}-combo.png"
-
-        if n_subsets == '4':
-            if combo in list(df_4_subsets.index):
-                df_4_subsets.loc[combo, f"${rot}^{{\circ}}$ Rotation"] = MAE_av
-            else:
-                row = {f"${rot}^{{\circ}}$ Rotation": MAE_av}
-                df_4_subsets = pd.concat([df_4_subsets, pd.DataFrame(row,index=[combo])])
-
-            # Saving the regression image for every set of data with 0 degree rotation
-            if rot == '0':
-                iio.imwrite(f"circular_data_exper/analysis/regression_pics/{n_subsets}-subsets_{combo}-combo.png", regression_pic)
-                df_4_subsets.loc[combo, "Partial Circle and its Regression Line"] = f"{n_subsets}-subsets_{combo}-combo.png"
+    Args:
 
-        if n_subsets == '5':
-            if combo in list(df_5_subsets.index):
-                df_5_subsets.loc[combo, f"${rot}^{{\circ}}$ Rotation"] = MAE_av
-            else:
-                row = {f"${rot}^{{\circ}}$ Rotation": MAE_av}
-                df_5_subsets = pd.concat([df_5_subsets, pd.DataFrame(row,index=[combo])])
+        index_path (Path): path to the results index, it is rebuilt from the output folders if it does not exist
 
-            # Saving the regression image for every set of data with 0 degree rotation
-            if rot == '0':
-                iio.imwrite(f"circular_data_exper/analysis/regression_pics/{n_subsets}-subsets_{combo}-combo.png", regression_pic)
-                df_5_subsets.loc[combo, "Partial Circle and its Regression Line"] = f"{n_subsets}-subsets_{combo}-combo.png"
+    Returns:
 
-        if n_subsets == '0':
-            row = {f"${rot}^{{\circ}}$ Rotation": MAE_av for rot in [0, 5, 15, 30, 60, 90]}
-            df_0_subsets = pd.concat([df_0_subsets, pd.DataFrame(row,index=[combo])])
+        a CSV file containing the results of the experiment
 
-            # Saving the regression image for every set of data with 0 degree rotation
-            if rot == '0':
-                iio.imwrite(f"circular_data_exper/analysis/regression_pics/{n_subsets}-subsets_{combo}-combo.png", regression_pic)
-                df_0_subsets.loc[combo, "Partial Circle and its Regression Line"] = f"{n_subsets}-subsets_{combo}-combo.png"            
+    """
+    if not index_path.exists():
+        rebuild_index(index_path.parent, index_path)
+
+    runs = read_index(index_path)
+
+    # Examining if the results of all the OLS implementations are the same
+    per_run = runs.groupby(["run_number", "n_subsets", "combo", "rotation", "output_folder"]).MAE.agg(["mean", "std"]).reset_index()
+    if (per_run["std"].fillna(0) > 0.0001).any():
+        print("std too high")
+
+    # A data file that was run more than once keeps its latest result
+    per_run = per_run.sort_values("run_number").drop_duplicates(["n_subsets", "combo", "rotation"], keep="last")
+    per_run["mean"] = per_run["mean"].round(3)
+
+    # The full circle looks the same at every rotation, so its single run fills every rotation column
+    rotations = sorted(runs.rotation.unique())
+    full_circle = per_run[per_run.n_subsets == 0]
+    per_run = pd.concat([per_run[per_run.n_subsets != 0]] + [full_circle.assign(rotation=rot) for rot in rotations])
+
+    table = per_run.pivot_table(index=["n_subsets", "combo"], columns="rotation", values="mean")
+    table.columns = [f"${rot:g}^{{\\circ}}$ Rotation" for rot in table.columns]
+
+    # Linking the regression image for every set of data with 0 degree rotation
+    p = Path("circular_data_exper/analysis/regression_pics")
+    p.mkdir(exist_ok=True, parents=True)
+    pics = per_run[per_run.rotation == 0].copy()
+    pics["image_path"] = pics.output_folder.map(lambda folder: Path(folder) / "regression.png")
+    pics = pics[pics.image_path.map(Path.exists)]
+    pics["pic_name"] = pics.n_subsets.astype(str) + "-subsets_" + pics.combo + "-combo.png"
+    for src, name in zip(pics.image_path, pics.pic_name):
+        link_or_copy(src, p / name)
+    table.insert(0, "Partial Circle and its Regression Line", pics.set_index(["n_subsets", "combo"]).pic_name)
 
     # Saving the dataframes to csv files
     final_results = Path("circular_data_exper/analysis/final_results")
     final_results.mkdir(exist_ok=True, parents=True)
-    for df, name in [(df_0_subsets, "0-subsets"), (df_3_subsets, "3-subsets"), (df_4_subsets, "4-subsets"), (df_5_subsets, "5-subsets")]:
-        df.to_csv(f"circular_data_exper/analysis/final_results/{name}.csv", index=False)
-
-    pass
+    for n_subsets, df in table.groupby(level="n_subsets"):
+        df.to_csv(final_results / f"{n_subsets}-subsets.csv", index=False)
 
 if __name__ == "__main__":
     construct_info_dict()
@@ -0,0 +1,237 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from results_store import read_index, rebuild_index, load_results
+
+
+@lru_cache(maxsize=None)
+def set_figure_style(vis_theme: str = "whitegrid"):
+    """
+    This function configures matplotlib and seaborn for the regression figures. It is cached so that the styling is
+    only applied once per process, which matters when many figures are rendered by the same worker.
+
+    Args:
+
+        vis_theme (str): "whitegrid" by default, or specify any one of the below options
+                        options - "darkgrid" ::: "whitegrid" ::: "dark" ::: "white" ::: "ticks"
+
+    Returns:
+
+        None
+    """
+
+    SMALL_SIZE = 10
+    MEDIUM_SIZE = 14
+    BIGGER_SIZE = 18
+    CHONK_SIZE = 24
+    plt.rcParams["font.family"] = "Times New Roman"
+    plt.rc('axes', titlesize=BIGGER_SIZE, labelsize=MEDIUM_SIZE, facecolor="xkcd:black")
+    plt.rc('xtick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
+    plt.rc('ytick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
+    plt.rc('legend', fontsize=SMALL_SIZE)    # legend fontsize
+    plt.rc('figure', titlesize=CHONK_SIZE, facecolor="xkcd:white", edgecolor="xkcd:black") #  powder blue
+
+    possible_themes = ["darkgrid", "whitegrid", "dark", "white", "ticks"]
+    assert vis_theme in possible_themes, f"Invalid value passed for vis_theme: {vis_theme}\nSee documentation"
+    sns.set_style(vis_theme, {'font.family':['serif'], 'axes.edgecolor':'black','ytick.left': True})
+
+
+def plot_regression(X: np.ndarray, y: np.ndarray, models: list, output_path: Path):
+    """
+    This function creates a figure depicting the circular data and its regression lines and saves it to output_path.
+    set_figure_style must have been called in this process beforehand.
+
+    Args:
+
+        X (np.ndarray): data attributes
+
+        y (np.ndarray): data labels
+
+        models (list): list of model coefficients or LinearModels, one per regressor
+
+        output_path (Path): path of the png to write
+
+    Returns:
+
+        None
+    """
+
+    fig, ax = plt.subplots()
+    ax.ticklabel_format(style = 'plain')
+
+    # Plotting the data points
+    sns.scatterplot(x=X.flatten(), y=y.flatten(), ax=ax, color="blue", edgecolor="blue", s=100)
+
+    # To produce regression line on the interval bounded by -50 and 50
+    X_range = np.linspace(-50, 50, 2)[:, np.newaxis]
+
+    # Plotting the regression line
+    for model in models:
+        line = X_range @ np.asarray(model, dtype=float).reshape(-1, 1)
+        ax.plot(X_range.flatten(), line.flatten(), color='black', alpha = 0.75, linewidth=8)
+
+    # Plotting a thin line over x-axis and y-axis
+    ax.plot([i for i in range(-50,50)], [0 for _ in range(-50,50)], linestyle="dashed", color="gray", alpha=0.5)
+    ax.plot([0 for _ in range(-50,50)], [i for i in range(-50,50)], linestyle="dashed", color="gray", alpha=0.5)
+
+    ax.set_ylim(-12,12)
+    ax.set_xlim(-15,15)
+    ax.grid(False)
+    ax.axis('off')
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
+    ax.set_aspect('equal')
+    fig.savefig(output_path, dpi=300, bbox_inches='tight', pad_inches=0.0)
+
+    plt.close(fig)
+
+
+def collect_render_tasks(input_path: Path, rotations: tuple, data_dir=Path("circular_data_exper/data/raw_data")) -> list:
+    """
+    This function finds the runs whose regression figure is needed, i.e. those whose input data has one of the
+    requested rotations, using the results index, and gathers what is needed to draw them. Runs from before the data
+    path was recorded in metadata.yaml have no input_path in the index, so their data is looked up by file name in
+    data_dir. Runs whose data file can not be found are skipped with a message.
+
+    Args:
+
+        input_path (Path): folder containing the output_N folders and results index of run_lin_reg.py
+
+        rotations (tuple): rotations to render figures for
+
+        data_dir (Path): folder containing the data files of create_data.py
+
+    Returns:
+
+        tasks (list): list of (data_path, models, output_path, n_subsets, combo) tuples
+    """
+
+    index_path = input_path / "results_index.sqlite"
+    if not index_path.exists():
+        rebuild_index(input_path, index_path)
+
+    runs = read_index(index_path)
+    runs = runs[runs.rotation.isin([float(rot) for rot in rotations])].copy()
+    missing = runs.input_path.isna()
+    runs.loc[missing, "input_path"] = [str(data_dir / input_data) for input_data in runs.input_data[missing]]
+
+    tasks = []
+    for (output_folder, data_path, n_subsets, combo), group in runs.groupby(["output_folder", "input_path", "n_subsets", "combo"]):
+        output_folder = Path(output_folder)
+        if not Path(data_path).exists():
+            print(f"Skipping {output_folder}: data file {data_path} not found")
+            continue
+        results = load_results(output_folder / "results.yaml")
+
+        models = [results[reg]["model"] for reg in group.regressor if "model" in results[reg]]
+        tasks.append((data_path, models, output_folder / "regression.png", str(n_subsets), combo))
+
+    return tasks
+
+
+def render_one(task: tuple) -> tuple:
+    """
+    This function renders a single regression figure. It is run inside the worker processes of render_figures.
+
+    Args:
+
+        task (tuple): one element of the list returned by collect_render_tasks
+
+    Returns:
+
+        n_subsets (str), combo (str), output_path (Path)
+    """
+
+    data_path, models, output_path, n_subsets, combo = task
+    data = pd.read_csv(data_path, header=None).values
+    plot_regression(data[:, :-1], data[:, -1], models, output_path)
+
+    return n_subsets, combo, output_path
+
+
+def make_contact_sheets(rendered: list, output_dir: Path):
+    """
+    This function tiles all rendered regression figures with the same number of subsets into one image
+
+    Args:
+
+        rendered (list): list of (n_subsets, combo, image_path) tuples
+
+        output_dir (Path): folder the contact sheets are written to
+
+    Returns:
+
+        None
+    """
+
+    output_dir.mkdir(exist_ok=True, parents=True)
+    for n_subsets in sorted({n for n, _, _ in rendered}):
+        group = sorted((combo, path) for n, combo, path in rendered if n == n_subsets)
+        n_cols = math.ceil(math.sqrt(len(group)))
+        n_rows = math.ceil(len(group) / n_cols)
+
+        fig, axes = plt.subplots(n_rows, n_cols, figsize=(3*n_cols, 3*n_rows), squeeze=False)
+        for ax in axes.flat:
+            ax.axis('off')
+        for ax, (combo, path) in zip(axes.flat, group):
+            ax.imshow(plt.imread(path))
+            ax.set_title(combo, fontsize=10)
+
+        fig.savefig(output_dir / f"{n_subsets}-subsets.png", dpi=150, bbox_inches='tight')
+        plt.close(fig)
+
+
+def render_figures(input_path: Path, rotations=(0,), vis_theme="whitegrid", n_workers=None, contact_sheet=False,
+                   data_dir=Path("circular_data_exper/data/raw_data")) -> list:
+    """
+    This function is the deferred figure stage of the circular data experiment. It draws the regression figure of every
+    output folder whose data has one of the requested rotations, using the model coefficients stored with results.yaml.
+    Figures are rendered in parallel and styling is applied once per worker.
+
+    Args:
+
+        input_path (Path): folder containing the output_N folders of run_lin_reg.py
+
+        rotations (tuple): rotations to render figures for, aggregate_results.py only uses the 0 degree ones
+
+        vis_theme (str): see set_figure_style
+
+        n_workers (int): number of worker processes, None to use every core
+
+        contact_sheet (bool): whether to also tile the figures into one image per number of subsets
+
+        data_dir (Path): folder containing the data files of create_data.py, see collect_render_tasks
+
+    Returns:
+
+        rendered (list): list of (n_subsets, combo, image_path) tuples
+    """
+
+    tasks = collect_render_tasks(input_path, rotations, data_dir)
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=set_figure_style, initargs=(vis_theme,)) as pool:
+        rendered = list(pool.map(render_one, tasks))
+
+    if contact_sheet:
+        make_contact_sheets(rendered, input_path.parent / "contact_sheets")
+
+    return rendered
+
+
+if __name__ == "__main__":
+    rendered = render_figures(
+        input_path = Path("circular_data_exper/analysis/outputs"),
+        rotations = (0,),
+        n_workers = os.cpu_count(),
+        contact_sheet = True,
+    )
+    print(f"Rendered {len(rendered)} figures")
@@ -0,0 +1,241 @@
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from yaml import load, SafeLoader
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from ols_common.model import LinearModel
+
+
+INDEX_COLUMNS = {
+    "run_number": "INTEGER",
+    "output_folder": "TEXT",
+    "input_data": "TEXT",
+    "input_path": "TEXT",
+    "n_subsets": "INTEGER",
+    "combo": "TEXT",
+    "rotation": "REAL",
+    "regressor": "TEXT",
+    "elapsed_time": "REAL",
+    "MAE": "REAL",
+    "MSE": "REAL",
+    "RMSE": "REAL",
+    "R2": "REAL",
+}
+
+
+def parse_input_name(input_data: str) -> tuple[str, str, str]:
+    """
+    This function extracts the number of subsets, the combination and the rotation from a data file name
+    of the form _{n}-subsets_{combo}-combo_{rot}-rot.csv
+
+    Args:
+
+        input_data (str): name of the data file
+
+    Returns:
+
+        n_subsets (str), combo (str), rot (str)
+    """
+
+    splitted = input_data.split("_")
+    n_subsets = splitted[1].split("-")[0]
+    combo = splitted[2].split("-")[0]
+    rot = splitted[3].split("-")[0]
+
+    return n_subsets, combo, rot
+
+
+def connect_index(index_path: Path) -> sqlite3.Connection:
+    """
+    This function opens the results index, creating the table if it does not exist yet.
+
+    Args:
+
+        index_path (Path): path to the sqlite file
+
+    Returns:
+
+        con (sqlite3.Connection): open connection to the index
+    """
+
+    index_path.parent.mkdir(exist_ok=True, parents=True)
+    con = sqlite3.connect(index_path, timeout=60)
+    columns = ", ".join(f'"{name}" {kind}' for name, kind in INDEX_COLUMNS.items())
+    con.execute(f"CREATE TABLE IF NOT EXISTS runs ({columns})")
+
+    return con
+
+
+def append_run(index_path: Path, run_number: int, output_folder: Path, metadata: dict, results_dict: dict):
+    """
+    This function appends one row per regressor of a finished run to the results index. The index is append-only, so
+    runs can write to it concurrently and aggregation never has to open the output folders.
+
+    Args:
+
+        index_path (Path): path to the sqlite file
+
+        run_number (int): number of the run
+
+        output_folder (Path): folder holding the run's yaml files and figure
+
+        metadata (dict): metadata of the run, as written to metadata.yaml
+
+        results_dict (dict): results of the run, as written to results.yaml
+
+    Returns:
+
+        None
+    """
+
+    n_subsets, combo, rot = parse_input_name(metadata["input_data"])
+    rows = [
+        (run_number, str(output_folder), metadata["input_data"], metadata.get("input_path"), int(n_subsets), combo, float(rot),
+         reg, *(float(results[field]) for field in ("elapsed_time", "MAE", "MSE", "RMSE", "R2")))
+        for reg, results in results_dict.items()
+    ]
+
+    con = connect_index(index_path)
+    with con:
+        con.executemany(f"INSERT INTO runs VALUES ({', '.join('?' * len(INDEX_COLUMNS))})", rows)
+    con.close()
+
+
+def read_index(index_path: Path) -> pd.DataFrame:
+    """
+    This function reads the whole results index into a DataFrame
+
+    Args:
+
+        index_path (Path): path to the sqlite file
+
+    Returns:
+
+        runs (pd.DataFrame): one row per (run, regressor)
+    """
+
+    con = connect_index(index_path)
+    runs = pd.read_sql("SELECT * FROM runs", con)
+    con.close()
+
+    return runs
+
+
+def rebuild_index(input_path: Path, index_path: Path):
+    """
+    This function builds the results index from output folders written before the index existed
+
+    Args:
+
+        input_path (Path): folder containing the output_N folders of run_lin_reg.py
+
+        index_path (Path): path to the sqlite file
+
+    Returns:
+
+        None
+    """
+
+    for output_folder in sorted(input_path.glob("output_*")):
+        with open(output_folder / "metadata.yaml", "r") as f:
+            metadata = load(f, SafeLoader)
+
+        results = load_results(output_folder / "results.yaml")
+        run_number = int(output_folder.name.split("_")[-1])
+        append_run(index_path, run_number, output_folder, metadata, results)
+
+
+def to_sidecars(results_dict: dict, output_folder: Path) -> dict:
+    """
+    This function saves every array-valued field of a results dictionary as a .npy file in output_folder and returns a copy
+    of the dictionary in which those fields are replaced by a reference of the form {"npy": file_name}. Writing large
+    arrays through yaml is slow and bloated, so only scalars and references are left for the yaml file. Model artifacts
+    are saved in their binary form as .olsm files and referenced as {"olsm": file_name}.
+
+    Args:
+
+        results_dict (dict): dictionary of the form {regressor: {field: value}}
+
+        output_folder (Path): folder to write the .npy files to
+
+    Returns:
+
+        referenced (dict): copy of results_dict holding only scalars and references
+    """
+
+    referenced = {}
+    for reg, fields in results_dict.items():
+        if not isinstance(fields, dict):
+            referenced[reg] = fields
+            continue
+
+        referenced[reg] = {}
+        for field, value in fields.items():
+            if isinstance(value, LinearModel):
+                file_name = f"{reg}.{field}.olsm"
+                value.save(output_folder / file_name)
+                value = {"olsm": file_name}
+            if hasattr(value, "asnumpy"):
+                value = value.asnumpy()
+            if isinstance(value, np.ndarray) and value.ndim > 0:
+                file_name = f"{reg}.{field}.npy"
+                np.save(output_folder / file_name, value)
+                value = {"npy": file_name}
+            referenced[reg][field] = value
+
+    return referenced
+
+
+def load_results(results_path: Path, mmap=True) -> dict:
+    """
+    This function reads a results.yaml file, loading the .npy and .olsm files it references
+
+    Args:
+
+        results_path (Path): path to the results.yaml file
+
+        mmap (bool): whether to memory-map the arrays instead of reading them into memory
+
+    Returns:
+
+        results (dict): dictionary of the form {regressor: {field: value}}
+    """
+
+    with open(results_path, "r") as f:
+        results = load(f, SafeLoader)
+
+    for fields in results.values():
+        for field, value in fields.items():
+            if isinstance(value, dict) and "npy" in value:
+                fields[field] = np.load(results_path.parent / value["npy"], mmap_mode="r" if mmap else None)
+            elif isinstance(value, dict) and "olsm" in value:
+                fields[field] = LinearModel.load(results_path.parent / value["olsm"])
+
+    return results
+
+
+def link_or_copy(src: Path, dst: Path):
+    """
+    This function hard-links src to dst, falling back to a plain copy when the two are on different file systems
+
+    Args:
+
+        src (Path): existing file
+
+        dst (Path): path of the link, replaced if it exists
+
+    Returns:
+
+        None
+    """
+
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
@@ -1,35 +1,50 @@
 from sklearn import *
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' 
 import tensorflow as tf
 import torch
 import mxnet as mx
 import pyaml
+import sys
 from pathlib import Path
+from render_figures import set_figure_style, plot_regression
+from results_store import append_run, to_sidecars
 from time import perf_counter, process_time
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from ols_common.auto import select_solver
+from ols_common.mixed_precision import fit_mpir
+from ols_common.model import LinearModel, data_fingerprint
+from ols_common.profiling import SolverProfiler
+from ols_common.result_cache import RESULT_CACHE_DIR, cache_get, cache_key, cache_put
+from ols_common.sketch import fit_sketch
+from ols_common.threads import configure_thread_pools
+from ols_common.tsqr import TSQR_SOLVER, fit_tsqr
 
 
 def linreg_pipeline(data_path: str, include_regs="all", split_pcnt=None, random_seed=None, time_type="total", 
-                    vis_theme="whitegrid", output_folder=os.getcwd(), verbose_output=True, want_figs=True) -> dict:
+                    vis_theme="whitegrid", output_folder=os.getcwd(), verbose_output=True, want_figs=True,
+                    result_cache_dir=RESULT_CACHE_DIR, profile=False, n_threads=None, tsqr_workers=None) -> dict:
 
     """
     This function is the main entry point for the linear regression pipeline. It takes in a path to a csv file, then performs
     linear regression using each of the tested OLS implementations. It then produces two yaml files and an image. The 
     first yaml file contains the results of the regression, the second contains the metadata of the run, and the image file is
-    a plot of the results of the regression. These files are saved in an output folder.
+    a plot of the results of the regression. These files are saved in an output folder, and the scores of the run are appended
+    to the results index that aggregate_results.py reads.
     
     Args: 
 
         data_path (str): path to file that can become a pd.DataFrame or np.ndarray with target variable in final column 
                         and no categorical or missing data
         
-        include_regs (str or container): "all" to use all algorithms or a list of desired algorithms to use a subset
+        include_regs (str or container): "all" to use all algorithms, "auto" to use the one predicted to be fastest
+                                        by ols_common.auto.select_solver, or a list of desired algorithms to use a subset
                                         options - "tf-necd" ::: "tf-cod" ::: "pytorch-qrcp" ::: "pytorch-qr" 
                                         ::: "pytorch-svd" ::: "pytorch-svddc" ::: "sklearn-svddc" ::: "mxnet-svddc"
+                                        ::: "scipy-gauss-lsqr" ::: "scipy-srht-lsqr" ::: "scipy-cs-lsqr" ::: "torch-mpir"
+                                        ::: "parallel-tsqr"
             
         split_pcnt (str or float): None to train and test the algorithm over the entirety of the data or a real number from 1 - 100 
                                     to use that percentage of the data as a training set and test on the remainder
@@ -41,6 +56,22 @@ def linreg_pipeline(data_path: str, include_regs="all", split_pcnt=None, random_
                     
         vis_theme (str): "whitegrid" by default, or specify any one of the below options
                         options - "darkgrid" ::: "whitegrid" ::: "dark" ::: "white" ::: "ticks"
+
+        want_figs (bool): whether to draw the regression figure as part of the run, otherwise figures can be rendered
+                        later from the stored coefficients with render_figures.py, as the __main__ block of this script does
+
+        result_cache_dir (Path): folder of the result cache, see ols_common.result_cache, or None to always refit. The
+                        fits are keyed by the hash of the data, the regressor and the split, so a rerun on unchanged
+                        data reuses them. Splits without a random_seed are never cached
+
+        profile (bool): whether to profile every fit, see ols_common.profiling.SolverProfiler. The profiles are saved in a
+                        "profile" folder next to metadata.yaml. Profiling slows the fits down, so a profiled run neither
+                        reads nor writes the result cache
+
+        n_threads (int): threads per BLAS, OpenMP, TensorFlow and PyTorch pool, see ols_common.threads.pin_thread_pools, or None
+                        to leave the pools as the libraries sized them. The pools are recorded in metadata.yaml either way
+
+        tsqr_workers (int): worker processes of parallel-tsqr, see ols_common.tsqr.fit_tsqr, or None to use the available cores
         
     Returns:
 
@@ -49,16 +80,36 @@ def linreg_pipeline(data_path: str, include_regs="all", split_pcnt=None, random_
     """
 
     # Reading and splitting the data into train and test sets
+    thread_pools = configure_thread_pools(n_threads)
     data = pd.read_csv(data_path, header=None).values
     data, fields = data_ingestion(data)
     timer = set_time_type(time_type)
-    reg_names = decide_regressors(include_regs)
     X_train, X_test, y_train, y_test = split_data(data, split_pcnt, random_seed)
-    
-    # Running the regression loop
-    results_dict = regression_loop(X_train, y_train, X_test, timer, reg_names, verbose_output)
+    auto_selection = None
+    if include_regs == "auto":
+        reg_name, auto_selection = select_solver(X_train, decide_regressors("all"))
+        reg_names = [reg_name]
+    else:
+        reg_names = decide_regressors(include_regs)
+    
+    # Running the regression loop for the regressors without cached results
+    profiler = SolverProfiler(profile)
+    cache_dir = result_cache_dir if (split_pcnt is None or random_seed is not None) and not profile else None
+    data_hash = data_fingerprint(data) if cache_dir is not None else None
+    keys = {reg_name: cache_key(data=data_hash, solver=reg_name, split_percent=split_pcnt, seed=random_seed,
+                                precision=str(X_train.dtype), timer=time_type, **({"workers": tsqr_workers} if reg_name == TSQR_SOLVER else {}))
+            for reg_name in reg_names}
+    cached = {reg_name: cache_get(key, cache_dir) for reg_name, key in keys.items()}
+    fitted = regression_loop(X_train, y_train, X_test, timer, [reg_name for reg_name in reg_names if cached[reg_name] is None], profiler,
+                             tsqr_workers)
+    for reg_name, reg_output in fitted.items():
+        cache_put(keys[reg_name], reg_output, cache_dir)
+    results_dict = {reg_name: cached[reg_name] or fitted[reg_name] for reg_name in reg_names}
 
     successful_regs = list(results_dict.keys())
+    if auto_selection:
+        auto_selection["actual_time"] = results_dict[auto_selection["choice"]]["elapsed_time"]
+        print(f"auto selected {auto_selection['choice']}: predicted {auto_selection['predicted_time']:.3g}s, actual {auto_selection['actual_time']:.3g}s")
 
     metric_lst = [
         ("MAE", metrics.mean_absolute_error),
@@ -78,15 +129,21 @@ def linreg_pipeline(data_path: str, include_regs="all", split_pcnt=None, random_
     
     metadata = {
         "input_data": data_path.name,
+        "input_path": str(data_path),
         "completed_regs": successful_regs,
         "split_percent": split_pcnt if split_pcnt else "No train/test split",
         "random_seed": random_seed,
         "timer_method": time_type,
         "dataset_shape": f"{data.shape[0]} x {data.shape[1]}",
+        "thread_pools": thread_pools,
     }
+    if auto_selection:
+        metadata["auto_selection"] = auto_selection
     
     dump_to_yaml(output_folder / "metadata.yaml", metadata, True)
     dump_to_yaml(output_folder / "results.yaml", results_dict, verbose_output)
+    profiler.write(output_folder / "profile")
+    append_run(output_folder.parent / "results_index.sqlite", run_number, output_folder, metadata, results_dict)
     
     return results_dict
     
@@ -187,6 +244,11 @@ def decide_regressors(include_regs: str | list | set | tuple) -> list:
         "pytorch-svddc",
         "sklearn-svddc",
         "mxnet-svddc",
+        "scipy-gauss-lsqr",
+        "scipy-srht-lsqr",
+        "scipy-cs-lsqr",
+        "torch-mpir",
+        "parallel-tsqr",
     ]
     
     if include_regs == "all":
@@ -233,11 +295,12 @@ def split_data(data: np.ndarray, split_pcnt: None | float, seed: int) -> tuple[n
     return X_train, X_test, y_train, y_test
 
 
-def regression_loop(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, timer: object, reg_names: list, verbose_output: bool):
+def regression_loop(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, timer: object, reg_names: list, profiler=None,
+                    tsqr_workers=None):
     """
     This function takes in training and testing data, and performs linear regression using each of the specified
-     OLS implementations. It returns a dictionary of results including the trained model, the time to train the model,
-     and the predictions.
+     OLS implementations. It returns a dictionary of results including the trained model as a LinearModel, the time to
+     train the model, and the predictions.
     
     Args:
     
@@ -250,8 +313,10 @@ def regression_loop(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray
         timer (function): a timer function
         
         reg_names (list): list of regressors to use in the regression loop
-        
-        verbose_output (bool): whether to include the model in the results dictionary
+
+        profiler (SolverProfiler): profiler wrapping the fit and prediction of each regressor, None to not profile
+
+        tsqr_workers (int): worker processes of parallel-tsqr, or None to use the available cores
         
     Returns:
     
@@ -259,53 +324,65 @@ def regression_loop(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray
     """
 
     results_dict = {}
+    fingerprint = data_fingerprint(X_train, y_train)
+    profiler = profiler or SolverProfiler()
         
     for reg_name in reg_names:       
 
-        start_lstsq = timer()
-        match reg_name:
-            case "sklearn-svddc":
-                model = linear_model.LinearRegression(fit_intercept=False).fit(X_train,y_train).coef_
+        with profiler.span(reg_name):
+            start_lstsq = timer()
+            match reg_name:
+                case "sklearn-svddc":
+                    model = linear_model.LinearRegression(fit_intercept=False).fit(X_train,y_train).coef_
 
-            case "tf-necd":
-                model = tf.linalg.lstsq(X_train, y_train[...,np.newaxis], fast=True).numpy()
+                case "tf-necd":
+                    model = tf.linalg.lstsq(X_train, y_train[...,np.newaxis], fast=True).numpy()
                 
-            case "tf-cod":
-                model = tf.linalg.lstsq(X_train, y_train[...,np.newaxis], fast=False).numpy()
+                case "tf-cod":
+                    model = tf.linalg.lstsq(X_train, y_train[...,np.newaxis], fast=False).numpy()
+
+                case "pytorch-qrcp":
+                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gelsy").solution)
 
-            case "pytorch-qrcp":
-                model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gelsy").solution)
+                case "pytorch-qr":
+                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gels").solution)
 
-            case "pytorch-qr":
-                model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gels").solution)
+                case "pytorch-svd":
+                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gelss").solution)
 
-            case "pytorch-svd":
-                model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gelss").solution)
+                case "pytorch-svddc":
+                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gelsd").solution)
 
-            case "pytorch-svddc":
-                model = np.array(torch.linalg.lstsq(torch.Tensor(X_train), torch.Tensor(y_train[...,np.newaxis]), driver="gelsd").solution)
+                case "mxnet-svddc":
+                    model = mx.np.linalg.lstsq(X_train, y_train[...,np.newaxis], rcond=None)[0]
 
-            case "mxnet-svddc":
-                model = mx.np.linalg.lstsq(X_train, y_train[...,np.newaxis], rcond=None)[0]
+                case "scipy-gauss-lsqr" | "scipy-srht-lsqr" | "scipy-cs-lsqr":
+                    model = fit_sketch(reg_name, X_train, y_train)
+
+                case "torch-mpir":
+                    model = fit_mpir(X_train, y_train)[0]
+
+                case "parallel-tsqr":
+                    model = fit_tsqr(X_train, y_train, tsqr_workers)
             
-        pred = X_test @ model 
+            model = LinearModel.from_fit(model, reg_name, fingerprint)
+            pred = model.predict(X_test)
         
-        stop_lstsq = timer()
+            stop_lstsq = timer()
 
         results_dict[reg_name] = {
             "elapsed_time": stop_lstsq - start_lstsq,
-            "y_pred": pred
+            "y_pred": pred,
+            "model": model,
             }
         
-        if verbose_output:
-            results_dict[reg_name]["model"] = model
-        
     return results_dict
 
 
 def dump_to_yaml(path: Path, object: dict, verbose_output = True):
     """
-    This function takes in a dictionary of results and dumps it to a yaml file.
+    This function takes in a dictionary of results and dumps it to a yaml file. Array-valued fields (predictions and
+    models) are written as .npy files next to the yaml file, which only holds scalars and references to them.
     
     Args:
     
@@ -324,14 +401,15 @@ def dump_to_yaml(path: Path, object: dict, verbose_output = True):
             del object[reg]["y_pred"]
     
     with open(path, "w") as f_log:
-        dump = pyaml.dump(object)
+        dump = pyaml.dump(to_sidecars(object, path.parent))
         f_log.write(dump)
 
 
 def generate_figures(results_dict: dict, X_test: np.ndarray, y_test: np.ndarray, vis_theme: str, successful_regs: list,
                       output_folder: Path):
     """
-    This function creates a figure depicting the circular data and its regression line and saves the images in the output folder
+    This function creates a figure depicting the circular data and its regression line and saves the images in the output folder.
+    Rendering figures for every run is slow, so the batch run of this script leaves them to render_figures.py
 
     Args:
 
@@ -352,51 +430,9 @@ def generate_figures(results_dict: dict, X_test: np.ndarray, y_test: np.ndarray,
         None
     """
 
-    # Styling the plots
-    SMALL_SIZE = 10
-    MEDIUM_SIZE = 14
-    BIGGER_SIZE = 18
-    CHONK_SIZE = 24
-    plt.rcParams["font.family"] = "Times New Roman"
-    plt.rc('axes', titlesize=BIGGER_SIZE, labelsize=MEDIUM_SIZE, facecolor="xkcd:black")
-    plt.rc('xtick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
-    plt.rc('ytick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
-    plt.rc('legend', fontsize=SMALL_SIZE)    # legend fontsize
-    plt.rc('figure', titlesize=CHONK_SIZE, facecolor="xkcd:white", edgecolor="xkcd:black") #  powder blue
-        
-    possible_themes = ["darkgrid", "whitegrid", "dark", "white", "ticks"]
-    assert vis_theme in possible_themes, f"Invalid value passed for vis_theme: {vis_theme}\nSee documentation"
-    sns.set_style(vis_theme, {'font.family':['serif'], 'axes.edgecolor':'black','ytick.left': True})
-    plt.ticklabel_format(style = 'plain')
-      
-    fig, ax = plt.subplots()
-
-    # Plotting the data points
-    sns.scatterplot(x=X_test.flatten(), y=y_test.flatten(), ax=ax, color="blue", edgecolor="blue", s=100)
-
-    # To produce regression line on the interval bounded by -50 and 50
-    X_range = np.linspace(-50, 50, 2)[:, np.newaxis]
-
-    # Plotting the regression line
-    reg_lines = [X_range @ results_dict[regressor]["model"] for regressor in successful_regs]
-    for line, regressor in zip(reg_lines, successful_regs):
-        ax.plot(X_range.flatten(), line.flatten(), color='black', alpha = 0.75, linewidth=8)
-    
-    # Plotting a thin line over x-axis and y-axis
-    ax.plot([i for i in range(-50,50)], [0 for _ in range(-50,50)], linestyle="dashed", color="gray", alpha=0.5)
-    ax.plot([0 for _ in range(-50,50)], [i for i in range(-50,50)], linestyle="dashed", color="gray", alpha=0.5)
-
-    ax.set_ylim(-12,12)
-    ax.set_xlim(-15,15)
-    ax.grid(False)
-    plt.axis('off')
-    ax.get_xaxis().set_visible(False)
-    ax.get_yaxis().set_visible(False)
-    ax.set_aspect('equal')
-    plt.savefig(output_folder / f"regression.png", dpi=300, bbox_inches='tight', pad_inches=0.0)
-        
-    plt.clf()
-    plt.close(fig="all")
+    set_figure_style(vis_theme)
+    models = [results_dict[regressor]["model"] for regressor in successful_regs]
+    plot_regression(X_test, y_test, models, output_folder / "regression.png")
 
 
 def get_and_increment_run_counter() -> int:
@@ -461,7 +497,8 @@ if __name__ == "__main__":
             data_path = hyper_path,
             params = {
                 "random_seed": 100,
-                "include_regs": ["sklearn-svddc"]
+                "include_regs": ["sklearn-svddc"],
+                "want_figs": False
             }
         )
     
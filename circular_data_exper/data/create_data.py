@@ -126,6 +126,79 @@ def relevant_powerset(splits: int):
     return list(chain.from_iterable(combinations(s, r) for r in range(int(math.ceil(splits/2)), splits)))
 
 
+def batched_ols(X: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Solves a stack of least squares problems without intercept through their normal equations, matching
+    the regression performed by run_lin_reg.py
+
+    Args:
+
+        X (np.ndarray): array of shape (batch, points, features)
+
+        y (np.ndarray): array of shape (batch, points)
+
+    Returns:
+
+        np.ndarray: the coefficients, of shape (batch, features)
+    """
+
+    gram = np.einsum('bpi,bpj->bij', X, X)
+    moment = np.einsum('bpi,bp->bi', X, y)
+    return np.linalg.solve(gram, moment[..., np.newaxis])[..., 0]
+
+
+def rotation_sweep(axes, angles, n_subset_set, resolution) -> pd.DataFrame:
+    """
+    Evaluates the partial circle regressions at every angle at once. The ellipse is rotated into one
+    (angles x points x 2) array and each subset combination is fit for all angles with one batched OLS,
+    so no per-angle files are written and the regression pipeline is not called
+
+    Args:
+
+        axes (int): the length of the axes of the ellipse
+
+        angles (np.ndarray): the rotations to evaluate, in degrees
+
+        n_subset_set (list): the number of subsets to be used
+
+        resolution (float): the density of points in the ellipse
+
+    Returns:
+
+        pd.DataFrame: one row per (n_subsets, combo, rotation) with the slope and MAE of the regression
+    """
+
+    data = make_data_ellipse(axes, resolution)
+    theta = np.deg2rad(np.asarray(angles, dtype=float))
+    cos, sin = np.cos(theta), np.sin(theta)
+    rot_mats = np.stack([np.stack([cos, -sin], axis=-1), np.stack([sin, cos], axis=-1)], axis=-2)
+    rotated = np.einsum('aij,pj->api', rot_mats, data)
+
+    #the full circle and the same subset indices as main, which do not change with rotation
+    subsets = [(0, 0, np.arange(data.shape[0]))]
+    for n_subset in n_subset_set:
+        r_cnt_in_part = data.shape[0]//n_subset
+        for combo in relevant_powerset(n_subset):
+            idx = np.concatenate([np.arange(c*r_cnt_in_part, (c+1)*r_cnt_in_part) for c in combo])
+            subsets.append((n_subset, combo, idx))
+
+    tables = []
+    for n_subset, combo, idx in subsets:
+        X = rotated[:, idx, :-1]
+        y = rotated[:, idx, -1]
+        coef = batched_ols(X, y)
+        mae = np.abs(y - np.einsum('api,ai->ap', X, coef)).mean(axis=1)
+        tables.append(pd.DataFrame({
+            'n_subsets': n_subset,
+            'combo': str(combo),
+            'rotation': np.asarray(angles, dtype=float),
+            'slope': coef[:, 0],
+            'MAE': mae,
+        }))
+
+    return pd.concat(tables, ignore_index=True)
+
+
 def main(axes, rotation_set, n_subset_set, resolution):
     """
     Creates the data for the circle experiment
@@ -171,4 +244,13 @@ if __name__ == '__main__':
     rotation_set = [0, 5, 15, 30, 60, 90] #5, 15, 30, 60, 90
     n_subset_set = [3] #3,4,5
     resolution = 0.001
-    main(axes,rotation_set, n_subset_set, resolution)
\ No newline at end of file
+    sweep_mode = False #True to evaluate a dense set of rotations instead of writing the csv files
+    sweep_step = 0.5 #degrees between rotations in sweep mode
+
+    if sweep_mode:
+        p = Path('circular_data_exper/analysis/final_results')
+        p.mkdir(exist_ok=True, parents=True)
+        sweep = rotation_sweep(axes, np.arange(0, 360, sweep_step), n_subset_set, resolution)
+        sweep.to_csv(p / 'rotation_sweep.csv', index=False)
+    else:
+        main(axes,rotation_set, n_subset_set, resolution)
\ No newline at end of file
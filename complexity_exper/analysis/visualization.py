@@ -23,6 +23,14 @@ def main(output_dir):
         "pytorch-svd": "PyTorch (SVD)",
         "pytorch-svddc": "PyTorch (SVDDC)",
         "sklearn-svddc": "scikit-learn (SVDDC)",
+        "numpy-cgls": "NumPy (CGLS)",
+        "numpy-necg": "NumPy (NE-CG)",
+        "numpy-sgd": "NumPy (Mini-batch SGD)",
+        "scipy-gauss-lsqr": "SciPy (Gaussian Sketch + LSQR)",
+        "scipy-srht-lsqr": "SciPy (SRHT + LSQR)",
+        "scipy-cs-lsqr": "SciPy (CountSketch + LSQR)",
+        "torch-mpir": "PyTorch (Mixed Precision QR + Refinement)",
+        "parallel-tsqr": "NumPy (Multi-process TSQR)",
     }
 
     label_dict_mem ={
@@ -106,7 +114,7 @@ def main(output_dir):
     rt_figs_path.mkdir(exist_ok=True)
 
     solvers = list(act_rt_df_s.columns)
-    for solver, color in zip(solvers,["red", "darkblue", "darkgreen", "orange", "purple", "mediumvioletred", "slategray"]):
+    for solver, color in zip(solvers,["red", "darkblue", "darkgreen", "orange", "purple", "mediumvioletred", "slategray", "teal", "saddlebrown", "olive", "darkcyan", "sienna", "indigo", "darkgoldenrod", "crimson"]):
         fig, ax = plt.subplots()
         ax.plot(row_counts, act_rt_df_s[solver], label=label_dict_rt[solver]+" - Actual", color=color)
         ax.plot(row_counts, theo_rt_df_s[solver], label=label_dict_rt[solver]+" - Theoretical", color=color, linestyle="dashed")
@@ -129,7 +137,7 @@ def main(output_dir):
     theo_rt_df_ms = theo_rt_df.iloc[:,1:].div(1e6)
 
     solvers = list(act_rt_df_ms.columns)
-    for solver, color in zip(solvers,["red", "darkblue", "darkgreen", "orange", "purple", "mediumvioletred", "slategray"]):
+    for solver, color in zip(solvers,["red", "darkblue", "darkgreen", "orange", "purple", "mediumvioletred", "slategray", "teal", "saddlebrown", "olive", "darkcyan", "sienna", "indigo", "darkgoldenrod", "crimson"]):
         fig, ax = plt.subplots()
         ax.plot(row_counts, act_rt_df_ms[solver], label=label_dict_rt[solver]+" - Actual", color=color)
         ax.plot(row_counts, theo_rt_df_ms[solver], label=label_dict_rt[solver]+" - Theoretical", color=color, linestyle="dashed")
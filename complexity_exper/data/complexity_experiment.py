@@ -5,14 +5,31 @@ Also, there must be a directory called memory_output in the same directory as th
 
 import numpy as np
 import pandas as pd
+import scipy as sp
 from time import perf_counter_ns, process_time_ns
 from sklearn import linear_model
 import tensorflow as tf
 import math
+import sys
 import torch
 from pathlib import Path
 import pyaml
+import yaml
 import memray
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from ols_common.complexity import comp_complexity_dict
+from ols_common.iterative import ITERATIVE_SOLVERS, ITERATIVE_TOL, fit_iterative
+from ols_common.mixed_precision import fit_mpir
+from ols_common.model import data_fingerprint
+from ols_common.profiling import SolverProfiler
+from ols_common.result_cache import RESULT_CACHE_DIR, cache_get, cache_key, cache_put
+from ols_common.sandbox import run_sandboxed
+from ols_common.sharding import find_shards, run_shards, shard_cells, shard_from_env, shard_name
+from ols_common.sketch import SKETCH_SOLVERS, fit_sketch
+from ols_common.threads import configure_thread_pools
+from ols_common.tsqr import TSQR_SOLVER, fit_tsqr, tsqr_lstsq
+
+INCREMENTAL_METHODS = ["gram", "qr"]
 
 
 def get_data_array(rows, cols, seed=100) -> np.array:
@@ -38,10 +55,127 @@ def get_data_array(rows, cols, seed=100) -> np.array:
     return data
 
 
-def actual_expr(X_train: np.array, y_train: np.array, timer: object, reg_names: list, rows_in_expr: list, n_iters_per_row: int) -> dict:
+def time_fit(reg_name: str, X: np.array, y: np.array, timer: object, output_path: Path, tol=ITERATIVE_TOL, tsqr_fit_workers=2) -> tuple:
+    """
+    Times a single fit of one regressor, then fits it a second time under memray to record its memory usage
+
+    Args:
+
+        reg_name (str) - name of the regressor
+
+        X (np.array) - dataset attributes
+
+        y (np.array) - dataset target variable
+
+        timer (timer object) - timer either perf_counter or process time
+
+        output_path (Path) - path of the memray capture file
+
+        tol (float) - tolerance of the iterative regressors
+
+        tsqr_fit_workers (int) - worker processes of parallel-tsqr
+
+    Returns:
+
+        elapsed (int) - runtime of the timed fit
+
+        info (dict) - convergence of the iterative regressors, see ols_common.iterative.fit_iterative, or of the refinement of torch-mpir,
+                      see ols_common.mixed_precision.mpir_lstsq, None for the others
+    """
+    info = None
+    match reg_name:
+        case "sklearn-svddc":
+            start_lstsq = timer()
+            model = linear_model.LinearRegression(fit_intercept=False).fit(X, y).coef_
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = linear_model.LinearRegression(fit_intercept=False).fit(X, y).coef_
+        case "tf-necd":
+            start_lstsq = timer()
+            model = tf.linalg.lstsq(X, y[...,np.newaxis], fast=True).numpy()
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = tf.linalg.lstsq(X, y[...,np.newaxis], fast=True).numpy()
+
+        case "tf-cod":
+            start_lstsq = timer()
+            model = tf.linalg.lstsq(X, y[...,np.newaxis], fast=False).numpy()
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = tf.linalg.lstsq(X, y[...,np.newaxis], fast=False).numpy()
+
+        case "pytorch-qrcp":
+            start_lstsq = timer()
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gelsy").solution)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gelsy").solution)
+
+        case "pytorch-qr":
+            start_lstsq = timer()
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gels").solution)                          
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gels").solution)
+
+        case "pytorch-svd":
+            start_lstsq = timer()
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gelss").solution)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gelss").solution)
+
+        case "pytorch-svddc":
+            start_lstsq = timer()
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gelsd").solution)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = np.array(torch.linalg.lstsq(torch.Tensor(X), torch.Tensor(y[...,np.newaxis]), driver="gelsd").solution)
+
+        case _ if reg_name in SKETCH_SOLVERS:
+            start_lstsq = timer()
+            model = fit_sketch(reg_name, X, y)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = fit_sketch(reg_name, X, y)
+
+        case _ if reg_name in ITERATIVE_SOLVERS:
+            start_lstsq = timer()
+            model, info = fit_iterative(reg_name, X, y, tol, timer=timer)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = fit_iterative(reg_name, X, y, tol, timer=timer)[0]
+
+        case "torch-mpir":
+            start_lstsq = timer()
+            model, info = fit_mpir(X, y, timer=timer)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = fit_mpir(X, y, timer=timer)[0]
+
+        case "parallel-tsqr":
+            # memray only follows this process, not the memory of the workers
+            start_lstsq = timer()
+            model = fit_tsqr(X, y, tsqr_fit_workers)
+            stop_lstsq = timer()
+            with memray.Tracker(output_path, native_traces=True):
+                model2 = fit_tsqr(X, y, tsqr_fit_workers)
+    
+
+        case _:
+            raise ValueError(f"Unknown regressor: {reg_name}")
+
+    return stop_lstsq - start_lstsq, info
+
+
+def actual_expr(X_train: np.array, y_train: np.array, timer: object, reg_names: list, rows_in_expr: list, n_iters_per_row: int, tol=ITERATIVE_TOL,
+                memory_limit=None, timeout=None, profiler=None, cells=None, tsqr_fit_workers=2) -> dict:
     """
     This function will record the runtimes to create a model of each specified regressor using a dataset of varying size. The size of the dataset will vary according to a schedule
-    specified by rows_in_expr parameter. The output will be a dictionary recording these results
+    specified by rows_in_expr parameter. The output will be a dictionary recording these results. The iterative regressors additionally record how they converged
+
+    With a memory_limit or timeout every fit runs in a child process (see ols_common.sandbox.run_sandboxed), so a regressor running out of memory or time is
+    recorded as "OOM" or "timeout" instead of ending the experiment. Its larger row counts are then "skipped", as they would fail the same way
 
     Args:
 
@@ -57,12 +191,37 @@ def actual_expr(X_train: np.array, y_train: np.array, timer: object, reg_names:
 
         n_iters_per_row (int) - number of iterations to run for each row count
 
+        tol (float) - tolerance of the iterative regressors, see ols_common.iterative.fit_iterative
+
+        memory_limit (int) - bytes a fit may allocate on top of the memory of this process, None for no limit
+
+        timeout (float) - seconds a fit may take, None for no limit
+
+        profiler (SolverProfiler) - profiler wrapping every fit under the name of its regressor, None to not profile. Sandboxed fits run in a child process
+                                    and are not profiled
+
+        cells (set) - the (regressor, rows, iteration) fits to run, e.g. the cells of a shard, None for all. The other fits are left out of the results
+
+        tsqr_fit_workers (int) - worker processes of parallel-tsqr
+
     Returns:
 
         results_dict (dict) - dictionary of format {regressor: [list of runtimes for each # of rows specified in rows_in_expr]}
 
+        failed_regs (list) - regressors that failed
+
+        exceptions_lst (list) - the tracebacks or reasons of the failures
+
+        outcomes_dict (dict) - dictionary of format {regressor: [list of (rows, outcome)]} with outcome one of
+                               "ok", "OOM", "timeout", "error", "skipped" or the name of the signal that killed the fit
+
+        convergence_dict (dict) - dictionary of format {iterative regressor: [list of (rows, iterations, time to tolerance, final error)]}
+                                  with the time to tolerance in the units of timer, None if the tolerance was not reached
+
     """
     results_dict = {}
+    convergence_dict = {}
+    outcomes_dict = {}
     failed_regs = []
     exceptions_lst = []
     output_dir = Path() / "complexity_results"
@@ -71,10 +230,14 @@ def actual_expr(X_train: np.array, y_train: np.array, timer: object, reg_names:
         (output_dir / dir).mkdir(exist_ok=True, parents=True)
     memory_dir = output_dir / "raw_data" / "memory_output"
     memory_dir.mkdir(exist_ok=True, parents=True)
+    profiler = profiler or SolverProfiler()
 
 
     for reg_name in reg_names:
         final = []
+        convergence = []
+        outcomes = []
+        exhausted = False
         print(f"Working on: {reg_name}")
         
         # repeating experiment with increasing number of rows
@@ -85,68 +248,200 @@ def actual_expr(X_train: np.array, y_train: np.array, timer: object, reg_names:
             # repeating experiment for each number of rows 'n_iters_per_row' times
             for iter in range(n_iters_per_row):
                 output_path =  memory_dir / f"mem_{reg_name}_{row_count}_{iter}.bin"
+                if cells is not None and (reg_name, row_count, iter) not in cells:
+                    continue
+                if exhausted:
+                    outcomes += [(row_count, "skipped")]
+                    final += [(row_count, None)]
+                    continue
 
-                try:
-                    match reg_name:
-                        case "sklearn-svddc":
-                            start_lstsq = timer()
-                            model = linear_model.LinearRegression(fit_intercept=False).fit(partial_X_train, partial_y_train).coef_
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = linear_model.LinearRegression(fit_intercept=False).fit(partial_X_train, partial_y_train).coef_
-                        case "tf-necd":
-                            start_lstsq = timer()
-                            model = tf.linalg.lstsq(partial_X_train, partial_y_train[...,np.newaxis], fast=True).numpy()
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = tf.linalg.lstsq(partial_X_train, partial_y_train[...,np.newaxis], fast=True).numpy()
-
-                        case "tf-cod":
-                            start_lstsq = timer()
-                            model = tf.linalg.lstsq(partial_X_train, partial_y_train[...,np.newaxis], fast=False).numpy()
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = tf.linalg.lstsq(partial_X_train, partial_y_train[...,np.newaxis], fast=False).numpy()
-
-                        case "pytorch-qrcp":
-                            start_lstsq = timer()
-                            model = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gelsy").solution)
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gelsy").solution)
-
-                        case "pytorch-qr":
-                            start_lstsq = timer()
-                            model = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gels").solution)                          
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gels").solution)
-                                
-                        case "pytorch-svd":
-                            start_lstsq = timer()
-                            model = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gelss").solution)
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gelss").solution)
-
-                        case "pytorch-svddc":
-                            start_lstsq = timer()
-                            model = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gelsd").solution)
-                            stop_lstsq = timer()
-                            with memray.Tracker(output_path, native_traces=True):
-                                model2 = np.array(torch.linalg.lstsq(torch.Tensor(partial_X_train), torch.Tensor(partial_y_train[...,np.newaxis]), driver="gelsd").solution)
-
-                except Exception as e:
+                with profiler.span(reg_name):
+                    status, value, error = run_sandboxed(time_fit, (reg_name, partial_X_train, partial_y_train, timer, output_path, tol, tsqr_fit_workers),
+                                                         memory_limit=memory_limit, timeout=timeout)
+                outcomes += [(row_count, status)]
+                if status != "ok":
+                    print(f"{reg_name} at {row_count} rows: {status}")
                     failed_regs.append(reg_name)
-                    exceptions_lst.append(e)
+                    exceptions_lst.append(error)
                     final += [(row_count, None)]
+                    exhausted = status in ("OOM", "timeout")
                     continue
-                
-                final += [(row_count, stop_lstsq - start_lstsq)] 
+
+                elapsed, info = value
+                if info is not None:
+                    convergence += [(row_count, info["iterations"], info["time_to_tol"], info["final_error"])]
+                final += [(row_count, elapsed)]
 
         results_dict[reg_name] = final   
+        outcomes_dict[reg_name] = outcomes
+        if convergence:
+            convergence_dict[reg_name] = convergence
+
+    return results_dict, failed_regs, exceptions_lst, outcomes_dict, convergence_dict
+
+
+def incremental_update(method: str, state, X_new: np.array, y_new: np.array):
+    """
+    Extends the factorization of a row prefix with the rows that were appended to it
+
+    Args:
+
+        method (str) - "gram" to accumulate X^T X and X^T y, or "qr" to keep the R factor of [X | y], which is updated by
+                        factorizing the old R stacked on the new rows
+
+        state - the value previously returned for the prefix, None to start from no rows
+
+        X_new (np.array) - appended rows of the dataset attributes
+
+        y_new (np.array) - appended rows of the dataset target variable
+
+    Returns:
+
+        state - (gram, moment) for "gram" and the R factor for "qr"
+    """
+    match method:
+        case "gram":
+            gram, moment = state if state is not None else (0, 0)
+            return gram + X_new.T @ X_new, moment + X_new.T @ y_new
+
+        case "qr":
+            block = np.column_stack((X_new, y_new))
+            if state is not None:
+                block = np.vstack((state, block))
+            return np.linalg.qr(block, mode="r")
+
+        case _:
+            raise ValueError(f"method must be one of {INCREMENTAL_METHODS}, not: {method}")
+
+
+def incremental_solve(method: str, state) -> np.array:
+    """
+    Solves the least squares problem of the rows accumulated in state, see incremental_update
+
+    Args:
+
+        method (str) - "gram" or "qr"
+
+        state - as returned by incremental_update
+
+    Returns:
+
+        model (np.array) - the fitted coefficients
+    """
+    match method:
+        case "gram":
+            gram, moment = state
+            return sp.linalg.cho_solve(sp.linalg.cho_factor(gram), moment)
+
+        case "qr":
+            n = state.shape[1] - 1
+            return sp.linalg.solve_triangular(state[:n, :n], state[:n, n])
+
+        case _:
+            raise ValueError(f"method must be one of {INCREMENTAL_METHODS}, not: {method}")
+
+
+def incremental_expr(X_train: np.array, y_train: np.array, timer: object, rows_in_expr: list, n_iters_per_row: int, methods=INCREMENTAL_METHODS) -> dict:
+    """
+    This function will record, for each prefix X_train[:row_count] of the schedule in rows_in_expr, the runtime of a fresh fit of the prefix and the
+    runtime of updating the previous prefix's factorization with only the appended rows. As the prefixes are nested, a sweep of incremental updates costs
+    O(m_max * n^2) in total instead of the sum over all prefixes
+
+    Args:
+
+        X_train (np.array) - array of full dataset attributes
+
+        y_train (np.array) - array of full dataset target variable
+
+        timer (timer object) - timer either perf_counter or process time
 
-    return results_dict, failed_regs, exceptions_lst
+        rows_in_expr (list) - an increasing list of rows that will be used in experiment e.g. [10, 100, 1000, 10000]
+
+        n_iters_per_row (int) - number of times to repeat the sweep
+
+        methods (list) - methods of incremental_update to run
+
+    Returns:
+
+        results_dict (dict) - dictionary of format {"numpy-{method}-fresh" or "numpy-{method}-incremental": [list of (rows, runtime) for each # of rows specified in rows_in_expr]},
+                              where an incremental runtime covers the update with the appended rows and the solve
+    """
+    results_dict = {}
+    for method in methods:
+        print(f"Working on: incremental {method}")
+        fresh, incremental = [], []
+
+        for iter in range(n_iters_per_row):
+            state, prev_rows = None, 0
+            for row_count in rows_in_expr:
+                start_fit = timer()
+                incremental_solve(method, incremental_update(method, None, X_train[:row_count], y_train[:row_count]))
+                stop_fit = timer()
+                fresh += [(row_count, stop_fit - start_fit)]
+
+                start_fit = timer()
+                state = incremental_update(method, state, X_train[prev_rows:row_count], y_train[prev_rows:row_count])
+                incremental_solve(method, state)
+                stop_fit = timer()
+                incremental += [(row_count, stop_fit - start_fit)]
+                prev_rows = row_count
+
+        # same ordering as actual_expr, all repeats of a row count together
+        results_dict[f"numpy-{method}-fresh"] = sorted(fresh, key=lambda pair: pair[0])
+        results_dict[f"numpy-{method}-incremental"] = sorted(incremental, key=lambda pair: pair[0])
+        print(f"Full sweep of {method}: {sum(t for _, t in fresh) / n_iters_per_row:.0f} fresh vs. "
+              f"{sum(t for _, t in incremental) / n_iters_per_row:.0f} incremental")
+
+    return results_dict
+
+
+def tsqr_scaling_expr(X_train: np.array, y_train: np.array, worker_counts: list, n_iters_per_count: int) -> dict:
+    """
+    This function will record the strong and weak scaling of ols_common.tsqr.tsqr_lstsq. Strong scaling fits all the rows of X_train with each number of
+    workers in worker_counts, weak scaling fits a prefix of X_train with a fixed number of rows per worker, chosen so that the largest worker count fits
+    all the rows. The worker pool of each count is started before it is timed. The fits are timed with perf_counter_ns whatever the timer of the
+    experiment, as the process time of this process leaves out the work of the worker processes
+
+    Args:
+
+        X_train (np.array) - array of full dataset attributes
+
+        y_train (np.array) - array of full dataset target variable
+
+        worker_counts (list) - an increasing list of worker counts e.g. [1, 2, 4, 8]
+
+        n_iters_per_count (int) - number of times to repeat the fits of each worker count
+
+    Returns:
+
+        results_dict (dict) - dictionary of format {"strong" or "weak": [list of (workers, rows, runtime)]} and {"strong_efficiency" or "weak_efficiency":
+                              [list of (workers, efficiency)]}, the efficiency of p workers being T(p_0) p_0 / (T(p) p) for strong and T(p_0) / T(p) for
+                              weak scaling, with T the median runtime and p_0 the smallest worker count
+    """
+    m, n = X_train.shape
+    rows_per_worker = m // max(worker_counts)
+    results_dict = {"strong": [], "weak": []}
+    for workers in worker_counts:
+        print(f"Working on: parallel-tsqr with {workers} workers")
+        # the fits at one worker also go through the pool, so the baseline of the efficiencies is the same algorithm
+        tsqr_lstsq(X_train[:workers * (n + 1)], y_train[:workers * (n + 1)], workers, use_pool=True)
+
+        for mode, rows in (("strong", m), ("weak", workers * rows_per_worker)):
+            for iter in range(n_iters_per_count):
+                start_fit = perf_counter_ns()
+                tsqr_lstsq(X_train[:rows], y_train[:rows], workers, use_pool=True)
+                stop_fit = perf_counter_ns()
+                results_dict[mode] += [(workers, rows, stop_fit - start_fit)]
+
+    base = worker_counts[0]
+    for mode in ("strong", "weak"):
+        medians = {workers: np.median([t for p, _, t in results_dict[mode] if p == workers]) for workers in worker_counts}
+        # strong scaling should divide the runtime by the added workers, weak scaling should keep it constant
+        ideal = {workers: workers / base if mode == "strong" else 1 for workers in worker_counts}
+        results_dict[f"{mode}_efficiency"] = [(workers, float(medians[base] / (medians[workers] * ideal[workers]))) for workers in worker_counts]
+        print(f"{mode} scaling efficiency: {results_dict[f'{mode}_efficiency']}")
+
+    return results_dict
 
 
 def set_time_type(time_type: str) -> object:
@@ -171,39 +466,7 @@ def set_time_type(time_type: str) -> object:
     return timer
 
 
-def comp_complexity_dict(reg: str):
-    """
-    Retrieves a lambda function for the theoretical number of flops for the least squares solver employed by each library
-    lambda x takes an x of form (m, n, r)
-    |-----------------------------------------------------------------------------------------------------|
-    |   Regressor    |               Solver                 | Computational Complexity                    |
-    |-----------------------------------------------------------------------------------------------------|
-    |    tf-necd     |       Cholesky Decomposition         |  O(mn^2 + n^3)                              |
-    |     tf-cod     |   Complete Orthogonal Decomposition  |  O(2mnr - r^2*(m + n) + 2r^3/3 + r(n - r))  |
-    |  pytorch-qrcp  |    QR Factorization with Pivoting    |  O(4mnr - 2r^2*(m + n) + 4r^3/3)            |
-    |   pytorch-qr   |          QR Factorization            |  O(2mn^2 - 2n^3/3)                          |
-    |  pytorch-svd   |            Complete SVD              |  O(4mn^2 + 8n^3)                            |
-    | pytorch-svddc  |       SVD Divide-and-Conquer         |  O(mn^2)                                    |
-    | sklearn-svddc  |       SVD Divide-and-Conquer         |  O(mn^2)                                    |
-    |  mxnet-svddc   |       SVD Divide-and-Conquer         |  O(mn^2)                                    |
-    |-----------------------------------------------------------------------------------------------------|
-    
-
-    """
-    dict = {
-        "tf-necd": lambda x: math.floor(x[0]*x[1]**2 + x[1]**3),
-        "tf-cod": lambda x: math.floor(2*x[0]*x[1]*x[2] - x[2]**2*(x[0] + x[1]) + 2*x[2]**3/3 + x[2]*(x[1] - x[2])),
-        "pytorch-qrcp": lambda x: math.floor(4*x[0]*x[1]*x[2] - 2*x[2]**2*(x[0] + x[1]) + 4*x[2]**3/3),
-        "pytorch-qr": lambda x: math.floor(2*x[0]*x[1]**2 - 2*x[1]**3/3),
-        "pytorch-svd": lambda x: math.floor(4*x[0]*x[1]**2 + 8*x[1]**3),
-        "pytorch-svddc": lambda x: math.floor(x[0]*x[1]**2),
-        "sklearn-svddc": lambda x: math.floor(x[0]*x[1]**2),
-        }
-    
-    return dict[reg]
-
-
-def theoretical_expr(n: int, r: int, reg_names: list, rows_in_expr: list) -> dict:
+def theoretical_expr(n: int, r: int, reg_names: list, rows_in_expr: list, tsqr_fit_workers=2) -> dict:
     """
     This function will record the runtimes to perform the theoretical number of flops for the least squares solver employed by each library for a specified
     number of rows. The rows_in_expr list contains the varying number of rows in this experiment. This will be performed for
@@ -219,6 +482,8 @@ def theoretical_expr(n: int, r: int, reg_names: list, rows_in_expr: list) -> dic
 
         rows_in_expr (list) - a list of the rows that will be used in the experiment
 
+        tsqr_fit_workers (int) - worker processes of parallel-tsqr, see ols_common.complexity.comp_complexity_dict
+
     Returns:
 
         results_dict (dict) - dictionary of format {regressor: [list of theoretical runtimes for each # of rows specified in rows_in_expr]}
@@ -227,7 +492,7 @@ def theoretical_expr(n: int, r: int, reg_names: list, rows_in_expr: list) -> dic
     exper_vals = [(rows,n,r) for rows in rows_in_expr]
     results_dict = {}
     for reg_name in reg_names:
-        func = comp_complexity_dict(reg_name)
+        func = comp_complexity_dict(reg_name, tsqr_fit_workers)
         flops = list(map(func, exper_vals))
 
         final = []
@@ -250,7 +515,9 @@ def dump_to_yaml(path: str, object: dict):
         f_log.write(dump)          
 
 
-def main(time_type: str, reg_names: list, data_rows: int, data_cols: int, granularity=2, repeat=10):
+def main(time_type: str, reg_names: list, data_rows: int, data_cols: int, granularity=2, repeat=10, tol=ITERATIVE_TOL, incremental_methods=(),
+         memory_limit=None, timeout=None, result_cache_dir=RESULT_CACHE_DIR, profile=False,
+         n_threads=None, tsqr_workers=(), shard=None, tsqr_fit_workers=2):
     """
     Runs Theoretical Runtime vs. Actual Runtime comparison
 
@@ -269,6 +536,35 @@ def main(time_type: str, reg_names: list, data_rows: int, data_cols: int, granul
 
         repeat (int): how many times to repeat experiment
 
+        tol (float): tolerance of the iterative regressors, their convergence is saved as raw_data/convergence.yaml
+
+        incremental_methods (list): methods of incremental_expr to compare fresh fits against incremental updates of the
+                            row prefixes with, saved as raw_data/incremental_time.yaml. Empty to skip
+
+        memory_limit (int): bytes each fit may allocate, see actual_expr. The outcome of every fit is saved as raw_data/outcomes.yaml
+
+        timeout (float): seconds each fit may take, see actual_expr
+
+        result_cache_dir (Path): folder of the result cache, see ols_common.result_cache, or None to always rerun. The runtimes of a
+                            regressor whose fits all succeeded are keyed by the hash of the data and the schedule, and reused by later runs.
+                            The memray captures of reused regressors are not written again
+
+        profile (bool): whether to profile the fits of every regressor, see ols_common.profiling.SolverProfiler. The profiles are saved in
+                            complexity_results/profile next to metadata.yaml. A profiled run does not use the result cache
+
+        n_threads (int): threads per BLAS, OpenMP, TensorFlow and PyTorch pool, see ols_common.threads.pin_thread_pools, or None to leave
+                            the pools as the libraries sized them. The pools are recorded in metadata.yaml either way
+
+        tsqr_workers (list): worker counts of the strong and weak scaling benchmark of parallel-tsqr, see tsqr_scaling_expr, saved as
+                            raw_data/tsqr_scaling.yaml. Empty to skip
+
+        tsqr_fit_workers (int): worker processes of the parallel-tsqr fits, also used for its theoretical flops
+
+        shard (tuple): (index, count) to only run a shard of the (regressor, rows, iteration) fits, see ols_common.sharding.shard_cells, or
+                            None to run them all. A shard saves its results as complexity_results/shards/shard-{index}-of-{count}.yaml and
+                            merge_shards writes the usual outputs once every shard is done. The first shard also runs the incremental and
+                            parallel-tsqr scaling experiments. Shards do not use the result cache, which holds the whole schedule of a regressor
+
     Returns:
 
         Saves results as yaml file
@@ -276,6 +572,7 @@ def main(time_type: str, reg_names: list, data_rows: int, data_cols: int, granul
     """
 
     timer = set_time_type(time_type)
+    thread_pools = configure_thread_pools(n_threads)
     array = get_data_array(data_rows, data_cols)
 
     m, n = np.shape(array)
@@ -297,15 +594,43 @@ def main(time_type: str, reg_names: list, data_rows: int, data_cols: int, granul
     print('All setup')
     print('running actual experiments...')
 
-    actual_time_dict, failed_regs, exceptions_lst = actual_expr(X, Y, timer, reg_names, rows_in_expr, repeat)
+    profiler = SolverProfiler(profile)
+    result_cache_dir = None if profile or shard is not None else result_cache_dir
+    data_hash = data_fingerprint(array) if result_cache_dir is not None else None
+    keys = {reg_name: cache_key(data=data_hash, solver=reg_name, rows_in_experiment=rows_in_expr, repeat=repeat, precision=str(array.dtype),
+                                timer=time_type, tol=tol, **({"workers": tsqr_fit_workers} if reg_name == TSQR_SOLVER else {})) for reg_name in reg_names}
+    cached = {reg_name: cache_get(key, result_cache_dir) for reg_name, key in keys.items()}
+    run_names = [reg_name for reg_name in reg_names if cached[reg_name] is None]
+
+    cells = None
+    if shard is not None:
+        cells = set(shard_cells([(reg_name, rows, iter) for reg_name in reg_names for rows in rows_in_expr for iter in range(repeat)], shard))
+
+    actual_time_dict, failed_regs, exceptions_lst, outcomes_dict, convergence_dict = actual_expr(X, Y, timer, run_names, rows_in_expr, repeat, tol,
+                                                                                                 memory_limit, timeout, profiler, cells, tsqr_fit_workers)
+    for reg_name in run_names:
+        if all(outcome == "ok" for _, outcome in outcomes_dict[reg_name]):
+            cache_put(keys[reg_name], (actual_time_dict[reg_name], outcomes_dict[reg_name], convergence_dict.get(reg_name)), result_cache_dir)
+
+    # merging the cached regressors back in, in the order of reg_names
+    results = {reg_name: cached[reg_name] or (actual_time_dict[reg_name], outcomes_dict[reg_name], convergence_dict.get(reg_name))
+               for reg_name in reg_names}
+    actual_time_dict = {reg_name: times for reg_name, (times, _, _) in results.items()}
+    outcomes_dict = {reg_name: outcomes for reg_name, (_, outcomes, _) in results.items()}
+    convergence_dict = {reg_name: convergence for reg_name, (_, _, convergence) in results.items() if convergence}
 
     print('All done with actual experiments')
 
-    print('now running theoretical experiments...')
-
-    theory_time_dict = theoretical_expr(n, r, reg_names, rows_in_expr)
+    first_shard = shard is None or shard[0] == 0
+    incremental_time_dict = None
+    if incremental_methods and first_shard:
+        print('running incremental experiments...')
+        incremental_time_dict = incremental_expr(X, Y, timer, rows_in_expr, repeat, incremental_methods)
 
-    print(f'Actual Time: {actual_time_dict}\n--------------\nTheoretical Time: {theory_time_dict}')
+    tsqr_scaling_dict = None
+    if tsqr_workers and first_shard:
+        print('running parallel-tsqr scaling experiments...')
+        tsqr_scaling_dict = tsqr_scaling_expr(X, Y, sorted(tsqr_workers), repeat)
 
     metadata = {
         "dataset_shape": f"{data_rows} x {data_cols}",
@@ -314,12 +639,117 @@ def main(time_type: str, reg_names: list, data_rows: int, data_cols: int, granul
         "rows_in_experiment": rows_in_expr,
         "repeat": repeat,
         "timer_method": f"{time_type} in nanoseconds",
+        "iterative_tol": tol,
+        "incremental_methods": list(incremental_methods),
+        "tsqr_workers": sorted(tsqr_workers),
+        "tsqr_fit_workers": tsqr_fit_workers,
+        "memory_limit": memory_limit,
+        "timeout": timeout,
+        "profiled": profile,
+        "thread_pools": thread_pools,
+        "shards": shard[1] if shard is not None else 1,
         "reg_names": [name for name in reg_names if name not in failed_regs]
     }
-    output_dir = Path.cwd() / "complexity_results" / "raw_data"
-    dump_to_yaml(Path.cwd() / "complexity_results" / "metadata.yaml", metadata)
-    dump_to_yaml(output_dir / "theoretical_time.yaml", theory_time_dict)
-    dump_to_yaml(output_dir / "actual_time.yaml", actual_time_dict)
+    output_dir = Path.cwd() / "complexity_results"
+    if shard is not None:
+        profiler.write(output_dir / "profile" / shard_name(shard))
+        (output_dir / "shards").mkdir(exist_ok=True, parents=True)
+        dump_to_yaml(output_dir / "shards" / f"{shard_name(shard)}.yaml", {
+            "shard": list(shard), "metadata": metadata, "reg_names": reg_names, "n": n, "r": int(r), "actual_time": actual_time_dict,
+            "outcomes": outcomes_dict, "convergence": convergence_dict, "incremental_time": incremental_time_dict, "tsqr_scaling": tsqr_scaling_dict,
+        })
+        return
+
+    print('now running theoretical experiments...')
+
+    theory_time_dict = theoretical_expr(n, r, reg_names, rows_in_expr, tsqr_fit_workers)
+
+    print(f'Actual Time: {actual_time_dict}\n--------------\nTheoretical Time: {theory_time_dict}')
+
+    profiler.write(output_dir / "profile")
+    write_results(output_dir, metadata, theory_time_dict, actual_time_dict, outcomes_dict, convergence_dict, incremental_time_dict, tsqr_scaling_dict)
+
+
+def write_results(output_dir: Path, metadata: dict, theory_time_dict: dict, actual_time_dict: dict, outcomes_dict: dict, convergence_dict: dict,
+                  incremental_time_dict=None, tsqr_scaling_dict=None):
+    """
+    Saves the outputs of an experiment: metadata.yaml in output_dir and the theoretical and actual runtimes, the outcomes and, if there are any, the
+    convergence, incremental and parallel-tsqr scaling results in output_dir/raw_data
+
+    Args:
+
+        output_dir (Path): the complexity_results folder
+
+        metadata (dict): settings and failures of the experiment
+
+        theory_time_dict (dict): see theoretical_expr
+
+        actual_time_dict, outcomes_dict, convergence_dict (dict): see actual_expr
+
+        incremental_time_dict (dict): see incremental_expr, None if it was not run
+
+        tsqr_scaling_dict (dict): see tsqr_scaling_expr, None if it was not run
+
+    Returns:
+
+        Saves results as yaml file
+    """
+    raw_dir = output_dir / "raw_data"
+    raw_dir.mkdir(exist_ok=True, parents=True)
+    dump_to_yaml(output_dir / "metadata.yaml", metadata)
+    dump_to_yaml(raw_dir / "theoretical_time.yaml", theory_time_dict)
+    dump_to_yaml(raw_dir / "actual_time.yaml", actual_time_dict)
+    dump_to_yaml(raw_dir / "outcomes.yaml", outcomes_dict)
+    if convergence_dict:
+        dump_to_yaml(raw_dir / "convergence.yaml", convergence_dict)
+    if incremental_time_dict is not None:
+        dump_to_yaml(raw_dir / "incremental_time.yaml", incremental_time_dict)
+    if tsqr_scaling_dict is not None:
+        dump_to_yaml(raw_dir / "tsqr_scaling.yaml", tsqr_scaling_dict)
+
+
+def merge_shards(output_dir=Path("complexity_results")):
+    """
+    Combines the outputs of the shards of a sharded run of main into the outputs of an unsharded run. The fits of every regressor are ordered by rows,
+    and the metadata is that of the first shard with the failures of every shard
+
+    Args:
+
+        output_dir (Path): the complexity_results folder the shards wrote to
+
+    Returns:
+
+        Saves results as yaml file
+    """
+    output_dir = Path(output_dir)
+    shards = []
+    for path in find_shards(output_dir / "shards", ".yaml"):
+        with open(path) as f:
+            shards.append(yaml.safe_load(f))
+
+    first = shards[0]
+    settings = ["dataset_shape", "rows_in_experiment", "repeat", "timer_method", "iterative_tol", "tsqr_fit_workers"]
+    for shard in shards[1:]:
+        if shard["reg_names"] != first["reg_names"] or any(shard["metadata"][key] != first["metadata"][key] for key in settings):
+            raise ValueError(f"shard {shard['shard'][0]} ran a different experiment than shard 0, remove the outputs of the older run")
+
+    reg_names = first["reg_names"]
+    merged = {part: {reg_name: sorted((entry for shard in shards for entry in shard[part].get(reg_name, [])), key=lambda entry: entry[0])
+                     for reg_name in reg_names}
+              for part in ("actual_time", "outcomes", "convergence")}
+    failed_regs = [reg_name for shard in shards for reg_name in shard["metadata"]["failed_regs"]]
+    metadata = {
+        **first["metadata"],
+        "failed_regs": failed_regs,
+        "failed_regs_exceptions": [error for shard in shards for error in shard["metadata"]["failed_regs_exceptions"]],
+        "reg_names": [name for name in reg_names if name not in failed_regs]
+    }
+    theory_time_dict = theoretical_expr(first["n"], first["r"], reg_names, first["metadata"]["rows_in_experiment"], first["metadata"]["tsqr_fit_workers"])
+    convergence_dict = {reg_name: convergence for reg_name, convergence in merged["convergence"].items() if convergence}
+
+    print(f'Merged {len(shards)} shards')
+    write_results(output_dir, metadata, theory_time_dict, merged["actual_time"], merged["outcomes"], convergence_dict, first["incremental_time"],
+                  first["tsqr_scaling"])
 
 
 if __name__ =='__main__':
@@ -330,6 +760,18 @@ if __name__ =='__main__':
     data_cols (int): dataset columns for experiment. The paper uses 10.
     granularity (int): step size of test between orders of magnitude value (ex. a granularity of 2 will yield 10^1, 10^1.2, 10^1.4, ... rows in experiment)
     repeat (int): how many times to repeat experiment. The paper uses 10.
+    The iterative regressors "numpy-cgls", "numpy-necg" and "numpy-sgd" and the sketching regressors "scipy-gauss-lsqr",
+    "scipy-srht-lsqr" and "scipy-cs-lsqr", the mixed precision regressor "torch-mpir" and the multi-process "parallel-tsqr" can be added to
+    reg_names, they are not in the paper.
+    incremental_methods (list): "gram" and/or "qr" to also time incremental fits of the nested row prefixes. Not in the paper.
+    memory_limit (int): bytes each fit may allocate before it is recorded as "OOM", None for no limit. Set it below the memory of the allocation.
+    timeout (float): seconds each fit may take before it is recorded as "timeout", None for no limit.
+    tsqr_workers (list): worker counts e.g. [1, 2, 4, 8] to benchmark the strong and weak scaling of parallel-tsqr on the dataset. Not in the paper.
+    tsqr_fit_workers (int): worker processes of parallel-tsqr in reg_names, the p of its theoretical flops.
+    The fits are split into shards when this runs as a task of a SLURM array job (sbatch --array=0-23), see run_array.script. Once every task is done,
+    "python complexity_experiment.py merge" combines their outputs. "python complexity_experiment.py local 4" runs 4 shards as subprocesses and merges them.
+    profile (bool): whether to save cProfile stats, collapsed stacks and a Python vs native time breakdown of every regressor in complexity_results/profile.
+    n_threads (int): threads per library thread pool, so that the order of reg_names does not change the timings. None leaves the pools as they are.
     """
     time_type = "process" #process or total
     reg_names = ["tf-necd", "tf-cod", "pytorch-qrcp", "pytorch-qr", "pytorch-svd", "pytorch-svddc", "sklearn-svddc"]
@@ -337,5 +779,20 @@ if __name__ =='__main__':
     data_cols = 10
     granularity=5
     repeat=10
-
-    main(time_type, reg_names, data_rows=data_rows, data_cols=data_cols, granularity=granularity, repeat=repeat)
+    incremental_methods=[]
+    memory_limit=None
+    timeout=None
+    profile=False
+    n_threads=None
+    tsqr_workers=[]
+    tsqr_fit_workers=2
+
+    if sys.argv[1:2] == ["merge"]:
+        merge_shards()
+    elif sys.argv[1:2] == ["local"]:
+        run_shards(Path(__file__).resolve(), int(sys.argv[2]))
+        merge_shards()
+    else:
+        main(time_type, reg_names, data_rows=data_rows, data_cols=data_cols, granularity=granularity, repeat=repeat,
+             incremental_methods=incremental_methods, memory_limit=memory_limit, timeout=timeout, profile=profile,
+             n_threads=n_threads, tsqr_workers=tsqr_workers, shard=shard_from_env(), tsqr_fit_workers=tsqr_fit_workers)
@@ -1,23 +1,112 @@
 import pandas as pd
 import numpy as np
+from pathlib import Path
+from scipy import stats
 
-blog = pd.read_csv("high_dimensional_exper/data/results/Blog Feedback-MAE_linreg_comparison.csv", index_col=0)
-communities = pd.read_csv("high_dimensional_exper/data/results/Communities and Crime-MAE_linreg_comparison.csv", index_col=0)
-facebook = pd.read_csv("high_dimensional_exper/data/results/Facebook Comment Volume-MAE_linreg_comparison.csv", index_col=0)
-geographical = pd.read_csv("high_dimensional_exper/data/results/Geographical Origin of Music-MAE_linreg_comparison.csv", index_col=0)
-hailstone = pd.read_csv("high_dimensional_exper/data/results/Hailstone-MAE_linreg_comparison.csv", index_col=0)
-energy = pd.read_csv("high_dimensional_exper/data/results/Hourly Energy Demand-MAE_linreg_comparison.csv", index_col=0)
-kegg = pd.read_csv("high_dimensional_exper/data/results/KEGG Metabolic Pathway-MAE_linreg_comparison.csv", index_col=0)
-online = pd.read_csv("high_dimensional_exper/data/results/Online News Popularity-MAE_linreg_comparison.csv", index_col=0)
-residential = pd.read_csv("high_dimensional_exper/data/results/Residential Building-MAE_linreg_comparison.csv", index_col=0)
-superconductivity = pd.read_csv("high_dimensional_exper/data/results/Superconductivity-MAE_linreg_comparison.csv", index_col=0)
-
-final_df = pd.DataFrame(index = ["Blog Feedback", "Communities and Crime", "Facebook Comment Volume", "Geographical Origin of Music", "Hailstone", "Hourly Energy Demand", "KEGG Metabolic Pathway", "Online News Popularity", "Residential Building", "Superconductivity"],
-                  columns = ["tf-necd", "tf-cod", "pytorch-qrcp", "pytorch-qr", "pytorch-svd", "pytorch-svddc", "sklearn-svddc", "mxnet-svddc"])
-for df, idx in zip([blog, communities, facebook, geographical, hailstone, energy, kegg, online, residential, superconductivity], ["Blog Feedback", "Communities and Crime", "Facebook Comment Volume", "Geographical Origin of Music", "Hailstone", "Hourly Energy Demand", "KEGG Metabolic Pathway", "Online News Popularity", "Residential Building", "Superconductivity"]):
-    for col in df.columns:
-        final_df.loc[idx,col] = round(df.mean(axis=0)[col],3)
-
-final_df.fillna("Failed", inplace=True)
-print(final_df)
-final_df.to_csv("high_dimensional_exper/data/results/MAE_linreg_comparison.csv")
\ No newline at end of file
+ERROR_METRICS = ["MAE", "MSE", "RMSE", "R2"]
+TIMING_METRICS = ["wall_time", "cpu_time"]
+SOLVER_ORDER = ["tf-necd", "tf-cod", "pytorch-qrcp", "pytorch-qr", "pytorch-svd", "pytorch-svddc", "sklearn-svddc", "mxnet-svddc"]
+
+
+def load_results(results_dir: Path) -> pd.DataFrame:
+    """
+    Reads every per-dataset result file ({dataset}-{metric}_linreg_comparison.csv) in a folder into one long-format frame
+
+    Args:
+
+        results_dir (Path) - folder holding the CSVs written by run_datasets.py
+
+    Returns:
+
+        long_df (pd.DataFrame) - one row per (dataset, metric, solver, fold) with the value in column "value"
+    """
+    frames = []
+    for path in sorted(results_dir.glob("*-*_linreg_comparison.csv")):
+        data_name, metric = path.name.removesuffix("_linreg_comparison.csv").rsplit("-", 1)
+        df = pd.read_csv(path, index_col=0).rename_axis("fold").reset_index()
+        frames.append(df.melt(id_vars="fold", var_name="solver").assign(dataset=data_name, metric=metric))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize(long_df: pd.DataFrame, confidence=0.95) -> pd.DataFrame:
+    """
+    Computes the mean, standard deviation and a t-distribution confidence interval over the folds of every
+    (dataset, solver, metric) in one groupby
+
+    Args:
+
+        long_df (pd.DataFrame) - as returned by load_results
+
+        confidence (float) - confidence level of the interval
+
+    Returns:
+
+        summary (pd.DataFrame) - one row per (dataset, solver, metric)
+    """
+    summary = long_df.groupby(["dataset", "solver", "metric"]).value.agg(["mean", "std", "count"]).reset_index()
+    half_width = stats.t.ppf((1 + confidence) / 2, summary["count"] - 1) * summary["std"] / np.sqrt(summary["count"])
+    summary["ci_low"] = summary["mean"] - half_width
+    summary["ci_high"] = summary["mean"] + half_width
+
+    return summary
+
+
+def comparison_table(summary: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """
+    Builds the dataset x solver table of mean fold scores for one error metric, followed by the mean timing of each
+    solver when timing results are present
+
+    Args:
+
+        summary (pd.DataFrame) - as returned by summarize
+
+        metric (str) - error metric of the table
+
+    Returns:
+
+        table (pd.DataFrame) - means rounded to 3 decimals, "Failed" where a solver has no result
+    """
+    means = summary.pivot(index=["dataset", "solver"], columns="metric", values="mean")
+    solvers = means.index.get_level_values("solver").unique()
+    solvers = [s for s in SOLVER_ORDER if s in solvers] + [s for s in solvers if s not in SOLVER_ORDER]
+
+    table = means[metric].unstack("solver").reindex(columns=solvers).round(3)
+    for timing in [t for t in TIMING_METRICS if t in means.columns]:
+        timing_table = means[timing].unstack("solver").reindex(columns=solvers)
+        timing_table.columns = [f"{solver} {timing}" for solver in timing_table.columns]
+        table = table.join(timing_table)
+
+    table.index.name = None
+    return table.astype(object).fillna("Failed")
+
+
+def main(results_dir: Path, confidence=0.95):
+    """
+    Aggregates every per-dataset result file in results_dir. The long-format summary of all metrics is saved as
+    linreg_summary.csv and one comparison table is saved per error metric as {metric}_linreg_comparison.csv
+
+    Args:
+
+        results_dir (Path) - folder holding the CSVs written by run_datasets.py
+
+        confidence (float) - confidence level of the intervals in the summary
+
+    Returns:
+
+        summary (pd.DataFrame) - as returned by summarize
+    """
+    summary = summarize(load_results(results_dir), confidence)
+    summary.to_csv(results_dir / "linreg_summary.csv", index=False)
+
+    for metric in [m for m in ERROR_METRICS if m in set(summary.metric)]:
+        table = comparison_table(summary, metric)
+        table.to_csv(results_dir / f"{metric}_linreg_comparison.csv")
+        if metric == "MAE":
+            print(table)
+
+    return summary
+
+
+if __name__ == "__main__":
+    main(Path("high_dimensional_exper/data/results"))
@@ -3,32 +3,225 @@ import seaborn as sns
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import scipy as sp
 import tensorflow as tf
-# import torch
+import hashlib
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from time import perf_counter, process_time
+import torch
 # import mxnet as mx
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from ols_common.auto import select_solver
+from ols_common.iterative import ITERATIVE_SOLVERS, ITERATIVE_TOL, cgls, fit_iterative
+from ols_common.mixed_precision import MPIR_SOLVER, fit_mpir
+from ols_common.model import LinearModel
+from ols_common.profiling import SolverProfiler
+from ols_common.result_cache import RESULT_CACHE_DIR, cache_get, cache_key, cache_put
+from ols_common.sandbox import limit_memory, rss_growth, run_sandboxed
+from ols_common.sharding import find_shards, run_shards, shard_cells, shard_from_env, shard_name
+from ols_common.sketch import SKETCH_SOLVERS, fit_sketch
+from ols_common.tsqr import TSQR_SOLVER, fit_tsqr
 
-def read_data(data_path: str) -> np.ndarray:
+METRIC_NAMES = ["MAE", "MSE", "RMSE", "R2"]
+PROFILE_METRICS = ["wall_time", "cpu_time", "peak_memory"]
+CONVERGENCE_METRICS = ["iterations", "time_to_tol", "final_error"]
+SPARSE_SOLVERS = ["scipy-lsqr", "scipy-lsmr", "torch-sparse-cg"]
+SPARSE_TOL = 1e-10
+GRAM_CV_SOLVERS = ["gram-necd", "gram-qr"]
+DATA_CACHE_DIR = Path("high_dimensional_exper/data/cache")
+
+def file_digest(path: str) -> str:
+    """
+    Hashes the contents of a file
+
+    Args:
+
+        path (str) - path to the file
+
+    Returns:
+
+        digest (str) - hex digest of the file
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_entry(data_path: str, cache_dir: Path, na_values="?", fill_value=0, sparse=False) -> Path:
+    """
+    Returns the folder of the dataset cache holding the cleaned arrays of a csv file, keyed by the hash of the file and
+    the cleaning options
+    """
+    options = f"na_values={na_values!r},fill_value={fill_value!r}" + (",sparse=True" if sparse else "")
+    key = hashlib.blake2b(f"{file_digest(data_path)}:{options}".encode(), digest_size=16).hexdigest()
+    return Path(cache_dir) / f"{Path(data_path).stem}-{key}"
+
+
+def save_atomic(path: Path, save):
     """
-    Reads in data from a csv file and returns a numpy array of the data
+    Writes a file of the dataset cache by calling save on an open binary file with a temporary name, then renames it to
+    path, so a run killed while writing never leaves a truncated file under path
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            save(f)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def read_sparse_data(data_path: str, cache_dir=None, na_values="?", fill_value=0, chunksize=100_000) -> tuple[sp.sparse.csr_matrix, np.ndarray]:
+    """
+    Reads in data from a csv file as a CSR matrix and the labels. The csv is parsed chunksize rows at a time and each
+    chunk is converted to CSR before the next one is read, so the dense data is never held in memory at once. When a
+    cache folder is given, the matrix is stored there as an .npz file (see read_data)
 
     Args:
 
         data_path (str) - path to the csv file
 
+        cache_dir (Path) - folder of the dataset cache, None to always parse the csv
+
+        na_values (str) - value marking missing data in the csv
+
+        fill_value (float) - value missing data is replaced with
+
+        chunksize (int) - number of rows parsed at a time
+
     Returns:
 
-        arr (nd.array) - numpy array of the data
+        X (sp.sparse.csr_matrix) - the data
+
+        y (nd.array) - the labels
     """
-    df = pd.read_csv(data_path, na_values="?")
-    df = df.fillna(0)
+    if cache_dir is not None:
+        entry = cache_entry(data_path, cache_dir, na_values, fill_value, sparse=True)
+        if (entry / "y.npy").exists():
+            return sp.sparse.load_npz(entry / "X.npz").tocsr(), np.load(entry / "y.npy")
+
+    blocks, labels = [], []
+    for chunk in pd.read_csv(data_path, na_values=na_values, chunksize=chunksize):
+        arr = chunk.fillna(fill_value).values.astype(np.float64)
+        blocks.append(sp.sparse.csr_matrix(arr[:, :-1]))
+        labels.append(arr[:, -1])
+    X, y = sp.sparse.vstack(blocks, format="csr"), np.concatenate(labels)
+
+    if cache_dir is not None:
+        # y.npy is renamed into place last, so an entry is only taken as complete once both files are whole
+        entry.mkdir(exist_ok=True, parents=True)
+        save_atomic(entry / "X.npz", lambda f: sp.sparse.save_npz(f, X))
+        save_atomic(entry / "y.npy", lambda f: np.save(f, y))
+
+    return X, y
+
+
+def read_data(data_path: str, cache_dir=None, na_values="?", fill_value=0, sparse=False) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reads in data from a csv file and returns numpy arrays of the data and labels. When a cache folder is given, the cleaned
+    arrays are stored there as float64 .npy files keyed by the hash of the csv file and the cleaning options, and later calls
+    memory-map them instead of parsing the csv again.
+
+    Args:
+
+        data_path (str) - path to the csv file
+
+        cache_dir (Path) - folder of the dataset cache, None to always parse the csv
+
+        na_values (str) - value marking missing data in the csv
+
+        fill_value (float) - value missing data is replaced with
+
+        sparse (bool) - whether to return the data as a CSR matrix, for datasets that are mostly zeros after cleaning,
+                        see read_sparse_data
+
+    Returns:
+
+        X, y (nd.array) - numpy arrays of the data and labels, read-only memory maps when read through the cache
+    """
+    if sparse:
+        return read_sparse_data(data_path, cache_dir, na_values, fill_value)
+
+    if cache_dir is not None:
+        entry = cache_entry(data_path, cache_dir, na_values, fill_value)
+        if (entry / "y.npy").exists():
+            return np.load(entry / "X.npy", mmap_mode="r"), np.load(entry / "y.npy", mmap_mode="r")
+
+    df = pd.read_csv(data_path, na_values=na_values)
+    df = df.fillna(fill_value)
     arr = df.values
-    return arr[:, :-1], arr[:, -1]
+    X, y = arr[:, :-1], arr[:, -1]
 
+    if cache_dir is not None:
+        # y.npy is renamed into place last, so an entry is only taken as complete once both files are whole
+        entry.mkdir(exist_ok=True, parents=True)
+        save_atomic(entry / "X.npy", lambda f: np.save(f, np.ascontiguousarray(X, dtype=np.float64)))
+        save_atomic(entry / "y.npy", lambda f: np.save(f, np.ascontiguousarray(y, dtype=np.float64)))
+        return np.load(entry / "X.npy", mmap_mode="r"), np.load(entry / "y.npy", mmap_mode="r")
 
-def gen_cv_samples(X_train: np.ndarray, y_train: np.ndarray, n_cv_folds: int) -> list:
+    return X, y
+
+
+def fold_bounds(n_rows: int, n_cv_folds: int) -> list:
+    """
+    Computes the start and stop row of each fold of a permuted dataset, using the same fold sizes as sklearn's KFold
+
+    Args:
+
+        n_rows (int) - number of rows in the dataset
+
+        n_cv_folds (int) - number of cv folds
+
+    Returns:
+
+        bounds (list) - list of (start, stop) tuples, one per fold
     """
-    Generates a nested array of length k (where k is the number of cv folds)
-    Each sub-tuple contains k folds formed into training data and the k+1 fold left out as test data
+    sizes = np.full(n_cv_folds, n_rows // n_cv_folds)
+    sizes[:n_rows % n_cv_folds] += 1
+    stops = np.cumsum(sizes)
+    return [(int(stop - size), int(stop)) for size, stop in zip(sizes, stops)]
+
+
+def permute_rows(X: np.ndarray, y: np.ndarray, seed=100) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Shuffles the rows of the data into a contiguous copy, in the same order as a shuffled KFold with the same seed
+
+    Args:
+
+        X (nd.array) - data
+
+        y (nd.array) - labels
+
+        seed (int) - seed used to shuffle the rows, None if the rows are already shuffled
+
+    Returns:
+
+        X_perm, y_perm (nd.array) - shuffled copies of X and y
+    """
+    if seed is None:
+        return X, y
+    perm = np.arange(X.shape[0])
+    np.random.RandomState(seed).shuffle(perm)
+    return X[perm], y[perm]
+
+
+def gen_cv_samples(X_train: np.ndarray, y_train: np.ndarray, n_cv_folds: int, seed=100):
+    """
+    Lazily generates the k (where k is the number of cv folds) train/test splits of the data, one at a time.
+    The rows are permuted once into a contiguous copy (with the same fold membership as a shuffled KFold), so each
+    test fold is a slice of that copy and each training set is written into a single buffer that is reused by every fold.
+    Memory use is therefore one copy of the data plus one buffer, whatever k is.
+
+    The yielded training arrays are overwritten by the next fold, so copy them if they are needed after that.
+    For CSR data the training matrix of each fold is instead stacked from the two slices around the test fold.
     
     Args: 
 
@@ -37,82 +230,484 @@ def gen_cv_samples(X_train: np.ndarray, y_train: np.ndarray, n_cv_folds: int) ->
         y_train (nd.array) - training labels already processed
 
         n_cv_folds (int) - number of cv folds to generate
+
+        seed (int) - seed used to shuffle the rows
         
-    Returns: 
+    Yields: 
 
-        train/test data (tuples) - nested_samples gets broken down into four list
+        X_tr, y_tr, X_te, y_te (tuple) - the training and test data of one fold
     """
-    kf = model_selection.KFold(n_splits = n_cv_folds, shuffle = True, random_state = 100)
-    kf_indices = [(train, test) for train, test in kf.split(X_train, y_train)]
-    nested_samples = [(X_train[train_idxs], y_train[train_idxs], X_train[test_idxs], y_train[test_idxs]) for train_idxs, test_idxs in kf_indices]
-    return nested_samples
+    X_perm, y_perm = permute_rows(X_train, y_train, seed)
+
+    bounds = fold_bounds(X_perm.shape[0], n_cv_folds)
+    if sp.sparse.issparse(X_perm):
+        for start, stop in bounds:
+            X_tr = sp.sparse.vstack([X_perm[:start], X_perm[stop:]], format="csr")
+            yield X_tr, np.concatenate((y_perm[:start], y_perm[stop:])), X_perm[start:stop], y_perm[start:stop]
+        return
+
+    max_train = X_perm.shape[0] - min(stop - start for start, stop in bounds)
+    X_buf = np.empty((max_train,) + X_perm.shape[1:], dtype=X_perm.dtype)
+    y_buf = np.empty((max_train,) + y_perm.shape[1:], dtype=y_perm.dtype)
+
+    for start, stop in bounds:
+        n_train = X_perm.shape[0] - (stop - start)
+        X_buf[:start], y_buf[:start] = X_perm[:start], y_perm[:start]
+        X_buf[start:n_train], y_buf[start:n_train] = X_perm[stop:], y_perm[stop:]
+        yield X_buf[:n_train], y_buf[:n_train], X_perm[start:stop], y_perm[start:stop]
     
 
-def run_linreg(cv_data, regr_name, formula):
+def fit_model(regr_name: str, X_tr: np.ndarray, y_tr: np.ndarray, tsqr_workers=None) -> np.ndarray:
+    """
+    Fits one of the OLS implementations to the training data. The SPARSE_SOLVERS and SKETCH_SOLVERS work on CSR
+    matrices directly, the other implementations densify sparse training data first.
+
+    Args:
+
+        regr_name (str) - name of the regression model to run
+
+        X_tr (nd.array or sparse matrix) - training data
+
+        y_tr (nd.array) - training labels
+
+        tsqr_workers (int) - worker processes of parallel-tsqr, the available cores if None, see ols_common.tsqr.fit_tsqr
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+    """
+    if sp.sparse.issparse(X_tr) and regr_name not in SPARSE_SOLVERS and regr_name not in SKETCH_SOLVERS:
+        X_tr = X_tr.toarray()
+
+    match regr_name:
+        case "sklearn-svddc":
+            model = linear_model.LinearRegression(fit_intercept=False).fit(X_tr,y_tr).coef_
+
+        case "tf-necd":
+            model = tf.linalg.lstsq(X_tr, y_tr[...,np.newaxis], fast=True).numpy()
+            
+        case "tf-cod":
+            model = tf.linalg.lstsq(X_tr, y_tr[...,np.newaxis], fast=False).numpy()
+
+        case "pytorch-qrcp":
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gelsy").solution)
+
+        case "pytorch-qr":
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gels").solution)
+
+        case "pytorch-svd":
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gelss").solution)
+
+        case "pytorch-svddc":
+            model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gelsd").solution)
+
+        case "mxnet-svddc":
+            model = mx.np.linalg.lstsq(X_tr, y_tr[...,np.newaxis], rcond=None)[0].asnumpy()
+
+        case "scipy-lsqr":
+            model = sp.sparse.linalg.lsqr(X_tr, y_tr, atol=SPARSE_TOL, btol=SPARSE_TOL, iter_lim=10 * X_tr.shape[1])[0]
+
+        case "scipy-lsmr":
+            model = sp.sparse.linalg.lsmr(X_tr, y_tr, atol=SPARSE_TOL, btol=SPARSE_TOL, maxiter=10 * X_tr.shape[1])[0]
+
+        case "torch-sparse-cg":
+            model = torch_sparse_cg(X_tr, y_tr)
+
+        case _ if regr_name in SKETCH_SOLVERS:
+            model = fit_sketch(regr_name, X_tr, y_tr)
+
+        case "torch-mpir":
+            model = fit_mpir(X_tr, y_tr)[0]
+
+        case "parallel-tsqr":
+            model = fit_tsqr(X_tr, y_tr, tsqr_workers)
+
+        case _:
+            raise ValueError(f"Unknown regressor: {regr_name}")
+
+    return model
+
+
+def torch_sparse_cg(X: sp.sparse.csr_matrix, y: np.ndarray, tol=SPARSE_TOL, max_iter=None) -> np.ndarray:
     """
-    This function runs the linear regression models on the data and returns the results of some error metric
+    Solves the least squares problem with the conjugate gradient method applied to the normal equations (CGLS, see
+    ols_common.iterative.cgls), using PyTorch sparse CSR products so that X^T X is never formed
 
     Args:
 
-        cv_data (tuples) - nested array of training and test data
+        X (sparse matrix) - training data
+
+        y (nd.array) - training labels
+
+        tol (float) - stops once ||X^T r|| has dropped by this factor
+
+        max_iter (int) - maximum number of iterations, 10 times the number of columns if None
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+    """
+    def to_torch(mat):
+        mat = sp.sparse.csr_matrix(mat, dtype=np.float64)
+        return torch.sparse_csr_tensor(torch.from_numpy(mat.indptr).long(), torch.from_numpy(mat.indices).long(),
+                                       torch.from_numpy(mat.data), size=mat.shape, dtype=torch.float64)
+
+    A, At = to_torch(X), to_torch(sp.sparse.csr_matrix(X).T)
+    product = lambda M, v: (M @ torch.from_numpy(np.ascontiguousarray(v, dtype=np.float64))[:, None])[:, 0].numpy()
+    op = sp.sparse.linalg.LinearOperator(X.shape, matvec=lambda v: product(A, v), rmatvec=lambda v: product(At, v),
+                                         dtype=np.float64)
+    return cgls(op, y, tol, max_iter)[0]
+
+
+def score_predictions(y_true: np.ndarray, y_pred: np.ndarray) -> dict:
+    """
+    Computes every error metric from a single pass over the residuals. RMSE is derived from MSE, and R2 from the
+    same sum of squared residuals.
+
+    Args:
+
+        y_true (nd.array) - true labels
+
+        y_pred (nd.array) - predicted labels
+
+    Returns:
+
+        scores (dict) - dictionary of format {metric name: score}
+    """
+    residual = y_true - np.ravel(y_pred)
+    sse = residual @ residual
+    centered = y_true - y_true.mean()
+    sst = centered @ centered
+    mse = sse / residual.shape[0]
+
+    # matching sklearn's r2_score on a constant target
+    if sst == 0:
+        r2 = 1.0 if sse == 0 else 0.0
+    else:
+        r2 = 1 - sse / sst
+
+    return {"MAE": np.abs(residual).mean(), "MSE": mse, "RMSE": np.sqrt(mse), "R2": r2}
+
+
+def fit_solver(regr_name: str, X_tr: np.ndarray, y_tr: np.ndarray, tol=ITERATIVE_TOL, tsqr_workers=None) -> tuple[np.ndarray, dict]:
+    """
+    Fits one of the OLS implementations, returning the model and the CONVERGENCE_METRICS of the ITERATIVE_SOLVERS and
+    MPIR_SOLVER (its refinement), which are None for the direct solvers. tsqr_workers is passed on to fit_model
+    """
+    if regr_name in ITERATIVE_SOLVERS:
+        return fit_iterative(regr_name, X_tr, y_tr, tol)
+    if regr_name == MPIR_SOLVER:
+        return fit_mpir(X_tr, y_tr)
+    return fit_model(regr_name, X_tr, y_tr, tsqr_workers), dict.fromkeys(CONVERGENCE_METRICS)
+
+
+def fit_memory(regr_name: str, X_tr: np.ndarray, y_tr: np.ndarray, tol=ITERATIVE_TOL, tsqr_workers=None) -> int:
+    """
+    Returns the growth of the resident set size over one fit (see ols_common.sandbox.rss_growth), after a warm-up fit
+    on the first n + 1 rows, so that the one-time start-up of the libraries in a fresh process (lazy initialisation,
+    thread pools, paging in their code) is not counted as memory of the fit
+    """
+    fit_solver(regr_name, X_tr[:X_tr.shape[1] + 1], y_tr[:X_tr.shape[1] + 1], tol, tsqr_workers)
+    return rss_growth(fit_solver, (regr_name, X_tr, y_tr, tol, tsqr_workers))
+
+
+def profile_fit(regr_name: str, X_tr: np.ndarray, y_tr: np.ndarray, measure_memory=False, tol=ITERATIVE_TOL,
+                tsqr_workers=None) -> tuple[np.ndarray, dict]:
+    """
+    Fits one of the OLS implementations while recording its wall time, cpu time and the shape of the training data.
+    As in complexity_experiment.py, memory is measured on a second fit so that measuring does not slow down the timed
+    one. The second fit runs in a freshly spawned process, after a warm-up fit on a few rows, and the peak is the growth
+    of its resident set size over the fit (see fit_memory), so the buffers of LAPACK, TensorFlow and PyTorch are counted.
+    The ITERATIVE_SOLVERS and MPIR_SOLVER also report their CONVERGENCE_METRICS, which are NaN for the direct solvers.
+
+    Args:
+
+        regr_name (str) - name of the regression model to run
+
+        X_tr (nd.array) - training data
+
+        y_tr (nd.array) - training labels
+
+        measure_memory (bool) - whether to fit a second time, in a child process, to record the peak memory
+
+        tol (float) - tolerance of the ITERATIVE_SOLVERS, see fit_iterative
+
+        tsqr_workers (int) - worker processes of parallel-tsqr, see fit_model
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+
+        stats (dict) - dictionary with the wall_time and cpu_time in seconds, the peak_memory in bytes (NaN if not measured)
+                        and the CONVERGENCE_METRICS, with time_to_tol in seconds
+    """
+    start_wall, start_cpu = perf_counter(), process_time()
+    model, info = fit_solver(regr_name, X_tr, y_tr, tol, tsqr_workers)
+    stats = {"wall_time": perf_counter() - start_wall, "cpu_time": process_time() - start_cpu, "peak_memory": np.nan}
+    stats.update({name: np.nan if info[name] is None else info[name] for name in CONVERGENCE_METRICS})
+
+    if measure_memory:
+        # spawned, as a forked child would share the pages and thread pools of this process
+        status, peak, _ = run_sandboxed(fit_memory, (regr_name, X_tr, y_tr, tol, tsqr_workers), start_method="spawn", isolate=True)
+        stats["peak_memory"] = peak if status == "ok" else np.nan
+
+    return model, stats
+
+
+def profile_gram_cv(X: np.ndarray, y: np.ndarray, n_cv_folds: int, regr_name: str, seed=100) -> list:
+    """
+    Runs one of the fast cross validation paths in GRAM_CV_SOLVERS and records its time. These paths fit every fold at
+    once, so the wall and cpu time are split evenly over the folds and memory is not measured.
+
+    Args:
+
+        X (nd.array) - data already processed
+
+        y (nd.array) - labels already processed
+
+        n_cv_folds (int) - number of cv folds
+
+        regr_name (str) - "gram-necd" or "gram-qr"
+
+        seed (int) - seed used to shuffle the rows, None if the rows are already shuffled
+
+    Returns:
+
+        accumulator (list) - list of dictionaries of format {metric name: score}, one for each fold
+    """
+    start_wall, start_cpu = perf_counter(), process_time()
+    scores = gram_cv(X, y, n_cv_folds, method=regr_name.split("-")[-1], seed=seed)
+    stats = {"wall_time": (perf_counter() - start_wall) / n_cv_folds, "cpu_time": (process_time() - start_cpu) / n_cv_folds, "peak_memory": np.nan,
+             **dict.fromkeys(CONVERGENCE_METRICS, np.nan)}
+
+    return [{**score, **stats} for score in scores]
+
+
+def write_fold_shapes(n_rows: int, n_cols: int, n_cv_folds: int, data_name: str, results_dir: Path, density=np.nan):
+    """
+    Saves the shape of the training and test data of every fold as {data_name}-fold_shapes.csv
+
+    Args:
+
+        n_rows (int) - number of rows in the dataset
+
+        n_cols (int) - number of columns in the data
+
+        n_cv_folds (int) - number of cv folds
+
+        data_name (str) - name of the dataset
+
+        results_dir (Path) - folder the CSV is written to
+
+        density (float) - fraction of nonzero entries in the data
+
+    Returns:
+
+        None
+    """
+    shapes = pd.DataFrame([{"fold": i, "train_rows": n_rows - (stop - start), "test_rows": stop - start, "n_cols": n_cols, "density": density}
+                           for i, (start, stop) in enumerate(fold_bounds(n_rows, n_cv_folds))])
+    shapes.to_csv(Path(results_dir) / f"{data_name}-fold_shapes.csv", index=False)
+
+
+def run_linreg(cv_data, regr_name, measure_memory=False, tol=ITERATIVE_TOL, memory_limit=None, timeout=None, tsqr_workers=None):
+    """
+    This function fits one of the linear regression models on each fold of the data once and scores its predictions on every error metric.
+    The time, memory and, for the ITERATIVE_SOLVERS, the convergence of each fit are recorded alongside, see profile_fit.
+    A fold that fails is recorded with NaN scores and the remaining folds still run. With a memory_limit or timeout every fit runs in a
+    child process, see ols_common.sandbox.run_sandboxed, so running out of memory or time is recorded as "OOM" or "timeout".
+
+    Args:
+
+        cv_data (iterable) - iterable of (X_tr, y_tr, X_te, y_te) folds, see gen_cv_samples
 
         regr_name (str) - name of the regression model to run
 
-        formula (function) - error metric to use
+        measure_memory (bool) - whether to record the peak memory of each fit
+
+        tol (float) - tolerance of the ITERATIVE_SOLVERS
+
+        memory_limit (int) - bytes a fit may allocate on top of the memory of this process, None for no limit
+
+        timeout (float) - seconds a fit may take, None for no limit
+
+        tsqr_workers (int) - worker processes of parallel-tsqr, see fit_model
 
     Returns:
 
-        accumulator (list) - list of error metrics for each fold
+        accumulator (list) - list of dictionaries of format {metric name: score} (including PROFILE_METRICS and
+                             CONVERGENCE_METRICS), the "status" of the fold and the "error" of a failed fold, one for each fold
 
         error (list) - list of errors that occured during the run
     """
     accumulator = []
     error = []
+    for i, (X_tr, y_tr, X_te, y_te) in enumerate(cv_data):
+        status, value, err = run_sandboxed(profile_fit, (regr_name, X_tr, y_tr, measure_memory, tol, tsqr_workers),
+                                           memory_limit=memory_limit, timeout=timeout)
+        if status != "ok":
+            error.append(f"fold {i} {status}: {err}")
+            accumulator.append({**dict.fromkeys(METRIC_NAMES + PROFILE_METRICS + CONVERGENCE_METRICS, np.nan), "status": status,
+                                "error": err})
+            continue
+
+        model, stats = value
+        pred = LinearModel.from_fit(model, regr_name).predict(X_te)
+        accumulator.append({**score_predictions(y_te, pred), **stats, "status": status})
+
+    return accumulator, error
+
+
+def gram_cv(X: np.ndarray, y: np.ndarray, n_cv_folds: int, method="necd", seed=100) -> list:
+    """
+    Runs k-fold cross validation for normal-equation style solvers in one pass over the data. The Gram matrix X^T X and
+    the moment X^T y of every fold are computed once, and the training system of each fold is obtained by subtracting
+    the fold's contribution from the totals, so only k small n x n solves are needed: O(mn^2 + k n^3) instead of k O(mn^2).
+    The "qr" method instead keeps the R factor of [X_f y_f] for every fold and merges the R factors of the training folds,
+    which avoids the subtraction and squaring of the condition number at the cost of k small QR factorizations.
+    The folds are the same as those of gen_cv_samples.
+
+    Args:
+
+        X (nd.array) - data already processed
+
+        y (nd.array) - labels already processed
+
+        n_cv_folds (int) - number of cv folds
+
+        method (str) - "necd" to solve the downdated normal equations with a Cholesky decomposition, or "qr"
+                        to merge the R factors of the training folds
+
+        seed (int) - seed used to shuffle the rows, None if the rows are already shuffled
+
+    Returns:
+
+        accumulator (list) - list of dictionaries of format {metric name: score}, one for each fold
+    """
+    if sp.sparse.issparse(X):
+        X = X.toarray()
+    X_perm, y_perm = permute_rows(X, y, seed)
+    bounds = fold_bounds(X_perm.shape[0], n_cv_folds)
+    n_cols = X_perm.shape[1]
+
+    match method:
+        case "necd":
+            fold_grams = [X_perm[start:stop].T @ X_perm[start:stop] for start, stop in bounds]
+            fold_moments = [X_perm[start:stop].T @ y_perm[start:stop] for start, stop in bounds]
+            total_gram, total_moment = sum(fold_grams), sum(fold_moments)
+            models = [sp.linalg.cho_solve(sp.linalg.cho_factor(total_gram - gram), total_moment - moment)
+                      for gram, moment in zip(fold_grams, fold_moments)]
+
+        case "qr":
+            fold_rs = [np.linalg.qr(np.column_stack([X_perm[start:stop], y_perm[start:stop]]), mode="r") for start, stop in bounds]
+            models = []
+            for i in range(len(bounds)):
+                r = np.linalg.qr(np.vstack(fold_rs[:i] + fold_rs[i+1:]), mode="r")
+                models.append(sp.linalg.solve_triangular(r[:n_cols, :n_cols], r[:n_cols, n_cols]))
+
+        case _:
+            raise ValueError(f"method must be one of the options shown in the docs, not: {method}")
+
+    return [score_predictions(y_perm[start:stop], X_perm[start:stop] @ model) for (start, stop), model in zip(bounds, models)]
+
+
+def run_gram_cv(X: np.ndarray, y: np.ndarray, n_cv_folds: int, regr_name: str):
+    """
+    Runs one of the fast cross validation paths in GRAM_CV_SOLVERS with the same outputs as run_linreg
+
+    Args:
+
+        X (nd.array) - data already processed
+
+        y (nd.array) - labels already processed
+
+        n_cv_folds (int) - number of cv folds
+
+        regr_name (str) - "gram-necd" or "gram-qr"
+
+    Returns:
+
+        accumulator (list) - list of dictionaries of format {metric name: score}, one for each fold
+
+        error (list) - list of errors that occured during the run
+    """
     try:
-        for i, (X_tr, y_tr, X_te, y_te) in enumerate(cv_data):
-            pred = None
-            match regr_name:
-                case "sklearn-svddc":
-                    model = linear_model.LinearRegression(fit_intercept=False).fit(X_tr,y_tr).coef_
+        return profile_gram_cv(X, y, n_cv_folds, regr_name), []
+    except Exception:
+        return None, [traceback.format_exc()]
 
-                case "tf-necd":
-                    model = tf.linalg.lstsq(X_tr, y_tr[...,np.newaxis], fast=True).numpy()
-                    
-                case "tf-cod":
-                    model = tf.linalg.lstsq(X_tr, y_tr[...,np.newaxis], fast=False).numpy()
 
-                case "pytorch-qrcp":
-                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gelsy").solution)
+def validate_gram_cv(X: np.ndarray, y: np.ndarray, n_cv_folds: int, reference="sklearn-svddc") -> pd.DataFrame:
+    """
+    Checks the fast cross validation paths against the explicit per-fold fits of run_linreg
 
-                case "pytorch-qr":
-                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gels").solution)
+    Args:
 
-                case "pytorch-svd":
-                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gelss").solution)
+        X (nd.array) - data already processed
 
-                case "pytorch-svddc":
-                    model = np.array(torch.linalg.lstsq(torch.Tensor(X_tr), torch.Tensor(y_tr[...,np.newaxis]), driver="gelsd").solution)
+        y (nd.array) - labels already processed
 
-                case "mxnet-svddc":
-                    model = mx.np.linalg.lstsq(X_tr, y_tr[...,np.newaxis], rcond=None)[0]
-                    
-            pred = X_te @ model 
+        n_cv_folds (int) - number of cv folds
 
-            results = formula(y_te, pred)
-        
-            accumulator.append(results)
+        reference (str) - regressor whose run_linreg results are used as ground truth
 
-    except Exception as e:
-        error.append(e)
-        return None, error
-            
-    return accumulator, error
+    Returns:
+
+        diffs (pd.DataFrame) - largest relative difference over the folds, for each fast path and error metric
+    """
+    reference_res, err = run_linreg(gen_cv_samples(X, y, n_cv_folds), reference)
+    if err:
+        raise RuntimeError(f"{reference} failed: {err[0]}")
+    # the run_linreg records also hold the status and the time, memory and convergence of each fold
+    reference_df = pd.DataFrame(reference_res)[METRIC_NAMES]
+
+    diffs = {}
+    for name in GRAM_CV_SOLVERS:
+        fast_df = pd.DataFrame(gram_cv(X, y, n_cv_folds, method=name.split("-")[-1]))[METRIC_NAMES]
+        diffs[name] = ((fast_df - reference_df).abs() / reference_df.abs()).max()
+
+    return pd.DataFrame(diffs).T
 
     
-def main(data_path, k_folds, data_name, reg_names):
+def write_auto_selection(decision: dict, fold_times: list, data_name: str, results_dir: Path):
+    """
+    Saves a decision of ols_common.auto.select_solver as {data_name}-auto_selection.csv, one row per candidate with its
+    predicted time and expected error, and the mean measured wall time of the fits of the chosen solver
+
+    Args:
+
+        decision (dict) - as returned by select_solver
+
+        fold_times (list) - wall time of every fold of the chosen solver, None if it failed
+
+        data_name (str) - name of the dataset
+
+        results_dir (Path) - folder the CSV is written to
+
+    Returns:
+
+        None
+    """
+    actual_time = np.mean(fold_times) if fold_times else np.nan
+    log = pd.DataFrame.from_dict(decision["candidates"], orient="index").rename_axis("solver").reset_index()
+    log["chosen"] = log.solver == decision["choice"]
+    log["actual_time"] = np.where(log.chosen, actual_time, np.nan)
+    for key in ("m", "n", "rank", "cond", "accuracy_target"):
+        log[key] = decision[key]
+    log.to_csv(Path(results_dir) / f"{data_name}-auto_selection.csv", index=False)
+
+    print(f"{data_name}: auto selected {decision['choice']}, predicted {decision['predicted_time']:.3g}s, actual {actual_time:.3g}s")
+
+
+def main(data_path, k_folds, data_name, reg_names, cache_dir=DATA_CACHE_DIR, measure_memory=False, sparse=False, tol=ITERATIVE_TOL,
+         memory_limit=None, timeout=None, result_cache_dir=RESULT_CACHE_DIR, profile=False, tsqr_workers=None):
     """
     This is the pipeline to read data, run regression on OLS implementations, and save the results. The results will
-    be saved as a CSV and text file for each regressor for each error metric.
+    be saved as a CSV for each error metric holding every regressor, with a CSV for the time, memory and
+    convergence of each fold next to them, one for the shapes of the folds and a task log of the outcome and captured
+    error of every fold.
+    The folds of a regressor that all succeeded are stored in the result cache, keyed by the hash of the csv file and the
+    options, and reused by later runs, so that editing one dataset only recomputes that dataset.
     
     Args:
     
@@ -122,55 +717,627 @@ def main(data_path, k_folds, data_name, reg_names):
         
         data_name (str) - name of the dataset
         
-        reg_names (list) - list of regression names to run
+        reg_names (list) - list of regression names to run, including the fast cross validation paths in GRAM_CV_SOLVERS.
+                           "auto" is replaced by the solver ols_common.auto.select_solver picks for the data, and the
+                           decision is saved as {data_name}-auto_selection.csv
+
+        cache_dir (Path) - folder of the dataset cache, see read_data
+
+        measure_memory (bool) - whether to record the peak memory of each fit, which fits each fold a second time
+
+        sparse (bool) - whether to read the data as a CSR matrix, see read_data, so that the SPARSE_SOLVERS can be
+                        compared against the dense implementations on the same folds
+
+        tol (float) - tolerance of the ITERATIVE_SOLVERS, see fit_iterative
+
+        memory_limit (int) - bytes each fit may allocate, see run_linreg
+
+        timeout (float) - seconds each fit may take, see run_linreg
+
+        result_cache_dir (Path) - folder of the result cache, see ols_common.result_cache, None to always refit
+
+        profile (bool) - whether to profile the folds of every regressor, see ols_common.profiling.SolverProfiler, saved in
+                         a {data_name}-profile folder next to the results. A profiled run does not use the result cache, and
+                         fits sandboxed by a memory_limit or timeout run in a child process that is not profiled
+
+        tsqr_workers (int) - worker processes of parallel-tsqr, the available cores if None, see fit_model
         
     Returns:
     
         csv files of results
     """
-    X, y = read_data(data_path)
-    cv_data = gen_cv_samples(X, y, k_folds)
+    X, y = read_data(data_path, cache_dir, sparse=sparse)
+    data_digest = file_digest(data_path)
+    profiler = SolverProfiler(profile)
+    result_cache_dir = None if profile else result_cache_dir
+    auto_selection = None
+    if "auto" in reg_names:
+        choice, auto_selection = select_solver(X, n_rows=X.shape[0] - X.shape[0] // k_folds)
+        reg_names = list(dict.fromkeys(choice if name == "auto" else name for name in reg_names))
     
-    metric_lst = [
-        ("MAE", metrics.mean_absolute_error),
-        ("MSE", metrics.mean_squared_error),
-        ("RMSE", lambda y_true, y_pred: metrics.mean_squared_error(y_true, y_pred)**(1/2)),
-        ("R2", metrics.r2_score),
-    ]
-
-    # run the regression models and recording error metrics and thrown errors for each model
-    for metric_name, formula in metric_lst:
-        result_accumulator = {}
-        err_accumulator = {}
-        for name in reg_names:
-            res, err = run_linreg(cv_data, name, formula)
-            if res:
-                result_accumulator[name] = res
-            if err:
-                err_accumulator[name] = err
-        
-        results_df = pd.DataFrame(result_accumulator)
+    # run the regression models once per fold, recording every error metric and thrown errors for each model
+    result_accumulator = {metric_name: {} for metric_name in METRIC_NAMES + PROFILE_METRICS + CONVERGENCE_METRICS}
+    task_log = []
+    for name in reg_names:
+        key = cache_key(data=data_digest, solver=name, k_folds=k_folds, seed=100, precision=str(X.dtype), sparse=sparse,
+                        tol=tol, measure_memory=measure_memory, **({"workers": tsqr_workers} if name == TSQR_SOLVER else {}))
+        cached = cache_get(key, result_cache_dir)
+        if cached is not None:
+            res, err = cached
+        elif name in GRAM_CV_SOLVERS:
+            with profiler.span(name):
+                res, err = run_gram_cv(X, y, k_folds, name)
+        else:
+            with profiler.span(name):
+                res, err = run_linreg(gen_cv_samples(X, y, k_folds), name, measure_memory, tol, memory_limit, timeout, tsqr_workers)
+        if cached is None and res and not err and all(fold.get("status", "ok") == "ok" for fold in res):
+            cache_put(key, (res, err), result_cache_dir)
+        if res:
+            for metric_name in METRIC_NAMES + PROFILE_METRICS + CONVERGENCE_METRICS:
+                result_accumulator[metric_name][name] = [fold[metric_name] for fold in res]
+            task_log += [{"solver": name, "fold": i, "status": fold.get("status", "ok"), "error": fold.get("error")}
+                         for i, fold in enumerate(res)]
+        else:
+            task_log.append({"solver": name, "fold": None, "status": "error", "error": "\n".join(err)})
+
+    if auto_selection:
+        write_auto_selection(auto_selection, result_accumulator["wall_time"].get(auto_selection["choice"]), data_name,
+                             "high_dimensional_exper/data/results")
+
+    density = X.nnz / np.prod(X.shape) if sparse else np.count_nonzero(X) / X.size
+    write_fold_shapes(X.shape[0], X.shape[1], k_folds, data_name, "high_dimensional_exper/data/results", density)
+    pd.DataFrame(task_log).to_csv(f"high_dimensional_exper/data/results/{data_name}-task_log.csv", index=False)
+    profiler.write(Path("high_dimensional_exper/data/results") / f"{data_name}-profile")
+    for metric_name in METRIC_NAMES + PROFILE_METRICS + CONVERGENCE_METRICS:
+        results_df = pd.DataFrame(result_accumulator[metric_name])
         results_df.to_csv(f"high_dimensional_exper/data/results/{data_name}-{metric_name}_linreg_comparison.csv")
-    
-        with open(f"high_dimensional_exper/data/results/{data_name}-{metric_name}_errors.err", "a") as e_log:
-            for k, v in err_accumulator.items():
-                e_log.write(f"{k}: {v}\n")
 
 
+def stream_folds(data_path: str, n_cv_folds: int, chunksize=100_000, na_values="?", fill_value=0, seed=100):
+    """
+    Streams a csv file in chunks, cleaning each chunk as read_data does, and yields the rows of every fold in each chunk.
+    Rows are dealt to the folds in turn and the deal is shuffled within each chunk, so the file never has to fit in
+    memory, the folds are random and their sizes differ by at most one row. Passes with the same seed deal the rows
+    the same way.
+
+    Args:
+
+        data_path (str) - path to the csv file
+
+        n_cv_folds (int) - number of cv folds
+
+        chunksize (int) - number of rows read at a time
+
+        na_values (str) - value marking missing data in the csv
+
+        fill_value (float) - value missing data is replaced with
+
+        seed (int) - seed used to shuffle the rows within each chunk
+
+    Yields:
+
+        fold (int), X_f (nd.array), y_f (nd.array) - the rows of a chunk that belong to a fold, possibly none
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = 0
+    for chunk in pd.read_csv(data_path, na_values=na_values, chunksize=chunksize):
+        arr = chunk.fillna(fill_value).values.astype(np.float64)
+        folds = rng.permutation((n_rows + np.arange(arr.shape[0])) % n_cv_folds)
+        n_rows += arr.shape[0]
+        order = np.argsort(folds, kind="stable")
+        counts = np.bincount(folds, minlength=n_cv_folds)
+        X, y = arr[order, :-1], arr[order, -1]
+
+        stops = np.cumsum(counts)
+        for fold, (start, stop) in enumerate(zip(stops - counts, stops)):
+            yield fold, X[start:stop], y[start:stop]
+
+
+def accumulate_normal_equations(data_path: str, n_cv_folds: int, chunksize=100_000, na_values="?", fill_value=0, seed=100) -> dict:
+    """
+    Accumulates the sufficient statistics of least squares for every fold of a csv file streamed by stream_folds:
+    X^T X, X^T y, y^T y, the sum of y and the row count.
+
+    Args:
+
+        data_path (str) - path to the csv file
+
+        n_cv_folds (int) - number of cv folds
+
+        chunksize (int) - number of rows read at a time
+
+        na_values (str) - value marking missing data in the csv
+
+        fill_value (float) - value missing data is replaced with
+
+        seed (int) - seed used to shuffle the rows within each chunk
+
+    Returns:
+
+        acc (dict) - dictionary of per-fold statistics with keys "gram", "moment", "yy", "y_sum" and "count"
+    """
+    acc = None
+    for fold, X_f, y_f in stream_folds(data_path, n_cv_folds, chunksize, na_values, fill_value, seed):
+        if acc is None:
+            n_cols = X_f.shape[1]
+            acc = {
+                "gram": np.zeros((n_cv_folds, n_cols, n_cols)),
+                "moment": np.zeros((n_cv_folds, n_cols)),
+                "yy": np.zeros(n_cv_folds),
+                "y_sum": np.zeros(n_cv_folds),
+                "count": np.zeros(n_cv_folds, dtype=np.int64),
+            }
+
+        acc["gram"][fold] += X_f.T @ X_f
+        acc["moment"][fold] += X_f.T @ y_f
+        acc["yy"][fold] += y_f @ y_f
+        acc["y_sum"][fold] += y_f.sum()
+        acc["count"][fold] += y_f.shape[0]
+
+    return acc
+
+
+def solve_gram(gram: np.ndarray, moment: np.ndarray) -> np.ndarray:
+    """
+    Solves the normal equations with a Cholesky decomposition, falling back to a minimum-norm least squares solve of the
+    normal equations when the Gram matrix is singular (e.g. a column that is all zeros after cleaning)
+
+    Args:
+
+        gram (nd.array) - X^T X
+
+        moment (nd.array) - X^T y
+
+    Returns:
+
+        model (nd.array) - the coefficients
+    """
+    try:
+        return sp.linalg.cho_solve(sp.linalg.cho_factor(gram), moment)
+    except np.linalg.LinAlgError:
+        return sp.linalg.lstsq(gram, moment)[0]
+
+
+def streaming_cv(data_path: str, n_cv_folds: int, chunksize=100_000, na_values="?", fill_value=0, seed=100) -> tuple[np.ndarray, list]:
+    """
+    Fits OLS on a csv file that may be larger than memory and cross validates it in two passes over the file. The first
+    accumulates the normal equations of every fold (see accumulate_normal_equations), from which the model of each fold
+    is solved. The second deals the rows to the same folds and scores each fold model on the residuals of its test rows.
+    Expanding SSE = y^T y - 2 b^T X^T y + b^T X^T X b from the statistics alone would cancel catastrophically once y
+    has a large offset, and would not give the MAE. The scores of the empty folds of a file with fewer rows than folds
+    are NaN.
+
+    Args:
+
+        data_path (str) - path to the csv file
+
+        n_cv_folds (int) - number of cv folds
+
+        chunksize (int) - number of rows read at a time
+
+        na_values (str) - value marking missing data in the csv
+
+        fill_value (float) - value missing data is replaced with
+
+        seed (int) - seed used to shuffle the rows within each chunk
+
+    Returns:
+
+        model (nd.array) - coefficients fitted on the whole file
+
+        accumulator (list) - list of dictionaries of format {metric name: score}, one for each fold
+    """
+    acc = accumulate_normal_equations(data_path, n_cv_folds, chunksize, na_values, fill_value, seed)
+    total_gram, total_moment = acc["gram"].sum(axis=0), acc["moment"].sum(axis=0)
+    model = solve_gram(total_gram, total_moment)
+
+    fold_models = [solve_gram(total_gram - gram, total_moment - moment) for gram, moment in zip(acc["gram"], acc["moment"])]
+    y_means = acc["y_sum"] / np.maximum(acc["count"], 1)
+
+    sse, sae, sst = np.zeros(n_cv_folds), np.zeros(n_cv_folds), np.zeros(n_cv_folds)
+    for fold, X_f, y_f in stream_folds(data_path, n_cv_folds, chunksize, na_values, fill_value, seed):
+        residuals = y_f - X_f @ fold_models[fold]
+        sse[fold] += residuals @ residuals
+        sae[fold] += np.abs(residuals).sum()
+        sst[fold] += np.sum((y_f - y_means[fold])**2)
+
+    accumulator = []
+    for fold, count in enumerate(acc["count"]):
+        if count == 0:
+            accumulator.append(dict.fromkeys(METRIC_NAMES, np.nan))
+            continue
+        mse = sse[fold] / count
+        accumulator.append({"MAE": sae[fold] / count, "MSE": mse, "RMSE": np.sqrt(mse),
+                            "R2": 1 - sse[fold] / sst[fold] if sst[fold] else float(sse[fold] == 0)})
+
+    return model, accumulator
+
+
+def run_streaming(data_path: str, k_folds: int, data_name: str, chunksize=100_000,
+                  results_dir=Path("high_dimensional_exper/data/results")) -> np.ndarray:
+    """
+    Runs streaming_cv on a csv file and saves the fold scores in the format of main, under the regressor name
+    "stream-necd", as {data_name}-{metric}_stream_comparison.csv. The folds are not those of main, so the scores are
+    kept apart from its {data_name}-{metric}_linreg_comparison.csv files.
+
+    Args:
+
+        data_path (str) - path to the csv file
+
+        k_folds (int) - number of cv folds
+
+        data_name (str) - name of the dataset
+
+        chunksize (int) - number of rows read at a time
+
+        results_dir (Path) - folder the CSVs are written to
+
+    Returns:
+
+        model (nd.array) - coefficients fitted on the whole file
+    """
+    model, res = streaming_cv(data_path, k_folds, chunksize)
+    results_dir.mkdir(exist_ok=True, parents=True)
+    for metric_name in METRIC_NAMES:
+        results_df = pd.DataFrame({"stream-necd": [fold[metric_name] for fold in res]})
+        results_df.to_csv(results_dir / f"{data_name}-{metric_name}_stream_comparison.csv")
+
+    return model
+
+
+_WORKER_DATA = {}
+
+
+def share_dataset(X: np.ndarray, y: np.ndarray, seed=100) -> tuple[SharedMemory, dict]:
+    """
+    Shuffles the rows of a dataset (as gen_cv_samples does) and writes them into a shared memory block, so that the
+    workers of run_parallel can read the folds without each holding a copy of the dataset. A CSR matrix is shared as
+    its data, indices and indptr arrays and the labels, one after the other in the block
+
+    Args:
+
+        X (nd.array or sparse matrix) - data already processed
+
+        y (nd.array) - labels already processed
+
+        seed (int) - seed used to shuffle the rows
+
+    Returns:
+
+        shm (SharedMemory) - the block, to be closed and unlinked by the caller
+
+        spec (dict) - what attach_dataset needs to find the block
+    """
+    X_perm, y_perm = permute_rows(X, y, seed)
+    if sp.sparse.issparse(X_perm):
+        X_perm = X_perm.tocsr()
+        parts = {"data": X_perm.data, "indices": X_perm.indices, "indptr": X_perm.indptr, "y": np.asarray(y_perm, dtype=np.float64)}
+        layout, size = {}, 0
+        for key, part in parts.items():
+            layout[key] = (size, part.dtype.str, part.size)
+            # every part starts on an 8 byte boundary
+            size += part.nbytes + -part.nbytes % 8
+        shm = SharedMemory(create=True, size=max(size, 1))
+        for key, part in parts.items():
+            offset, dtype, length = layout[key]
+            np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=offset)[:] = part
+        return shm, {"name": shm.name, "shape": X_perm.shape, "csr": layout}
+
+    shape = (X_perm.shape[0], X_perm.shape[1] + 1)
+    shm = SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.float64).itemsize)
+    arr = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    arr[:, :-1], arr[:, -1] = X_perm, y_perm
+    return shm, {"name": shm.name, "shape": shape}
+
+
+def attach_dataset(spec: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns read-only views of a dataset shared by share_dataset. Each worker attaches to a dataset once.
+
+    Args:
+
+        spec (dict) - as returned by share_dataset
+
+    Returns:
+
+        X, y (nd.array) - views of the shuffled data and labels, X is a CSR matrix over the shared arrays for a CSR dataset
+    """
+    if spec["name"] not in _WORKER_DATA:
+        shm = SharedMemory(name=spec["name"])
+        if "csr" in spec:
+            parts = {key: np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=offset)
+                     for key, (offset, dtype, length) in spec["csr"].items()}
+            for part in parts.values():
+                part.flags.writeable = False
+            X = sp.sparse.csr_matrix((parts["data"], parts["indices"], parts["indptr"]), shape=spec["shape"], copy=False)
+            _WORKER_DATA[spec["name"]] = (shm, X, parts["y"])
+        else:
+            arr = np.ndarray(spec["shape"], dtype=np.float64, buffer=shm.buf)
+            arr.flags.writeable = False
+            _WORKER_DATA[spec["name"]] = (shm, arr[:, :-1], arr[:, -1])
+
+    return _WORKER_DATA[spec["name"]][1:]
+
+
+def task_scores(spec: dict, regr_name: str, fold, bounds: list, measure_memory=False, memory_limit=None, tsqr_workers=1) -> list:
+    """
+    Scores one task of run_task on the shared dataset. The memory limit is set after attaching to the dataset, so that
+    the mapping of the shared block does not count against it, and lifted once the task is scored
+
+    Args:
+
+        spec (dict) - as returned by share_dataset, of the CSR dataset for the SPARSE_SOLVERS
+
+        regr_name (str) - name of the regression model to run
+
+        fold (int) - fold to fit, None for the fast cross validation paths, which run every fold at once
+
+        bounds (list) - the (start, stop) rows of every fold
+
+        measure_memory (bool) - whether to record the peak memory of the fit, see profile_fit
+
+        memory_limit (int) - bytes the task may allocate on top of the process's memory, None for no limit
+
+        tsqr_workers (int) - worker processes of parallel-tsqr, see fit_model
+
+    Returns:
+
+        scores (list) - list of dictionaries of format {metric name: score}, one for each fold of the task
+    """
+    X, y = attach_dataset(spec)
+    if memory_limit is not None:
+        limit_memory(memory_limit)
+    try:
+        if fold is None:
+            return profile_gram_cv(X, y, len(bounds), regr_name, seed=None)
+
+        start, stop = bounds[fold]
+        if sp.sparse.issparse(X):
+            X_tr = sp.sparse.vstack((X[:start], X[stop:]), format="csr")
+        else:
+            X_tr = np.concatenate((X[:start], X[stop:]))
+        y_tr = np.concatenate((y[:start], y[stop:]))
+        model, stats = profile_fit(regr_name, X_tr, y_tr, measure_memory, tsqr_workers=tsqr_workers)
+        return [{**score_predictions(y[start:stop], LinearModel.from_fit(model, regr_name).predict(X[start:stop])), **stats}]
+
+    finally:
+        # lifted before the outcome is sent back, which needs memory of its own
+        if memory_limit is not None:
+            limit_memory(None)
+
+
+def run_task(task: tuple) -> list:
+    """
+    Runs one (dataset, solver, fold) task of run_parallel in a worker process. The task is scored in a child process of
+    the worker, see ols_common.sandbox.run_sandboxed, which is killed once the timeout passes, even in the middle of a
+    native solver call. Errors, timeouts and running out of memory are captured in the returned records instead of
+    stopping the run. With a memory limit, the child's address space is capped, so that an allocation past it is
+    recorded as "OOM".
+
+    Args:
+
+        task (tuple) - (data_name, spec, regr_name, fold, bounds, timeout, measure_memory, memory_limit, tsqr_workers) where fold is None for
+                        the fast cross validation paths, which run every fold at once, and bounds lists the (start, stop) rows of every fold
+
+    Returns:
+
+        records (list) - list of dictionaries with the dataset, solver, fold, status, error, error metrics, PROFILE_METRICS
+                         and CONVERGENCE_METRICS
+    """
+    data_name, spec, regr_name, fold, bounds, timeout, measure_memory, memory_limit, tsqr_workers = task
+    folds = range(len(bounds)) if fold is None else [fold]
+    records = [{"dataset": data_name, "solver": regr_name, "fold": i, "status": "ok", "error": None} for i in folds]
+
+    # the limit is set by task_scores rather than the sandbox, so a child that segfaults under it is handled here
+    status, scores, error = run_sandboxed(task_scores, (spec, regr_name, fold, bounds, measure_memory, memory_limit, tsqr_workers),
+                                          timeout=timeout, isolate=True)
+    if status == "SIGSEGV" and memory_limit is not None:
+        status = "OOM"
+
+    if status == "ok":
+        for record, score in zip(records, scores):
+            record.update(score)
+    else:
+        for record in records:
+            record["status"], record["error"] = status, error
+
+    return records
+
+
+def write_task_results(task_log: pd.DataFrame, reg_names: list, results_dir: Path):
+    """
+    Writes the records of run_parallel as one CSV per dataset and error metric (or time, memory and convergence
+    measurement), in the same format as main, plus one task log per dataset holding the status and captured error of
+    every task
+
+    Args:
+
+        task_log (pd.DataFrame) - records returned by run_task
+
+        reg_names (list) - list of regression names, used to order the columns
+
+        results_dir (Path) - folder the CSVs are written to
+
+    Returns:
+
+        None
+    """
+    results_dir.mkdir(exist_ok=True, parents=True)
+    for data_name, group in task_log.groupby("dataset"):
+        ok = group[group.status == "ok"].astype({"fold": int})
+        for metric_name in METRIC_NAMES + PROFILE_METRICS + CONVERGENCE_METRICS:
+            if ok.empty:
+                break
+            results_df = ok.pivot(index="fold", columns="solver", values=metric_name)
+            results_df = results_df[[name for name in reg_names if name in results_df.columns]]
+            results_df.index.name = None
+            results_df.to_csv(results_dir / f"{data_name}-{metric_name}_linreg_comparison.csv")
+
+        group[["solver", "fold", "status", "error"]].to_csv(results_dir / f"{data_name}-task_log.csv", index=False)
+
+
+def run_parallel(datasets: dict, reg_names: list, k_folds: int, n_workers=None, timeout=None,
+                 results_dir=Path("high_dimensional_exper/data/results"), cache_dir=DATA_CACHE_DIR, measure_memory=False,
+                 memory_limit=None, result_cache_dir=RESULT_CACHE_DIR, shard=None, tsqr_workers=1) -> pd.DataFrame:
+    """
+    Runs every (dataset, solver, fold) task across a pool of processes. Each dataset is read once by this process and
+    shared read-only with the workers through shared memory, as a CSR matrix (see read_sparse_data) for the
+    SPARSE_SOLVERS, so that they are fitted on the folds without densifying them. Every task has its own timeout and error capture. Tasks
+    whose records are in the result cache are not run again, see main. A shard only runs its share of the tasks, see
+    ols_common.sharding.shard_cells, and saves their records as shards/shard-{index}-of-{count}.csv in results_dir
+    for merge_task_shards to write the CSVs from.
+
+    Args:
+
+        datasets (dict) - dictionary of format {data_name: data_path}
+
+        reg_names (list) - list of regression names to run, including the fast cross validation paths in GRAM_CV_SOLVERS
+
+        k_folds (int) - number of cv folds to generate
+
+        n_workers (int) - number of worker processes, None to use every core
+
+        timeout (float) - seconds a task may run before it is recorded as "timeout", None for no limit
+
+        results_dir (Path) - folder the CSVs are written to
+
+        cache_dir (Path) - folder of the dataset cache, see read_data
+
+        measure_memory (bool) - whether to record the peak memory of each fit, which fits each fold a second time
+
+        memory_limit (int) - bytes a task may allocate on top of the memory of its process, see run_task, None for no limit
+
+        result_cache_dir (Path) - folder of the result cache, see ols_common.result_cache, None to always refit
+
+        shard (tuple) - (index, count) of the shard to run, as returned by ols_common.sharding.shard_from_env, None
+                        to run every task. The fast cross validation paths are one task for all folds
+
+        tsqr_workers (int) - worker processes of each parallel-tsqr fit, see fit_model. The tasks already run on every
+                             core, so by default a parallel-tsqr fit does not start a pool of its own
+
+    Returns:
+
+        task_log (pd.DataFrame) - one record per (dataset, solver, fold) of the shard
+    """
+    # the grid does not depend on the data, so every shard splits it the same way, even if a dataset fails to load
+    cells = [(data_name, name, fold) for data_name in datasets for name in reg_names
+             for fold in ([None] if name in GRAM_CV_SOLVERS else range(k_folds))]
+    cells = shard_cells(cells, shard)
+    shms = []
+    tasks = []
+    keys = []
+    records = []
+    try:
+        for data_name, data_path in datasets.items():
+            data_cells = [(name, fold) for cell_data, name, fold in cells if cell_data == data_name]
+            if not data_cells:
+                continue
+            # the SPARSE_SOLVERS read the dataset as a CSR matrix, the other solvers as a dense array
+            names = {name for name, _ in data_cells}
+            formats = [sparse for sparse, needed in ((False, names - set(SPARSE_SOLVERS)), (True, names & set(SPARSE_SOLVERS))) if needed]
+            try:
+                loaded = {sparse: read_data(data_path, cache_dir, sparse=sparse) for sparse in formats}
+            except Exception:
+                records.append({"dataset": data_name, "solver": None, "fold": None, "status": "error", "error": traceback.format_exc()})
+                continue
+
+            specs = {}
+            for sparse, (X, y) in loaded.items():
+                shm, specs[sparse] = share_dataset(X, y)
+                shms.append(shm)
+            bounds = fold_bounds(X.shape[0], k_folds)
+            density = X.nnz / np.prod(X.shape) if sparse else np.count_nonzero(X) / X.size
+            results_dir.mkdir(exist_ok=True, parents=True)
+            write_fold_shapes(X.shape[0], X.shape[1], k_folds, data_name, results_dir, density)
+            data_digest, precision = file_digest(data_path), str(X.dtype)
+            del X, y, loaded
+
+            for name, fold in data_cells:
+                key = cache_key(data=data_digest, solver=name, k_folds=k_folds, fold=fold, seed=100, precision=precision,
+                                measure_memory=measure_memory, **({"workers": tsqr_workers} if name == TSQR_SOLVER else {}),
+                                **({"sparse": True} if name in SPARSE_SOLVERS else {}))
+                cached = cache_get(key, result_cache_dir)
+                if cached is not None:
+                    records += [{**record, "dataset": data_name} for record in cached]
+                    continue
+                tasks.append((data_name, specs[name in SPARSE_SOLVERS], name, fold, bounds, timeout, measure_memory, memory_limit,
+                              tsqr_workers))
+                keys.append(key)
+
+        # spawned workers do not inherit the thread pools of the already imported libraries
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("spawn")) as pool:
+            for key, task_records in zip(keys, pool.map(run_task, tasks)):
+                if all(record["status"] == "ok" for record in task_records):
+                    cache_put(key, task_records, result_cache_dir)
+                records += task_records
+
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    task_log = pd.DataFrame(records)
+    if shard is not None:
+        (results_dir / "shards").mkdir(exist_ok=True, parents=True)
+        task_log.to_csv(results_dir / "shards" / f"{shard_name(shard)}.csv", index=False)
+    else:
+        write_task_results(task_log, reg_names, results_dir)
+    return task_log
+
+
+def merge_task_shards(reg_names: list, results_dir=Path("high_dimensional_exper/data/results")) -> pd.DataFrame:
+    """
+    Combines the records of the shards of a sharded run_parallel and writes the CSVs of an unsharded run from them. A
+    dataset that failed to load is recorded by every shard that had tasks of it, and is kept once
+
+    Args:
+
+        reg_names (list) - list of regression names the shards ran, used to order the columns
+
+        results_dir (Path) - folder the shards wrote to
+
+    Returns:
+
+        task_log (pd.DataFrame) - one record per (dataset, solver, fold)
+    """
+    results_dir = Path(results_dir)
+    # a shard without tasks, in an array larger than the grid, writes an empty CSV
+    shards = [path for path in find_shards(results_dir / "shards", ".csv") if path.read_text().strip()]
+    task_log = pd.concat([pd.read_csv(path) for path in shards], ignore_index=True)
+    order = {name: i for i, name in enumerate(reg_names)}
+    task_log = task_log.drop_duplicates(subset=["dataset", "solver", "fold"]).sort_values(
+        ["dataset", "solver", "fold"], key=lambda column: column.map(order) if column.name == "solver" else column, kind="stable")
+    print(f"Merged {task_log.shape[0]} records")
+
+    write_task_results(task_log, reg_names, results_dir)
+    return task_log
+
 if __name__ == "__main__":
     high_dim_data = {"Superconductivity": "high_dimensional_exper/data/Conductivity.csv",
-                        "Residential Building": "BetaDataExper/HighDimData/data/Residential-Building-Data-Set.csv",
-                        "Geographical Origin of Music": "BetaDataExper/HighDimData/data/Geographical-Music.csv",
-                        "Facebook Comment Volume": "BetaDataExper/HighDimData/data/Facebook-Comments.csv",
-                        "Online News Popularity": "BetaDataExper/HighDimData/data/Online-News-Popularity.csv",                
-                        "Communities and Crime": "BetaDataExper/HighDimData/data/communities.csv",
-                        "Hailstone": "BetaDataExper/HighDimData/data/hailstone_data.csv",
-                        "Hourly Energy Demand": "BetaDataExper/HighDimData/data/energy_dataset.csv",
-                        "KEGG Metabolic Pathway": "BetaDataExper/HighDimData/data/KEGG-Metabolic.csv",
-                        "Blog Feedback": "BetaDataExper/HighDimData/data/blog.csv"}
+                        "Residential Building": "high_dimensional_exper/data/Residential-Building-Data-Set.csv",
+                        "Geographical Origin of Music": "high_dimensional_exper/data/Geographical-Music.csv",
+                        "Facebook Comment Volume": "high_dimensional_exper/data/Facebook-Comments.csv",
+                        "Online News Popularity": "high_dimensional_exper/data/Online-News-Popularity.csv",                
+                        "Communities and Crime": "high_dimensional_exper/data/communities.csv",
+                        "Hailstone": "high_dimensional_exper/data/hailstone_data.csv",
+                        "Hourly Energy Demand": "high_dimensional_exper/data/energy_dataset.csv",
+                        "KEGG Metabolic Pathway": "high_dimensional_exper/data/KEGG-Metabolic.csv",
+                        "Blog Feedback": "high_dimensional_exper/data/blog.csv"}
     reg_names = ["tf-necd", "sklearn-svddc"]
               #  "tf-necd", "tf-cod", "pytorch-qrcp", "pytorch-qr", "pytorch-svd", "pytorch-svddc", "sklearn-svddc", "mxnet-svddc"
-    for data_name, path in high_dim_data.items():
-        main(data_path = path, k_folds = 10, data_name = data_name, reg_names = reg_names)
-        break
-        
\ No newline at end of file
+              #  sparse data: "scipy-lsqr", "scipy-lsmr", "torch-sparse-cg"
+              #  iterative: "numpy-cgls", "numpy-necg", "numpy-sgd"
+              #  sketch-and-precondition: "scipy-gauss-lsqr", "scipy-srht-lsqr", "scipy-cs-lsqr"
+              #  mixed precision: "torch-mpir"
+              #  multi-process: "parallel-tsqr"
+    # as a task of a SLURM array job (sbatch --array=0-9) only the task's shard of the (dataset, solver, fold) grid runs.
+    # "python run_datasets.py merge" then writes the CSVs from the shards, and "python run_datasets.py local 4" runs 4
+    # shards as subprocesses and merges them
+    if sys.argv[1:2] == ["merge"]:
+        task_log = merge_task_shards(reg_names)
+    elif sys.argv[1:2] == ["local"]:
+        run_shards(Path(__file__).resolve(), int(sys.argv[2]))
+        task_log = merge_task_shards(reg_names)
+    else:
+        task_log = run_parallel(high_dim_data, reg_names, k_folds = 10, timeout = 3600, shard=shard_from_env())
+    print(task_log.groupby(["dataset", "status"]).size())
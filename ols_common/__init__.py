@@ -0,0 +1,4 @@
+"""
+Code shared by the experiments. The experiment scripts are run as plain scripts, so they add the repository root to
+sys.path before importing from this package.
+"""
@@ -0,0 +1,191 @@
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy as sp
+from yaml import load, SafeLoader
+
+from ols_common.complexity import comp_complexity_dict
+from ols_common.iterative import ITERATIVE_TOL
+from ols_common.sketch import SKETCH_OVERSAMPLING, SKETCH_SOLVERS, SKETCH_TOL, sketch_rows
+
+
+COST_MODEL_DIR = Path(__file__).resolve().parents[1] / "complexity_exper" / "analysis" / "complexity_results"
+ACCURACY_TARGET = 1e-6
+# torch.Tensor converts the data to float32 before the PyTorch solvers run
+FLOAT32_SOLVERS = ["pytorch-qrcp", "pytorch-qr", "pytorch-svd", "pytorch-svddc"]
+NORMAL_EQUATION_SOLVERS = ["tf-necd", "numpy-necg"]
+RANK_REVEALING_SOLVERS = ["tf-cod", "pytorch-qrcp", "pytorch-svd", "pytorch-svddc", "sklearn-svddc", "mxnet-svddc", *SKETCH_SOLVERS]
+TOLERANCE_SOLVERS = {"numpy-cgls": ITERATIVE_TOL, "numpy-necg": ITERATIVE_TOL, **dict.fromkeys(SKETCH_SOLVERS, SKETCH_TOL)}
+
+
+def estimate_problem(X, oversampling=SKETCH_OVERSAMPLING, seed=100) -> dict:
+    """
+    Estimates the rank and condition number of X from the singular values of a CountSketch of oversampling * n rows,
+    which are within a small factor of those of X and cost one pass over the data plus an SVD of the sketch
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data
+
+        oversampling (float) - see ols_common.sketch.sketch_lsqr
+
+        seed (int) - seed of the sketch
+
+    Returns:
+
+        estimate (dict) - dictionary with the rows m, columns n, rank and cond (of the rank part of X, inf if X is zero)
+    """
+    m, n = X.shape
+    n_sketch = min(m, math.ceil(oversampling * n))
+    SX = sketch_rows(X, n_sketch, "countsketch", np.random.default_rng(seed)) if n_sketch < m else X
+    SX = SX.toarray() if sp.sparse.issparse(SX) else np.asarray(SX, dtype=np.float64)
+
+    sigma = np.linalg.svd(SX, compute_uv=False)
+    rank = int(np.sum(sigma > sigma[0] * max(SX.shape) * np.finfo(np.float64).eps)) if sigma.size and sigma[0] else 0
+    cond = float(sigma[0] / sigma[rank - 1]) if rank else math.inf
+
+    return {"m": m, "n": n, "rank": rank, "cond": cond}
+
+
+def load_timings(results_dir: Path) -> pd.DataFrame:
+    """
+    Reads the runtimes stored by complexity_experiment.py, from raw_data/actual_time.yaml if present and otherwise from
+    processed_output/actual_runtime.csv of the postprocessing notebook
+
+    Args:
+
+        results_dir (Path) - a complexity_results folder
+
+    Returns:
+
+        timings (pd.DataFrame) - one row per (solver, m) with the median runtime in seconds and the n and r of the data
+    """
+    with open(results_dir / "metadata.yaml", "r") as f:
+        metadata = load(f, SafeLoader)
+    # the experiment's last column is the target, and its random normal data has full rank
+    n = int(metadata["dataset_shape"].split("x")[-1]) - 1
+
+    raw_path = results_dir / "raw_data" / "actual_time.yaml"
+    if raw_path.exists():
+        with open(raw_path, "r") as f:
+            raw = load(f, SafeLoader)
+        timings = pd.DataFrame([(solver, rows, time) for solver, pairs in raw.items() for rows, time in pairs if time is not None],
+                               columns=["solver", "m", "time"])
+    else:
+        runtime = pd.read_csv(results_dir / "processed_output" / "actual_runtime.csv", index_col=0)
+        timings = runtime.rename_axis("m").reset_index().melt(id_vars="m", var_name="solver", value_name="time").dropna()
+
+    timings = timings.groupby(["solver", "m"]).time.median().reset_index()
+    timings["time"] /= 1e9
+    timings["n"], timings["r"] = n, n
+
+    return timings
+
+
+def fit_cost_models(results_dir=COST_MODEL_DIR) -> dict:
+    """
+    Fits time = overhead + seconds_per_flop * flops for every solver timed in results_dir, with the flops of
+    comp_complexity_dict. The fit is non-negative and minimizes the relative error, so that the small row counts are not
+    drowned out by the large ones
+
+    Args:
+
+        results_dir (Path) - a complexity_results folder written on this machine
+
+    Returns:
+
+        cost_models (dict) - dictionary of format {solver: (overhead in seconds, seconds per flop)}
+    """
+    cost_models = {}
+    for solver, group in load_timings(Path(results_dir)).groupby("solver"):
+        flops = np.array([comp_complexity_dict(solver)(x) for x in zip(group.m, group.n, group.r)], dtype=np.float64)
+        A = np.column_stack((np.ones_like(flops), flops)) / group.time.values[:, np.newaxis]
+        coef, _ = sp.optimize.nnls(A, np.ones(len(flops)))
+        cost_models[solver] = (float(coef[0]), float(coef[1]))
+
+    return cost_models
+
+
+def predict_time(cost_models: dict, solver: str, m: int, n: int, r: int) -> float:
+    """
+    Predicted runtime in seconds of a solver on an m x n problem of rank r, see fit_cost_models
+    """
+    overhead, seconds_per_flop = cost_models[solver]
+    return overhead + seconds_per_flop * comp_complexity_dict(solver)((m, n, r))
+
+
+def expected_error(solver: str, cond: float) -> float:
+    """
+    First order bound on the relative error of the coefficients: u * cond for backward stable factorizations and
+    u * cond^2 for the normal equations, with u the unit roundoff of the precision the solver computes in. The
+    iterative solvers can not do better than their tolerance
+
+    Args:
+
+        solver (str) - name of the regressor
+
+        cond (float) - condition number of the data
+
+    Returns:
+
+        error (float)
+    """
+    u = np.finfo(np.float32 if solver in FLOAT32_SOLVERS else np.float64).eps / 2
+    error = u * cond**2 if solver in NORMAL_EQUATION_SOLVERS else u * cond
+
+    return max(error, TOLERANCE_SOLVERS.get(solver, 0.0))
+
+
+def select_solver(X, candidates=None, cost_models=None, accuracy=ACCURACY_TARGET, n_rows=None) -> tuple[str, dict]:
+    """
+    Picks the solver with the smallest predicted runtime among those expected to reach the accuracy target. Rank
+    deficient data is left to the RANK_REVEALING_SOLVERS. If no candidate reaches the target, the most accurate one is
+    picked
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data
+
+        candidates (list) - solvers to choose from, every solver with a cost model if None
+
+        cost_models (dict) - as returned by fit_cost_models, fitted on COST_MODEL_DIR if None
+
+        accuracy (float) - target relative error of the coefficients
+
+        n_rows (int) - rows of the fits the runtime is predicted for, X.shape[0] if None
+
+    Returns:
+
+        solver (str) - the chosen solver
+
+        decision (dict) - the estimate of estimate_problem, the predicted_time and expected_error of every candidate,
+                          the choice and whether it meets the target, for logging
+    """
+    cost_models = fit_cost_models() if cost_models is None else cost_models
+    candidates = [c for c in (candidates or cost_models) if c in cost_models]
+    if not candidates:
+        raise ValueError("No stored complexity_experiment results for any of the candidate solvers")
+
+    estimate = estimate_problem(X)
+    m, n, rank = n_rows or estimate["m"], estimate["n"], estimate["rank"]
+    options = pd.DataFrame({
+        "solver": candidates,
+        "predicted_time": [predict_time(cost_models, c, m, n, max(rank, 1)) for c in candidates],
+        "expected_error": [expected_error(c, estimate["cond"]) for c in candidates],
+    })
+    options["feasible"] = (options.expected_error <= accuracy) & (options.solver.isin(RANK_REVEALING_SOLVERS) | (rank == n))
+
+    feasible = options[options.feasible]
+    choice = feasible.loc[feasible.predicted_time.idxmin()] if len(feasible) else options.loc[options.expected_error.idxmin()]
+    decision = {
+        **estimate,
+        "accuracy_target": accuracy,
+        "choice": choice.solver,
+        "meets_target": bool(choice.feasible),
+        "predicted_time": float(choice.predicted_time),
+        "candidates": options.set_index("solver")[["predicted_time", "expected_error", "feasible"]].to_dict("index"),
+    }
+
+    return choice.solver, decision
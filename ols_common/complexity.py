@@ -0,0 +1,68 @@
+import math
+
+from ols_common.iterative import SGD_MAX_EPOCHS
+from ols_common.mixed_precision import MPIR_MAX_ITER
+from ols_common.sketch import SKETCH_BLOCK_ENTRIES, SKETCH_OVERSAMPLING, sketch_iterations
+
+
+def comp_complexity_dict(reg: str, n_workers=1):
+    """
+    Retrieves a lambda function for the theoretical number of flops for the least squares solver employed by each library
+    lambda x takes an x of form (m, n, r)
+    |-----------------------------------------------------------------------------------------------------|
+    |   Regressor    |               Solver                 | Computational Complexity                    |
+    |-----------------------------------------------------------------------------------------------------|
+    |    tf-necd     |       Cholesky Decomposition         |  O(mn^2 + n^3)                              |
+    |     tf-cod     |   Complete Orthogonal Decomposition  |  O(2mnr - r^2*(m + n) + 2r^3/3 + r(n - r))  |
+    |  pytorch-qrcp  |    QR Factorization with Pivoting    |  O(4mnr - 2r^2*(m + n) + 4r^3/3)            |
+    |   pytorch-qr   |          QR Factorization            |  O(2mn^2 - 2n^3/3)                          |
+    |  pytorch-svd   |            Complete SVD              |  O(4mn^2 + 8n^3)                            |
+    | pytorch-svddc  |       SVD Divide-and-Conquer         |  O(mn^2)                                    |
+    | sklearn-svddc  |       SVD Divide-and-Conquer         |  O(mn^2)                                    |
+    |  mxnet-svddc   |       SVD Divide-and-Conquer         |  O(mn^2)                                    |
+    |   numpy-cgls   |    Conjugate Gradient Least Squares  |  O(4mnk + 2mn)                              |
+    |   numpy-necg   |      CG on the Normal Equations      |  O(mn^2 + 2n^2k)                            |
+    |   numpy-sgd    |      Mini-batch Gradient Descent     |  O(8mnE)                                    |
+    |scipy-gauss-lsqr|   Gaussian Sketch, Precond. LSQR     |  O(2smn + 4sn^2 + 8n^3 + k(4mn + 4n^2))     |
+    |scipy-srht-lsqr |     SRHT Sketch, Precond. LSQR       |  O(mn log2(b) + 4sn^2 + 8n^3 + k(4mn+4n^2)) |
+    | scipy-cs-lsqr  |    CountSketch, Precond. LSQR        |  O(mn + 4sn^2 + 8n^3 + k(4mn + 4n^2))       |
+    |   torch-mpir   |    Float32 QR, Float64 Refinement    |  O(2mn^2 - 2n^3/3 + K(4mn + 2n^2))          |
+    | parallel-tsqr  |  Shared Memory TSQR, Reduction Tree  |  O(2mn^2 + (8p - 10)n^3/3)                  |
+    |-----------------------------------------------------------------------------------------------------|
+    The iterative solvers stop at a tolerance, so their cost depends on the number of iterations k. In exact arithmetic the
+    conjugate gradient methods converge in at most r iterations, which is used for k. The E epochs of numpy-sgd (a pass of
+    mini-batch steps and a pass to check convergence) are taken at their upper bound SGD_MAX_EPOCHS.
+    The sketching solvers compress X into s = SKETCH_OVERSAMPLING * n rows, take the SVD of the sketch (as for pytorch-svd)
+    and run a number of LSQR iterations k that does not grow with m, see ols_common.sketch.sketch_iterations.
+    The SRHT transforms blocks of b = min(m, max(s, SKETCH_BLOCK_ENTRIES / n)) rows, see ols_common.sketch.sketch_rows.
+    torch-mpir factors X in float32 and refines in float64, see ols_common.mixed_precision.mpir_lstsq, with the K refinement
+    iterations taken at their upper bound MPIR_MAX_ITER.
+    parallel-tsqr factors p = n_workers blocks of m/p rows (2mn^2 - 2pn^3/3 in total) and combines the p R factors with
+    p - 1 QR factorizations of 2n x n matrices (10n^3/3 each), see ols_common.tsqr.tsqr_lstsq. The flops are those of all workers.
+    n_workers is the worker count the fits used, so the count does not depend on the machine.
+    
+
+    """
+    s = lambda x: min(x[0], SKETCH_OVERSAMPLING*x[1])
+    b = lambda x: min(x[0], max(s(x), SKETCH_BLOCK_ENTRIES // x[1]))
+    k = sketch_iterations()
+    p = n_workers
+    dict = {
+        "tf-necd": lambda x: math.floor(x[0]*x[1]**2 + x[1]**3),
+        "tf-cod": lambda x: math.floor(2*x[0]*x[1]*x[2] - x[2]**2*(x[0] + x[1]) + 2*x[2]**3/3 + x[2]*(x[1] - x[2])),
+        "pytorch-qrcp": lambda x: math.floor(4*x[0]*x[1]*x[2] - 2*x[2]**2*(x[0] + x[1]) + 4*x[2]**3/3),
+        "pytorch-qr": lambda x: math.floor(2*x[0]*x[1]**2 - 2*x[1]**3/3),
+        "pytorch-svd": lambda x: math.floor(4*x[0]*x[1]**2 + 8*x[1]**3),
+        "pytorch-svddc": lambda x: math.floor(x[0]*x[1]**2),
+        "sklearn-svddc": lambda x: math.floor(x[0]*x[1]**2),
+        "numpy-cgls": lambda x: math.floor(4*x[0]*x[1]*x[2] + 2*x[0]*x[1]),
+        "numpy-necg": lambda x: math.floor(x[0]*x[1]**2 + 2*x[1]**2*x[2]),
+        "numpy-sgd": lambda x: math.floor(8*x[0]*x[1]*SGD_MAX_EPOCHS),
+        "scipy-gauss-lsqr": lambda x: math.floor(2*s(x)*x[0]*x[1] + 4*s(x)*x[1]**2 + 8*x[1]**3 + k*(4*x[0]*x[1] + 4*x[1]**2)),
+        "scipy-srht-lsqr": lambda x: math.floor(x[0]*x[1]*math.log2(b(x)) + 4*s(x)*x[1]**2 + 8*x[1]**3 + k*(4*x[0]*x[1] + 4*x[1]**2)),
+        "scipy-cs-lsqr": lambda x: math.floor(x[0]*x[1] + 4*s(x)*x[1]**2 + 8*x[1]**3 + k*(4*x[0]*x[1] + 4*x[1]**2)),
+        "torch-mpir": lambda x: math.floor(2*x[0]*x[1]**2 - 2*x[1]**3/3 + MPIR_MAX_ITER*(4*x[0]*x[1] + 2*x[1]**2)),
+        "parallel-tsqr": lambda x: math.floor(2*x[0]*x[1]**2 + (8*p - 10)*x[1]**3/3),
+        }
+    
+    return dict[reg]
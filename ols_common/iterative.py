@@ -0,0 +1,224 @@
+import numpy as np
+import scipy as sp
+from time import perf_counter
+
+
+ITERATIVE_SOLVERS = ["numpy-cgls", "numpy-necg", "numpy-sgd"]
+ITERATIVE_TOL = 1e-8
+SGD_MAX_EPOCHS = 100
+SGD_BATCH_SIZE = 256
+
+
+def _normal_residual(X, y: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """
+    Returns X^T (y - Xw), the gradient of the least squares objective up to a factor of -2
+    """
+    return X.T @ (y - X @ w)
+
+
+def cgls(X, y: np.ndarray, tol=ITERATIVE_TOL, max_iter=None, timer=perf_counter) -> tuple[np.ndarray, dict]:
+    """
+    Conjugate gradient applied to the normal equations without forming X^T X (CGLS). Each iteration costs one product
+    with X and one with X^T
+
+    Args:
+
+        X (nd.array, sparse matrix or LinearOperator) - training data, only used through X @ v and X.T @ v
+
+        y (nd.array) - training labels
+
+        tol (float) - stops once ||X^T r|| / ||X^T y|| is at most tol
+
+        max_iter (int) - maximum number of iterations, 10 times the number of columns if None
+
+        timer (function) - timer used for the time to tolerance
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+
+        info (dict) - see fit_iterative
+    """
+    start = timer()
+    w = np.zeros(X.shape[1])
+    r = np.array(y, dtype=np.float64)
+    s = X.T @ r
+    p = s.copy()
+    gamma = s @ s
+    norm_b = np.sqrt(gamma)
+
+    iterations, time_to_tol = 0, None
+    for iterations in range(1, (max_iter or 10 * X.shape[1]) + 1):
+        if np.sqrt(gamma) <= tol * norm_b:
+            iterations -= 1
+            break
+        q = X @ p
+        alpha = gamma / (q @ q)
+        w += alpha * p
+        r -= alpha * q
+        s = X.T @ r
+        gamma_new = s @ s
+        p = s + (gamma_new / gamma) * p
+        gamma = gamma_new
+
+    final_error = np.sqrt(gamma) / norm_b if norm_b else 0.0
+    if final_error <= tol:
+        time_to_tol = timer() - start
+
+    return w, {"iterations": iterations, "time_to_tol": time_to_tol, "final_error": float(final_error)}
+
+
+def necg(X, y: np.ndarray, tol=ITERATIVE_TOL, max_iter=None, timer=perf_counter) -> tuple[np.ndarray, dict]:
+    """
+    Conjugate gradient on the explicitly formed normal equations X^T X w = X^T y. Forming the Gram matrix is a single
+    pass over the data, after which every iteration only costs a product with the n x n Gram matrix
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data
+
+        y (nd.array) - training labels
+
+        tol (float) - stops once ||X^T y - X^T X w|| / ||X^T y|| is at most tol
+
+        max_iter (int) - maximum number of iterations, 10 times the number of columns if None
+
+        timer (function) - timer used for the time to tolerance
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+
+        info (dict) - see fit_iterative
+    """
+    start = timer()
+    gram = X.T @ X
+    gram = gram.toarray() if sp.sparse.issparse(gram) else gram
+    b = X.T @ y
+
+    w = np.zeros(X.shape[1])
+    r = b.copy()
+    p = r.copy()
+    gamma = r @ r
+    norm_b = np.sqrt(gamma)
+
+    iterations, time_to_tol = 0, None
+    for iterations in range(1, (max_iter or 10 * X.shape[1]) + 1):
+        if np.sqrt(gamma) <= tol * norm_b:
+            iterations -= 1
+            break
+        q = gram @ p
+        alpha = gamma / (p @ q)
+        w += alpha * p
+        r -= alpha * q
+        gamma_new = r @ r
+        p = r + (gamma_new / gamma) * p
+        gamma = gamma_new
+
+    final_error = np.linalg.norm(b - gram @ w) / norm_b if norm_b else 0.0
+    if final_error <= tol:
+        time_to_tol = timer() - start
+
+    return w, {"iterations": iterations, "time_to_tol": time_to_tol, "final_error": float(final_error)}
+
+
+def minibatch_sgd(X, y: np.ndarray, tol=ITERATIVE_TOL, max_iter=SGD_MAX_EPOCHS, timer=perf_counter,
+                  batch_size=SGD_BATCH_SIZE, learning_rate=None, seed=100) -> tuple[np.ndarray, dict]:
+    """
+    Mini-batch stochastic gradient descent on the mean squared error. The default step of 1 / max ||x_i||^2 is stable
+    for any batch size and is halved whenever an epoch fails to reduce the error. Convergence is checked once per epoch
+    with a full pass over the data
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data
+
+        y (nd.array) - training labels
+
+        tol (float) - stops once ||X^T r|| / ||X^T y|| is at most tol
+
+        max_iter (int) - maximum number of epochs
+
+        timer (function) - timer used for the time to tolerance
+
+        batch_size (int) - number of rows in every mini-batch
+
+        learning_rate (float) - initial step size, see above if None
+
+        seed (int) - seed of the row order of every epoch
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+
+        info (dict) - see fit_iterative, iterations counts mini-batch steps
+    """
+    start = timer()
+    rng = np.random.default_rng(seed)
+    m = X.shape[0]
+    if learning_rate is None:
+        row_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel() if sp.sparse.issparse(X) else np.einsum("ij,ij->i", X, X)
+        learning_rate = 1 / row_norms.max()
+
+    w = np.zeros(X.shape[1])
+    norm_b = np.linalg.norm(X.T @ y)
+    final_error = 1.0
+    iterations, time_to_tol = 0, None
+    for _ in range(max_iter):
+        order = rng.permutation(m)
+        for batch_start in range(0, m, batch_size):
+            idx = np.sort(order[batch_start:batch_start + batch_size])
+            X_b = X[idx]
+            w += learning_rate * (X_b.T @ (y[idx] - X_b @ w)) / len(idx)
+            iterations += 1
+
+        error = np.linalg.norm(_normal_residual(X, y, w)) / norm_b if norm_b else 0.0
+        if error >= final_error:
+            learning_rate /= 2
+        final_error = error
+        if final_error <= tol:
+            time_to_tol = timer() - start
+            break
+
+    return w, {"iterations": iterations, "time_to_tol": time_to_tol, "final_error": float(final_error)}
+
+
+def fit_iterative(regr_name: str, X, y: np.ndarray, tol=ITERATIVE_TOL, max_iter=None, timer=perf_counter) -> tuple[np.ndarray, dict]:
+    """
+    Fits one of the ITERATIVE_SOLVERS. Unlike the direct factorizations these stop at a tolerance, so the number of
+    iterations, the time it took to reach the tolerance and the error they stopped at are returned with the model
+
+    Args:
+
+        regr_name (str) - "numpy-cgls", "numpy-necg" or "numpy-sgd"
+
+        X (nd.array or sparse matrix) - training data
+
+        y (nd.array) - training labels
+
+        tol (float) - tolerance on the relative residual of the normal equations, ||X^T r|| / ||X^T y||
+
+        max_iter (int) - maximum number of iterations (epochs for numpy-sgd), the solver's default if None
+
+        timer (function) - timer used for the time to tolerance, e.g. perf_counter or process_time_ns
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+
+        info (dict) - dictionary with the iterations, the time_to_tol (None if the tolerance was not reached) and
+                      the final_error, the relative residual of the normal equations at the returned model
+    """
+    y = np.asarray(y, dtype=np.float64).ravel()
+    match regr_name:
+        case "numpy-cgls":
+            return cgls(X, y, tol, max_iter, timer)
+
+        case "numpy-necg":
+            return necg(X, y, tol, max_iter, timer)
+
+        case "numpy-sgd":
+            return minibatch_sgd(X, y, tol, max_iter or SGD_MAX_EPOCHS, timer)
+
+        case _:
+            raise ValueError(f"Unknown iterative regressor: {regr_name}")
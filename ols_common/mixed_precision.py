@@ -0,0 +1,99 @@
+from time import perf_counter
+
+import numpy as np
+import scipy as sp
+
+
+MPIR_SOLVER = "torch-mpir"
+MPIR_MAX_ITER = 10
+# a refinement that stops contracting is accepted once its corrections are this small relative to the solution
+MPIR_TOL = 1e-10
+MPIR_CONTRACTION = 0.5
+
+
+def _seminormal_solve(R: np.ndarray, g: np.ndarray) -> np.ndarray:
+    return sp.linalg.solve_triangular(R, sp.linalg.solve_triangular(R, g, trans="T"))
+
+
+def mpir_lstsq(X: np.ndarray, y: np.ndarray, max_iter=MPIR_MAX_ITER, tol=MPIR_TOL, timer=perf_counter) -> tuple[np.ndarray, dict]:
+    """
+    Mixed precision least squares. X is factored as X = QR in float32, keeping only R, and the solution is refined in
+    float64 with the corrected semi-normal equations: x <- x + (R^T R)^-1 X^T (y - X x). The residuals and X^T r are
+    computed in float64, so the refinement reaches float64 accuracy as long as u32 * cond(X)^2 is well below one, at
+    the cost of the float32 QR and two float64 matrix-vector products per iteration. If the corrections stop shrinking
+    before they are below tol, or R is singular, the problem is solved again with a float64 QR with column pivoting
+
+    Args:
+
+        X (np.ndarray) - training data
+
+        y (np.ndarray) - training labels
+
+        max_iter (int) - maximum number of refinement iterations
+
+        tol (float) - relative size of the last correction at which a refinement that stopped contracting is accepted
+
+        timer (function) - clock of time_to_tol
+
+    Returns:
+
+        model (np.ndarray) - the fitted coefficients
+
+        info (dict) - dictionary with the refinement iterations, time_to_tol (None if it fell back to float64), the
+                      final_error (relative size of the last correction) and whether it fell back
+    """
+    # imported here, so that the cost model in ols_common.complexity can read MPIR_MAX_ITER without loading PyTorch
+    import torch
+
+    start = timer()
+    X, y = np.asarray(X, dtype=np.float64), np.asarray(y, dtype=np.float64).ravel()
+    R = torch.linalg.qr(torch.from_numpy(X).float(), mode="r").R.double().numpy()
+
+    x = np.zeros(X.shape[1])
+    previous, final_error, converged = np.inf, np.inf, False
+    iterations = 0
+    if np.all(np.abs(np.diag(R)) > 0):
+        for iterations in range(1, max_iter + 1):
+            dx = _seminormal_solve(R, X.T @ (y - X @ x))
+            x += dx
+            step = np.linalg.norm(dx)
+            final_error = step / np.linalg.norm(x) if np.any(x) else step
+            if not np.isfinite(final_error):
+                break
+            if final_error <= np.finfo(np.float64).eps or step > MPIR_CONTRACTION * previous:
+                converged = final_error <= tol
+                break
+            previous = step
+        else:
+            converged = final_error <= tol
+
+    info = {"iterations": iterations, "time_to_tol": timer() - start if converged else None, "final_error": float(final_error),
+            "fallback": not converged}
+    if not converged:
+        x = np.array(torch.linalg.lstsq(torch.from_numpy(X), torch.from_numpy(y[:, np.newaxis]), driver="gelsy").solution).ravel()
+
+    return x, info
+
+
+def fit_mpir(X, y: np.ndarray, timer=perf_counter) -> tuple[np.ndarray, dict]:
+    """
+    Fits MPIR_SOLVER with the default settings, see mpir_lstsq
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data, densified if sparse
+
+        y (nd.array) - training labels
+
+        timer (function) - clock of time_to_tol
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients, as a column vector like the other regressors
+
+        info (dict) - see mpir_lstsq
+    """
+    X = X.toarray() if sp.sparse.issparse(X) else X
+    model, info = mpir_lstsq(X, y, timer=timer)
+
+    return model[:, np.newaxis], info
@@ -0,0 +1,169 @@
+import hashlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import scipy as sp
+
+
+MAGIC = b"OLSM"
+FORMAT_VERSION = 1
+# magic, version, length of the dtype string, length of the solver name, number of coefficients, fingerprint
+HEADER = struct.Struct("<4sBBHQ16s")
+BLOCK_BYTES = 1 << 21
+
+
+def data_fingerprint(X, y=None) -> str:
+    """
+    Hashes the shape, dtype and contents of the training data, reading it in blocks so that memory maps are never
+    loaded whole
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data
+
+        y (nd.array) - training labels, optional
+
+    Returns:
+
+        fingerprint (str) - 32 hex characters
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for arr in (X, y):
+        if arr is None:
+            continue
+        h.update(f"{arr.shape}{arr.dtype.str}".encode())
+        if sp.sparse.issparse(arr):
+            arr = sp.sparse.csr_matrix(arr)
+            for part in (arr.data, arr.indices, arr.indptr):
+                h.update(np.ascontiguousarray(part).data)
+            continue
+        arr = np.atleast_1d(np.asarray(arr))
+        step = max(1, BLOCK_BYTES // max(1, arr[:1].nbytes))
+        for start in range(0, arr.shape[0], step):
+            h.update(np.ascontiguousarray(arr[start:start + step]).data)
+
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class LinearModel:
+    """
+    Fitted coefficients of one of the OLS implementations, with the solver that produced them and a fingerprint of the
+    data they were fitted on. The binary form is a fixed header followed by the raw coefficients, see to_bytes
+
+    Attributes:
+
+        coef (np.ndarray) - one dimensional array of coefficients, in the dtype the solver returned
+
+        solver (str) - name of the regressor, e.g. "tf-necd"
+
+        fingerprint (str) - data_fingerprint of the training data, empty if unknown
+    """
+
+    coef: np.ndarray
+    solver: str = ""
+    fingerprint: str = ""
+
+    @classmethod
+    def from_fit(cls, model, solver="", fingerprint=""):
+        """
+        Wraps the output of a solver, which may be an nd.array of shape (n,) or (n, 1), a TensorFlow or PyTorch tensor
+        or an MXNet array
+
+        Args:
+
+            model - the fitted coefficients
+
+            solver (str) - name of the regressor
+
+            fingerprint (str) - see data_fingerprint
+
+        Returns:
+
+            LinearModel
+        """
+        if hasattr(model, "asnumpy"):
+            model = model.asnumpy()
+        elif hasattr(model, "numpy"):
+            model = model.numpy()
+        coef = np.ascontiguousarray(np.asarray(model).reshape(-1))
+
+        return cls(coef, solver, fingerprint)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.coef if dtype is None else self.coef.astype(dtype)
+
+    def predict(self, X, block_rows=None, n_threads=1) -> np.ndarray:
+        """
+        Computes X @ coef in blocks of rows sized to stay in cache, so large or memory-mapped inputs are streamed
+        instead of copied. The blocks can be spread over threads, as the products release the GIL
+
+        Args:
+
+            X (nd.array or sparse matrix) - data to predict, with one column per coefficient
+
+            block_rows (int) - rows per block, about BLOCK_BYTES of X per block if None
+
+            n_threads (int) - number of threads computing blocks
+
+        Returns:
+
+            y_pred (np.ndarray) - one dimensional array of predictions
+        """
+        if X.shape[1] != self.coef.shape[0]:
+            raise ValueError(f"X has {X.shape[1]} columns but the model has {self.coef.shape[0]} coefficients")
+
+        m = X.shape[0]
+        block_rows = block_rows or max(1, BLOCK_BYTES // (X.shape[1] * np.dtype(X.dtype).itemsize))
+        y_pred = np.empty(m, dtype=np.result_type(X.dtype, self.coef.dtype))
+
+        def predict_block(start):
+            y_pred[start:start + block_rows] = X[start:start + block_rows] @ self.coef
+
+        starts = range(0, m, block_rows)
+        if n_threads > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(n_threads) as pool:
+                list(pool.map(predict_block, starts))
+        else:
+            for start in starts:
+                predict_block(start)
+
+        return y_pred
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the model as a fixed size header (magic, format version, lengths, number of coefficients and the
+        fingerprint) followed by the dtype string, the solver name and the raw little-endian coefficients
+        """
+        coef = self.coef.astype(self.coef.dtype.newbyteorder("<"), copy=False)
+        dtype, solver = coef.dtype.str.encode(), self.solver.encode()
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, len(dtype), len(solver), coef.shape[0], bytes.fromhex(self.fingerprint or "0" * 32))
+
+        return header + dtype + solver + coef.tobytes()
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes):
+        """
+        Inverse of to_bytes
+        """
+        magic, version, dtype_len, solver_len, n_coef, fingerprint = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not a version {FORMAT_VERSION} model artifact")
+
+        offset = HEADER.size
+        dtype = np.dtype(bytes(buffer[offset:offset + dtype_len]).decode())
+        solver = bytes(buffer[offset + dtype_len:offset + dtype_len + solver_len]).decode()
+        coef = np.frombuffer(buffer, dtype=dtype, count=n_coef, offset=offset + dtype_len + solver_len).copy()
+        fingerprint = "" if not any(fingerprint) else fingerprint.hex()
+
+        return cls(coef, solver, fingerprint)
+
+    def save(self, path: Path):
+        Path(path).write_bytes(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: Path):
+        return cls.from_bytes(Path(path).read_bytes())
@@ -0,0 +1,153 @@
+import cProfile
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter
+
+from yaml import safe_dump
+
+
+SAMPLE_INTERVAL = 0.005
+# cProfile files the builtins and extension functions it traces (BLAS and LAPACK wrappers, ufuncs, framework ops) under
+# this file name
+NATIVE_FILENAME = "~"
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _depth(frame) -> int:
+    depth = 0
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    return depth
+
+
+class SolverProfiler:
+    """
+    Collects profiles of solver calls. Each call wrapped in span(solver) is traced by cProfile and sampled by a thread
+    that records the Python stack of the call every interval seconds, so that the stacks can be drawn as a flamegraph.
+    The time spent inside compiled code is taken from cProfile, see breakdown. When disabled, span returns a null
+    context and nothing is recorded
+
+    Attributes:
+
+        enabled (bool) - whether spans are profiled
+
+        interval (float) - seconds between stack samples
+
+        stats (dict) - dictionary of format {solver: pstats.Stats}, accumulated over the spans of the solver
+
+        stacks (dict) - dictionary of format {solver: Counter of collapsed stacks}
+
+        wall_time (dict) - dictionary of format {solver: seconds spent in its spans}
+    """
+
+    def __init__(self, enabled=False, interval=SAMPLE_INTERVAL):
+        self.enabled = enabled
+        self.interval = interval
+        self.stats = {}
+        self.stacks = {}
+        self.wall_time = {}
+
+    def span(self, name: str):
+        """
+        Context manager profiling the code it wraps under name, a null context if the profiler is disabled
+        """
+        return self._span(name) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _span(self, name: str):
+        ident = threading.get_ident()
+        # frames up to the with statement are left out of the stacks, so every stack starts at the solver call
+        depth = _depth(sys._getframe(2))
+        stacks = self.stacks.setdefault(name, Counter())
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(self.interval):
+                frame, frames = sys._current_frames().get(ident), []
+                if frame is None:
+                    continue
+                while frame is not None:
+                    frames.append(frame)
+                    frame = frame.f_back
+                stacks[";".join([name] + [_label(f.f_code) for f in reversed(frames)][depth:])] += 1
+
+        profile = cProfile.Profile()
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.wall_time[name] = self.wall_time.get(name, 0.0) + perf_counter() - start
+            stop.set()
+            sampler.join()
+            if name in self.stats:
+                self.stats[name].add(profile)
+            else:
+                self.stats[name] = pstats.Stats(profile)
+
+    def breakdown(self, name: str) -> dict:
+        """
+        Splits the time traced by cProfile in the spans of a solver into time spent running Python code and time spent
+        in native calls. The native time is the own time of the C functions cProfile traced, under NATIVE_FILENAME,
+        which covers the compiled code they call in turn, and the rest of the traced time is Python. cProfile only
+        traces builtin functions and methods (including PyTorch and TensorFlow ops) as C functions: operators such as
+        @ and calls of numpy ufuncs or f2py wrappers (np.linalg, scipy.linalg.lapack) stay in the own time of the Python
+        function making them, so the native time is a lower bound
+
+        Args:
+
+            name (str) - name of the solver
+
+        Returns:
+
+            breakdown (dict) - dictionary with the wall_time, profiled_time, python_time and native_time in seconds,
+                               the native_fraction of the profiled time and the number of stack samples. The
+                               native_fraction is None if nothing was traced
+        """
+        stats = self.stats[name]
+        native_time = sum(tt for (filename, _, _), (_, _, tt, _, _) in stats.stats.items() if filename == NATIVE_FILENAME)
+        return {
+            "wall_time": self.wall_time[name],
+            "profiled_time": stats.total_tt,
+            "python_time": stats.total_tt - native_time,
+            "native_time": native_time,
+            "native_fraction": native_time / stats.total_tt if stats.total_tt else None,
+            "samples": sum(self.stacks[name].values()),
+        }
+
+    def write(self, output_dir: Path):
+        """
+        Saves the profiles in output_dir: {solver}.pstats for pstats or snakeviz, {solver}.collapsed with one
+        "frame;frame;... count" line per stack, the format of py-spy's raw output that flamegraph.pl and speedscope
+        read, and summary.yaml with the breakdown of every solver. Nothing is written if no span was profiled
+
+        Args:
+
+            output_dir (Path) - folder the profiles are written to
+
+        Returns:
+
+            None
+        """
+        if not self.stats:
+            return
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(exist_ok=True, parents=True)
+        for name, stats in self.stats.items():
+            stats.dump_stats(output_dir / f"{name}.pstats")
+            with open(output_dir / f"{name}.collapsed", "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self.stacks[name].items())
+
+        with open(output_dir / "summary.yaml", "w") as f:
+            safe_dump({name: self.breakdown(name) for name in self.stats}, f, sort_keys=False)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+
+from ols_common.threads import THREAD_ENV_VARS, available_cores
+
+RESULT_CACHE_DIR = Path(__file__).resolve().parents[1] / ".result_cache"
+RESULT_CACHE_BYTES = 2 << 30
+LIBRARIES = ["numpy", "scipy", "scikit-learn", "torch", "tensorflow", "mxnet"]
+
+
+@lru_cache(maxsize=None)
+def library_versions() -> dict:
+    """
+    Returns the installed version of every solver library, None for those that are not installed. The versions are
+    read from the package metadata, so the libraries are not imported
+    """
+    versions = {}
+    for library in LIBRARIES:
+        try:
+            versions[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            versions[library] = None
+
+    return versions
+
+
+def thread_settings() -> dict:
+    """
+    Returns the thread count variables of the BLAS and OpenMP runtimes and the number of available cores
+    """
+    return {**{name: os.environ.get(name) for name in THREAD_ENV_VARS}, "cpu_count": available_cores()}
+
+
+def cache_key(**fields) -> str:
+    """
+    Hashes the fields describing a cell of an experiment, e.g. the data hash, solver, seed and precision, together with
+    the library versions and thread settings, which are added to every key
+
+    Args:
+
+        fields - JSON serializable values
+
+    Returns:
+
+        key (str) - 40 hex characters
+    """
+    fields = {**fields, "library_versions": library_versions(), "threads": thread_settings()}
+    return hashlib.blake2b(json.dumps(fields, sort_keys=True, default=str).encode(), digest_size=20).hexdigest()
+
+
+def _entry_path(key: str, cache_dir: Path) -> Path:
+    return Path(cache_dir) / key[:2] / f"{key}.pkl"
+
+
+def cache_get(key: str, cache_dir=RESULT_CACHE_DIR):
+    """
+    Returns the value stored under key, or None if there is none. A hit marks the entry as recently used
+
+    Args:
+
+        key (str) - as returned by cache_key
+
+        cache_dir (Path) - folder of the cache, None to disable caching
+
+    Returns:
+
+        value - the stored value or None
+    """
+    if cache_dir is None:
+        return None
+
+    path = _entry_path(key, cache_dir)
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(path)
+
+    return value
+
+
+def cache_put(key: str, value, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_BYTES):
+    """
+    Stores value under key and evicts the least recently used entries until the cache fits in max_bytes. The entry is
+    written to a temporary file and renamed, so concurrent runs never read a partial entry
+
+    Args:
+
+        key (str) - as returned by cache_key
+
+        value - any picklable value
+
+        cache_dir (Path) - folder of the cache, None to disable caching
+
+        max_bytes (int) - size bound of the cache folder
+
+    Returns:
+
+        None
+    """
+    if cache_dir is None:
+        return
+
+    path = _entry_path(key, cache_dir)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir: Path, max_bytes=RESULT_CACHE_BYTES):
+    """
+    Deletes the least recently used entries of the cache until its total size is at most max_bytes
+
+    Args:
+
+        cache_dir (Path) - folder of the cache
+
+        max_bytes (int) - size bound of the cache folder
+
+    Returns:
+
+        None
+    """
+    entries = []
+    for path in Path(cache_dir).glob("*/*.pkl"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
@@ -0,0 +1,189 @@
+import multiprocessing
+import signal
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# a child killed by any other signal is recorded under the name of the signal, e.g. "SIGABRT"
+OUTCOMES = ["ok", "OOM", "timeout", "error"]
+
+
+def _status_bytes(field: str):
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def address_space_size() -> int:
+    """
+    Returns the current virtual memory size of this process in bytes, 0 if it can not be read
+    """
+    return _status_bytes("VmSize") or 0
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process in bytes, 0 if it can not be read
+    """
+    peak = _status_bytes("VmHWM")
+    if peak is None and resource is not None:
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return peak or 0
+
+
+def rss_growth(func, args=(), kwargs=None) -> int:
+    """
+    Calls func(*args, **kwargs) and returns by how many bytes the peak resident set size of this process grew during
+    the call. Unlike tracemalloc this counts the buffers of native code, e.g. LAPACK workspaces and PyTorch or
+    TensorFlow tensors. On Linux the peak is reset before the call, so the growth is measured from the resident size
+    at the call. Elsewhere it is measured from the earlier peak, so it is only meaningful in a fresh process, see
+    run_sandboxed
+
+    Args:
+
+        func (function) - the function to measure
+
+        args (tuple) - positional arguments of func
+
+        kwargs (dict) - keyword arguments of func
+
+    Returns:
+
+        peak_memory (int) - growth of the peak resident set size in bytes
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        baseline = _status_bytes("VmRSS")
+    except OSError:
+        baseline = None
+    baseline = peak_rss() if baseline is None else baseline
+
+    func(*args, **(kwargs or {}))
+    return max(peak_rss() - baseline, 0)
+
+
+def limit_memory(memory_limit: int):
+    """
+    Caps the address space of this process (RLIMIT_AS) at its current size plus memory_limit bytes, so that allocations
+    past the cap raise MemoryError instead of getting the job killed. The cap is relative because a child already maps
+    the interpreter, the imported libraries and its arguments, including the data
+
+    Args:
+
+        memory_limit (int) - bytes the process may allocate on top of what it already has, None to lift the cap
+
+    Returns:
+
+        None
+    """
+    if resource is None:
+        raise OSError("Memory limits need the resource module, which is not available on this platform")
+
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if memory_limit is None:
+        soft = hard
+    else:
+        limit = address_space_size() + memory_limit
+        soft = limit if hard == resource.RLIM_INFINITY else min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _child(conn, func, args, kwargs, memory_limit):
+    try:
+        if memory_limit is not None:
+            limit_memory(memory_limit)
+        conn.send(("ok", func(*args, **kwargs), None))
+    except MemoryError:
+        conn.send(("OOM", None, traceback.format_exc()))
+    except BaseException:
+        conn.send(("error", None, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_sandboxed(func, args=(), kwargs=None, memory_limit=None, timeout=None, start_method="forkserver", isolate=False) -> tuple:
+    """
+    Runs func(*args, **kwargs) in a child process with a memory cap and a wall-clock timeout, so that a solver that
+    runs out of memory or hangs is recorded instead of taking down the whole run. A child killed by SIGKILL (the kernel
+    or a cgroup OOM killer), or by SIGSEGV under a memory limit (native code that does not check for a failed
+    allocation), is recorded as "OOM", and a child killed by any other signal under the name of the signal. Without a
+    memory limit or timeout func is called in this process, with the same outcomes for errors, unless isolate is set
+
+    Args:
+
+        func (function) - the function to run, its return value is sent back to this process so it must be picklable
+
+        args (tuple) - positional arguments of func
+
+        kwargs (dict) - keyword arguments of func
+
+        memory_limit (int) - bytes the child may allocate on top of this process's address space, None for no limit
+
+        timeout (float) - seconds the child may run before it is killed, None for no limit
+
+        start_method (str) - multiprocessing start method. "forkserver" and "spawn" pickle func and its arguments, and
+                             start the child without the thread pools of this process. "fork" shares the data with
+                             the child without copying it, but can deadlock the child once OpenMP, PyTorch or
+                             TensorFlow have started their threads
+
+        isolate (bool) - whether to run func in a child process even without a memory limit or timeout
+
+    Returns:
+
+        status (str) - one of OUTCOMES or the name of the signal that killed the child
+
+        value - return value of func, None unless status is "ok"
+
+        error (str) - traceback or reason of the failure, None if status is "ok"
+    """
+    kwargs = kwargs or {}
+    if memory_limit is None and timeout is None and not isolate:
+        try:
+            return "ok", func(*args, **kwargs), None
+        except MemoryError:
+            return "OOM", None, traceback.format_exc()
+        except Exception:
+            return "error", None, traceback.format_exc()
+
+    ctx = multiprocessing.get_context(start_method)
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child, args=(child_conn, func, args, kwargs, memory_limit))
+    process.start()
+    child_conn.close()
+
+    status, value, error = None, None, None
+    try:
+        if parent_conn.poll(timeout):
+            status, value, error = parent_conn.recv()
+        else:
+            status, error = "timeout", f"exceeded the time limit of {timeout}s"
+    except EOFError:
+        # the child died without sending its outcome
+        pass
+    finally:
+        parent_conn.close()
+        process.join(0 if status == "timeout" else 10)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    if status is None and process.exitcode < 0:
+        name = signal.Signals(-process.exitcode).name
+        out_of_memory = name == "SIGKILL" or (name == "SIGSEGV" and memory_limit is not None)
+        status, error = "OOM" if out_of_memory else name, f"killed by {name}"
+    elif status is None:
+        status, error = "error", f"exited with code {process.exitcode}"
+
+    return status, value, error
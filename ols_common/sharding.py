@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# set by SLURM for every task of an array job (sbatch --array), see shard_from_env
+SHARD_INDEX_VAR = "SLURM_ARRAY_TASK_ID"
+SHARD_COUNT_VAR = "SLURM_ARRAY_TASK_COUNT"
+SHARD_MIN_VAR = "SLURM_ARRAY_TASK_MIN"
+SHARD_STEP_VAR = "SLURM_ARRAY_TASK_STEP"
+
+
+def shard_from_env():
+    """
+    Returns the (index, count) shard of this task of a SLURM array job, None outside of an array job. The task ids are
+    shifted by the first id and divided by the step, so --array=1-24 and --array=0-46:2 both give the indices 0 to 23
+    """
+    if SHARD_INDEX_VAR not in os.environ:
+        return None
+
+    first, step = int(os.environ.get(SHARD_MIN_VAR, 0)), int(os.environ.get(SHARD_STEP_VAR, 1))
+    return (int(os.environ[SHARD_INDEX_VAR]) - first) // step, int(os.environ[SHARD_COUNT_VAR])
+
+
+def shard_name(shard: tuple) -> str:
+    """
+    Returns the file stem of the output of a shard, e.g. shard-0003-of-0024
+    """
+    index, count = shard
+    return f"shard-{index:04d}-of-{count:04d}"
+
+
+def shard_cells(cells: list, shard=None) -> list:
+    """
+    Selects the cells of an experiment grid that belong to a shard. Cell i belongs to shard i % count, so as long as
+    every shard lists the grid in the same order the shards split it without overlap, and each shard gets a share of
+    every solver and problem size rather than the cheap or the expensive end of the grid
+
+    Args:
+
+        cells (list) - the full grid, e.g. a list of (solver, rows, iteration) tuples
+
+        shard (tuple) - (index, count) as returned by shard_from_env, None for every cell
+
+    Returns:
+
+        cells (list) - the cells of the shard, in grid order
+    """
+    if shard is None:
+        return list(cells)
+
+    index, count = shard
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be between 0 and {count - 1}, not: {index}")
+    return [cell for i, cell in enumerate(cells) if i % count == index]
+
+
+def find_shards(shard_dir: Path, suffix: str) -> list:
+    """
+    Lists the shard outputs in shard_dir, in shard order, after checking that they come from one array and that none is
+    missing
+
+    Args:
+
+        shard_dir (Path) - folder the shards wrote to
+
+        suffix (str) - file extension of the outputs, e.g. ".yaml"
+
+    Returns:
+
+        paths (list) - one path per shard
+    """
+    paths = sorted(Path(shard_dir).glob(f"shard-*-of-*{suffix}"))
+    if not paths:
+        raise FileNotFoundError(f"no shard outputs in {shard_dir}")
+
+    counts = {path.stem.rsplit("-", 1)[1] for path in paths}
+    if len(counts) > 1:
+        raise ValueError(f"{shard_dir} holds the shards of arrays of sizes {sorted(counts)}, remove the outputs of the older run")
+
+    count = int(counts.pop())
+    missing = sorted(set(range(count)) - {int(path.stem.split("-")[1]) for path in paths})
+    if missing:
+        raise FileNotFoundError(f"shards {missing} of {count} are missing from {shard_dir}")
+
+    return paths
+
+
+def run_shards(script: Path, n_shards: int, n_parallel=1, cwd=None) -> list:
+    """
+    Runs every shard of a script as a plain subprocess, with the array variables SLURM would set, so that a sharded run
+    and its merge can be checked without a cluster
+
+    Args:
+
+        script (Path) - python script reading its shard with shard_from_env
+
+        n_shards (int) - number of shards
+
+        n_parallel (int) - number of shards running at once
+
+        cwd (Path) - working directory of the shards, the current one if None
+
+    Returns:
+
+        returncodes (list) - exit code of every shard
+    """
+    def run(index):
+        env = {**os.environ, SHARD_INDEX_VAR: str(index), SHARD_COUNT_VAR: str(n_shards), SHARD_MIN_VAR: "0", SHARD_STEP_VAR: "1"}
+        return subprocess.run([sys.executable, str(script)], cwd=cwd, env=env).returncode
+
+    with ThreadPoolExecutor(n_parallel) as pool:
+        return list(pool.map(run, range(n_shards)))
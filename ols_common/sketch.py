@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+import scipy as sp
+
+
+SKETCH_SOLVERS = {"scipy-gauss-lsqr": "gaussian", "scipy-srht-lsqr": "srht", "scipy-cs-lsqr": "countsketch"}
+SKETCH_OVERSAMPLING = 4
+SKETCH_TOL = 1e-12
+# bound on the entries of the embedding, or of a transformed block of rows, that sketch_rows holds at once
+SKETCH_BLOCK_ENTRIES = 1 << 22
+
+
+def sketch_rows(X, n_sketch: int, kind: str, rng: np.random.Generator) -> np.ndarray:
+    """
+    Compresses the rows of X into n_sketch rows with a random embedding S, so that ||SXw|| is close to ||Xw|| for every w.
+    SX is accumulated over blocks of rows, generating the part of S for each block as it goes, so no more than about
+    SKETCH_BLOCK_ENTRIES entries of S or of a transformed block of X are held at once, whatever the number of rows.
+    The SRHT is the block SRHT of Balabanov et al. (2022): each block gets its own random signs and cosine transform,
+    the same rows are sampled from every block, and the sampled rows of each block are summed with random signs
+
+    Args:
+
+        X (nd.array or sparse matrix) - data to sketch
+
+        n_sketch (int) - number of rows of the sketch
+
+        kind (str) - "gaussian" (O(mn n_sketch) flops), "srht" (subsampled randomized cosine transform, O(mn log m))
+                     or "countsketch" (every row is added to one random row of the sketch with a random sign, O(nnz(X)))
+
+        rng (np.random.Generator) - source of the random embedding
+
+    Returns:
+
+        SX (nd.array) - the n_sketch x n sketch
+    """
+    m, n = X.shape
+    SX = np.zeros((n_sketch, n))
+    match kind:
+        case "gaussian":
+            block_rows = max(1, SKETCH_BLOCK_ENTRIES // n_sketch)
+            for start in range(0, m, block_rows):
+                X_block = X[start:start + block_rows]
+                SX += rng.standard_normal((n_sketch, X_block.shape[0])) @ X_block / math.sqrt(n_sketch)
+
+        case "srht":
+            block_rows = min(m, max(n_sketch, SKETCH_BLOCK_ENTRIES // n))
+            sampled = rng.choice(block_rows, n_sketch, replace=False)
+            for start in range(0, m, block_rows):
+                X_block = X[start:start + block_rows]
+                X_block = X_block.toarray() if sp.sparse.issparse(X_block) else X_block
+                # the last block is padded with zero rows, so every block is sampled the same way
+                padded = np.zeros((block_rows, n))
+                padded[:X_block.shape[0]] = rng.choice([-1.0, 1.0], size=X_block.shape[0])[:, np.newaxis] * X_block
+                mixed = sp.fft.dct(padded, axis=0, norm="ortho")[sampled]
+                SX += rng.choice([-1.0, 1.0], size=n_sketch)[:, np.newaxis] * mixed * math.sqrt(block_rows / n_sketch)
+
+        case "countsketch":
+            block_rows = max(1, SKETCH_BLOCK_ENTRIES // n)
+            for start in range(0, m, block_rows):
+                X_block = X[start:start + block_rows]
+                b = X_block.shape[0]
+                S = sp.sparse.csr_matrix((rng.choice([-1.0, 1.0], size=b), (rng.integers(0, n_sketch, size=b), np.arange(b))),
+                                         shape=(n_sketch, b))
+                SX += np.asarray((S @ X_block).toarray() if sp.sparse.issparse(X_block) else S @ X_block)
+
+        case _:
+            raise ValueError(f"Unknown sketch: {kind}")
+
+    return SX
+
+
+def sketch_lsqr(X, y: np.ndarray, kind="srht", oversampling=SKETCH_OVERSAMPLING, tol=SKETCH_TOL, seed=100) -> tuple[np.ndarray, int]:
+    """
+    Sketch-and-precondition least squares (Blendenpik / LSRN). The SVD of a small sketch SX = U S V^T gives the
+    preconditioner N = V S^-1, under which X N is well conditioned, so LSQR on min ||X N z - y|| converges in a number
+    of iterations that depends on the oversampling but not on the conditioning of X. Singular values of the sketch
+    below the LAPACK rank tolerance are dropped, which handles rank deficient data
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data
+
+        y (nd.array) - training labels
+
+        kind (str) - sketch used for the preconditioner, see sketch_rows
+
+        oversampling (float) - the sketch has oversampling times as many rows as X has columns
+
+        tol (float) - atol and btol of LSQR
+
+        seed (int) - seed of the random embedding
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients
+
+        iterations (int) - number of LSQR iterations
+    """
+    m, n = X.shape
+    y = np.asarray(y, dtype=np.float64).ravel()
+    n_sketch = min(m, math.ceil(oversampling * n))
+    SX = sketch_rows(X, n_sketch, kind, np.random.default_rng(seed))
+
+    _, sigma, Vt = np.linalg.svd(SX, full_matrices=False)
+    rank = int(np.sum(sigma > sigma[0] * max(SX.shape) * np.finfo(np.float64).eps)) if sigma.size and sigma[0] else 0
+    if rank == 0:
+        return np.zeros(n), 0
+    N = Vt[:rank].T / sigma[:rank]
+
+    XN = sp.sparse.linalg.LinearOperator((m, rank), matvec=lambda z: X @ (N @ z), rmatvec=lambda u: N.T @ (X.T @ u),
+                                         dtype=np.float64)
+    z, _, iterations = sp.sparse.linalg.lsqr(XN, y, atol=tol, btol=tol, iter_lim=1000)[:3]
+
+    return N @ z, iterations
+
+
+def fit_sketch(regr_name: str, X, y: np.ndarray) -> np.ndarray:
+    """
+    Fits one of the SKETCH_SOLVERS with the default oversampling and tolerance
+
+    Args:
+
+        regr_name (str) - "scipy-gauss-lsqr", "scipy-srht-lsqr" or "scipy-cs-lsqr"
+
+        X (nd.array or sparse matrix) - training data
+
+        y (nd.array) - training labels
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients, as a column vector like the other regressors
+    """
+    return sketch_lsqr(X, y, SKETCH_SOLVERS[regr_name])[0][:, np.newaxis]
+
+
+def sketch_iterations(oversampling=SKETCH_OVERSAMPLING, tol=SKETCH_TOL) -> int:
+    """
+    Expected number of LSQR iterations of sketch_lsqr. With an embedding of oversampling * n rows the preconditioned
+    condition number is about (1 + 1/sqrt(oversampling)) / (1 - 1/sqrt(oversampling)), so the error contracts by a
+    factor of 1/sqrt(oversampling) per iteration
+
+    Args:
+
+        oversampling (float) - see sketch_lsqr
+
+        tol (float) - see sketch_lsqr
+
+    Returns:
+
+        iterations (int)
+    """
+    return math.ceil(2 * math.log(1 / tol) / math.log(oversampling))
@@ -0,0 +1,129 @@
+import os
+import sys
+import warnings
+from pathlib import Path
+
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
+
+# read by the BLAS and OpenMP runtimes when they are loaded, so they also reach libraries imported later and child processes
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS"]
+
+
+def available_cores() -> int:
+    """
+    Returns the number of cores this process may run on, which is less than os.cpu_count() under taskset or a batch
+    scheduler
+    """
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+
+def detect_thread_pools() -> dict:
+    """
+    Lists the thread pools of the libraries loaded in this process: the BLAS and OpenMP runtimes found by threadpoolctl
+    (if installed), the intra-op and inter-op pools of PyTorch and TensorFlow and the CPU workers of MXNet. The OpenMP
+    runtime shipped with PyTorch is reported through PyTorch, as torch.set_num_threads sizes it
+
+    Returns:
+
+        thread_pools (dict) - dictionary with the available cores, the list of pools with their library, api and
+                              num_threads, the total_threads that can be busy at once and the thread environment variables.
+                              A pool of n threads runs on the calling thread and n - 1 workers, and the inter-op pools are
+                              not counted, as every solver is a single operation
+    """
+    pools = []
+    torch = sys.modules.get("torch")
+    torch_dir = str(Path(torch.__file__).parent) if getattr(torch, "__file__", None) else None
+    if threadpoolctl is not None:
+        for info in threadpoolctl.threadpool_info():
+            if torch_dir and info["filepath"].startswith(torch_dir) and info["user_api"] == "openmp":
+                continue
+            pools.append({"library": info["internal_api"], "api": info["user_api"], "num_threads": info["num_threads"], "path": info["filepath"]})
+
+    if hasattr(torch, "get_num_threads"):
+        pools.append({"library": "torch", "api": "intra-op", "num_threads": torch.get_num_threads()})
+        pools.append({"library": "torch", "api": "inter-op", "num_threads": torch.get_num_interop_threads()})
+
+    tf = sys.modules.get("tensorflow")
+    if hasattr(tf, "config"):
+        # 0 lets TensorFlow size the pool, which it does with one thread per core
+        threading = tf.config.threading
+        pools.append({"library": "tensorflow", "api": "intra-op", "num_threads": threading.get_intra_op_parallelism_threads() or available_cores()})
+        pools.append({"library": "tensorflow", "api": "inter-op", "num_threads": threading.get_inter_op_parallelism_threads() or available_cores()})
+
+    if "mxnet" in sys.modules:
+        pools.append({"library": "mxnet", "api": "cpu-worker", "num_threads": int(os.environ.get("MXNET_CPU_WORKER_NTHREADS", 1))})
+
+    return {
+        "available_cores": available_cores(),
+        "pools": pools,
+        "total_threads": 1 + sum(pool["num_threads"] - 1 for pool in pools if pool["api"] != "inter-op" and pool["num_threads"] > 1),
+        "env": {name: os.environ.get(name) for name in THREAD_ENV_VARS},
+    }
+
+
+def pin_thread_pools(n_threads: int):
+    """
+    Sizes every compute pool of the loaded libraries to n_threads and their inter-op pools to one thread, so that each
+    solver runs with the same number of threads whichever library ran before it. The environment variables are set too,
+    for libraries loaded later and child processes. TensorFlow's pools can only be sized before its first operation and
+    PyTorch's inter-op pool before its first parallel work; afterwards they are left as they are, which
+    detect_thread_pools records
+
+    Args:
+
+        n_threads (int) - threads per pool
+
+    Returns:
+
+        None
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(n_threads)
+    if threadpoolctl is not None:
+        threadpoolctl.threadpool_limits(limits=n_threads)
+
+    torch = sys.modules.get("torch")
+    if hasattr(torch, "set_num_threads"):
+        torch.set_num_threads(n_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    tf = sys.modules.get("tensorflow")
+    if hasattr(tf, "config"):
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(n_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            pass
+
+
+def configure_thread_pools(n_threads=None) -> dict:
+    """
+    Pins the thread pools to n_threads (see pin_thread_pools), detects them and warns when their threads outnumber the
+    available cores, as the pools of the different libraries then compete for the cores and the runtime of a solver
+    depends on which solvers ran before it
+
+    Args:
+
+        n_threads (int) - threads per pool, None to leave the pools as the libraries sized them
+
+    Returns:
+
+        thread_pools (dict) - as returned by detect_thread_pools, with the n_threads budget, for the metadata of a run
+    """
+    if n_threads is not None:
+        pin_thread_pools(n_threads)
+
+    thread_pools = {"n_threads": n_threads, **detect_thread_pools()}
+    if thread_pools["total_threads"] > thread_pools["available_cores"]:
+        pools = ", ".join(f"{Path(pool.get('path', pool['library'])).name} {pool['api']}: {pool['num_threads']}" for pool in thread_pools["pools"])
+        warnings.warn(f"{thread_pools['total_threads']} threads in the pools of the loaded libraries ({pools}) exceed the "
+                      f"{thread_pools['available_cores']} available cores, pass n_threads to pin them", RuntimeWarning, stacklevel=2)
+
+    return thread_pools
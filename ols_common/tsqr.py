@@ -0,0 +1,130 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+
+import numpy as np
+import scipy as sp
+
+from ols_common.threads import available_cores, pin_thread_pools
+
+
+TSQR_SOLVER = "parallel-tsqr"
+_POOLS = {}
+_WORKER_DATA = {}
+
+
+def _worker_pool(n_workers: int) -> ProcessPoolExecutor:
+    # the pools are kept for later fits, as starting the workers costs more than a fit of a small problem
+    if not _POOLS:
+        # a multiprocessing child, e.g. a fit run by ols_common.sandbox.run_sandboxed, exits without running atexit,
+        # which would leave the workers of its pools behind. The priority runs it before the queues of the pools close
+        Finalize(None, shutdown_pools, exitpriority=100)
+    if n_workers not in _POOLS:
+        _POOLS[n_workers] = ProcessPoolExecutor(n_workers, mp_context=get_context("spawn"), initializer=pin_thread_pools, initargs=(1,))
+    return _POOLS[n_workers]
+
+
+@atexit.register
+def shutdown_pools():
+    """
+    Stops the worker pools of tsqr_lstsq
+    """
+    for pool in _POOLS.values():
+        pool.shutdown(cancel_futures=True)
+    _POOLS.clear()
+
+
+def _local_r(spec: dict, start: int, stop: int) -> np.ndarray:
+    # a worker stays attached to the block of the current fit and detaches once it sees the block of the next one
+    if spec["name"] not in _WORKER_DATA:
+        for shm in _WORKER_DATA.values():
+            shm.close()
+        _WORKER_DATA.clear()
+        _WORKER_DATA[spec["name"]] = SharedMemory(name=spec["name"])
+
+    augmented = np.ndarray(spec["shape"], dtype=np.float64, buffer=_WORKER_DATA[spec["name"]].buf)
+    return np.linalg.qr(augmented[start:stop], mode="r")
+
+
+def combine_r(R_top: np.ndarray, R_bottom: np.ndarray) -> np.ndarray:
+    """
+    R factor of the rows of two blocks, from the R factors of the blocks
+    """
+    return np.linalg.qr(np.vstack((R_top, R_bottom)), mode="r")
+
+
+def reduce_r(factors: list) -> np.ndarray:
+    """
+    Combines the R factors of consecutive row blocks pairwise, level by level, into the R factor of all rows. The tree
+    has ceil(log2(p)) levels for p blocks, and every level halves the number of factors
+    """
+    while len(factors) > 1:
+        factors = [combine_r(*factors[i:i + 2]) if i + 1 < len(factors) else factors[i] for i in range(0, len(factors), 2)]
+    return factors[0]
+
+
+def tsqr_lstsq(X: np.ndarray, y: np.ndarray, n_workers=None, use_pool=False) -> np.ndarray:
+    """
+    Tall-skinny QR least squares across processes. [X y] is copied once into shared memory, each of n_workers processes
+    computes the R factor of a contiguous block of rows, and the factors are combined in a binary reduction tree (see
+    reduce_r). The coefficients follow from the R factor of [X y] as R[:n, :n] w = R[:n, n]. The workers use one BLAS
+    thread each, so the parallelism comes from the row blocks only
+
+    Args:
+
+        X (np.ndarray) - training data
+
+        y (np.ndarray) - training labels
+
+        n_workers (int) - number of worker processes, the available cores if None. Problems with fewer than n_workers
+                          blocks of n + 1 rows use fewer workers, down to a single QR in this process
+
+        use_pool (bool) - whether to run a single block in a pool worker as well, rather than in this process with its
+                          multi-threaded BLAS, so that timings at one worker measure the same algorithm as at several
+
+    Returns:
+
+        model (np.ndarray) - the fitted coefficients
+    """
+    m, n = X.shape
+    n_workers = n_workers or available_cores()
+    n_blocks = max(1, min(n_workers, m // (n + 1)))
+
+    if n_blocks == 1 and not use_pool:
+        R = np.linalg.qr(np.column_stack((X, y)), mode="r")
+    else:
+        shm = SharedMemory(create=True, size=m * (n + 1) * np.dtype(np.float64).itemsize)
+        augmented = np.ndarray((m, n + 1), dtype=np.float64, buffer=shm.buf)
+        try:
+            augmented[:, :n], augmented[:, n] = X, np.ravel(y)
+            spec = {"name": shm.name, "shape": (m, n + 1)}
+            bounds = np.linspace(0, m, n_blocks + 1).astype(int)
+            R = reduce_r(list(_worker_pool(n_workers).map(_local_r, [spec] * n_blocks, bounds[:-1], bounds[1:])))
+        finally:
+            del augmented
+            shm.close()
+            shm.unlink()
+
+    return sp.linalg.solve_triangular(R[:n, :n], R[:n, n])
+
+
+def fit_tsqr(X, y: np.ndarray, n_workers=None) -> np.ndarray:
+    """
+    Fits TSQR_SOLVER, see tsqr_lstsq
+
+    Args:
+
+        X (nd.array or sparse matrix) - training data, densified if sparse
+
+        y (nd.array) - training labels
+
+        n_workers (int) - number of worker processes, the available cores if None
+
+    Returns:
+
+        model (nd.array) - the fitted coefficients, as a column vector like the other regressors
+    """
+    X = X.toarray() if sp.sparse.issparse(X) else X
+    return tsqr_lstsq(X, y, n_workers)[:, np.newaxis]